@@ -0,0 +1,22 @@
+
+from alembic import op
+import sqlalchemy as sa
+revision = '0002_prices'
+down_revision = '0001_init'
+branch_labels = None
+depends_on = None
+def upgrade():
+    op.create_table('prices',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('ticker', sa.String(length=32), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('close', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.UniqueConstraint('ticker', 'date', name='uq_prices_ticker_date')
+    )
+    op.create_index('ix_prices_ticker', 'prices', ['ticker'])
+    op.create_index('ix_prices_date', 'prices', ['date'])
+def downgrade():
+    op.drop_index('ix_prices_date', table_name='prices')
+    op.drop_index('ix_prices_ticker', table_name='prices')
+    op.drop_table('prices')
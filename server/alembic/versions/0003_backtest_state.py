@@ -0,0 +1,39 @@
+
+from alembic import op
+import sqlalchemy as sa
+revision = '0003_backtest_state'
+down_revision = '0002_prices'
+branch_labels = None
+depends_on = None
+def upgrade():
+    op.create_table('backtest_states',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('hold_days', sa.Integer(), nullable=True),
+        sa.Column('benchmark', sa.String(length=32), nullable=True),
+        sa.Column('last_trade_id', sa.Integer(), nullable=True),
+        sa.Column('last_price_date', sa.Date(), nullable=True),
+        sa.Column('price_revision', sa.Integer(), nullable=True),
+        sa.Column('partials', sa.JSON(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'))
+    )
+    op.create_index('ix_backtest_states_key', 'backtest_states', ['key'], unique=True)
+    op.create_table('backtest_trade_returns',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('state_id', sa.Integer(), sa.ForeignKey('backtest_states.id'), nullable=False),
+        sa.Column('trade_id', sa.Integer(), sa.ForeignKey('trades.id'), nullable=False),
+        sa.Column('ticker', sa.String(length=32), nullable=True),
+        sa.Column('sector', sa.String(length=32), nullable=True),
+        sa.Column('side', sa.Float(), nullable=True),
+        sa.Column('trade_date', sa.Date(), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=True),
+        sa.Column('r', sa.Float(), nullable=True),
+        sa.Column('b', sa.Float(), nullable=True),
+        sa.UniqueConstraint('state_id', 'trade_id', name='uq_bt_returns_state_trade')
+    )
+    op.create_index('ix_backtest_trade_returns_state_id', 'backtest_trade_returns', ['state_id'])
+    op.create_index('ix_backtest_trade_returns_trade_id', 'backtest_trade_returns', ['trade_id'])
+    op.create_index('ix_backtest_trade_returns_status', 'backtest_trade_returns', ['status'])
+def downgrade():
+    op.drop_table('backtest_trade_returns')
+    op.drop_table('backtest_states')
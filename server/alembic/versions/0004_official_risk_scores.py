@@ -0,0 +1,26 @@
+
+from alembic import op
+import sqlalchemy as sa
+revision = '0004_official_risk_scores'
+down_revision = '0003_backtest_state'
+branch_labels = None
+depends_on = None
+COMPONENTS = ['score', 'freq', 'overlap', 'alpha_proxy', 'recency', 'sector']
+def upgrade():
+    op.create_table('official_risk_scores',
+        sa.Column('official_id', sa.Integer(), sa.ForeignKey('officials.id'), primary_key=True),
+        sa.Column('score', sa.Float(), nullable=True),
+        sa.Column('freq', sa.Integer(), nullable=True),
+        sa.Column('overlap', sa.Integer(), nullable=True),
+        sa.Column('alpha_proxy', sa.Float(), nullable=True),
+        sa.Column('recency', sa.Integer(), nullable=True),
+        sa.Column('sector', sa.String(length=32), nullable=True),
+        sa.Column('as_of', sa.Date(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'))
+    )
+    for c in COMPONENTS:
+        op.create_index(f'ix_official_risk_scores_{c}', 'official_risk_scores', [c])
+def downgrade():
+    for c in COMPONENTS:
+        op.drop_index(f'ix_official_risk_scores_{c}', table_name='official_risk_scores')
+    op.drop_table('official_risk_scores')
@@ -0,0 +1,18 @@
+
+from alembic import op
+import sqlalchemy as sa
+revision = '0005_issuer_sectors'
+down_revision = '0004_official_risk_scores'
+branch_labels = None
+depends_on = None
+def upgrade():
+    op.create_table('issuer_sectors',
+        sa.Column('issuer', sa.String(length=255), primary_key=True),
+        sa.Column('sector', sa.String(length=32), nullable=True),
+        sa.Column('sectors', sa.String(length=255), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'))
+    )
+    op.create_index('ix_issuer_sectors_sector', 'issuer_sectors', ['sector'])
+def downgrade():
+    op.drop_index('ix_issuer_sectors_sector', table_name='issuer_sectors')
+    op.drop_table('issuer_sectors')
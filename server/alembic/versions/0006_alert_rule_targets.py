@@ -0,0 +1,13 @@
+
+from alembic import op
+import sqlalchemy as sa
+revision = '0006_alert_rule_targets'
+down_revision = '0005_issuer_sectors'
+branch_labels = None
+depends_on = None
+def upgrade():
+    op.add_column('alert_rules', sa.Column('tickers', sa.Text(), nullable=True, server_default=''))
+    op.add_column('alert_rules', sa.Column('officials', sa.Text(), nullable=True, server_default=''))
+def downgrade():
+    op.drop_column('alert_rules', 'officials')
+    op.drop_column('alert_rules', 'tickers')
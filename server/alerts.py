@@ -1,11 +1,15 @@
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set, Tuple, FrozenSet
+import asyncio
+from collections import defaultdict
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 from .models import AlertRule
-from .backtest import backtest_equal_weight
-from .email_service import send_email
-import httpx
+from .backtest import backtest_from_db
+from .backtest_state import standard_result
+from .linking import infer_sector_from_issuer
+from .ingest import add_trade_listener
+from .delivery import deliver, run_sync
 
 def list_rules(db: Session, email: str) -> List[AlertRule]:
     return db.execute(select(AlertRule).where(AlertRule.email==email, AlertRule.active==True)).scalars().all()
@@ -20,25 +24,114 @@ def delete_rule(db: Session, rule_id: int, email: str) -> bool:
     if not r or r.email != email: return False
     db.delete(r); db.commit(); return True
 
+def _split(txt: Optional[str], upper: bool = False) -> FrozenSet[str]:
+    items = [x.strip() for x in (txt or "").split(",") if x.strip()]
+    return frozenset(x.upper() if upper else x.lower() for x in items)
+
+class RuleIndex:
+    """Active rules keyed by the most selective target they name (official > ticker > sector).
+
+    A rule matches a trade when every non-empty target list (officials, tickers, sectors) contains
+    the trade's value; rules without targets match every trade. Lookups only verify the rules
+    found under the trade's official, ticker and sector keys plus the untargeted ones.
+    """
+    def __init__(self, rules: List[AlertRule]):
+        self.rules: Dict[int, AlertRule] = {}
+        self.targets: Dict[int, Tuple[FrozenSet[str], FrozenSet[str], FrozenSet[str]]] = {}
+        self.by_official: Dict[str, Set[int]] = defaultdict(set)
+        self.by_ticker: Dict[str, Set[int]] = defaultdict(set)
+        self.by_sector: Dict[str, Set[int]] = defaultdict(set)
+        self.untargeted: Set[int] = set()
+        for r in rules:
+            offs, ticks, secs = _split(r.officials), _split(r.tickers, upper=True), _split(r.sectors)
+            self.rules[r.id] = r; self.targets[r.id] = (offs, ticks, secs)
+            key, idx = ((offs, self.by_official) if offs else (ticks, self.by_ticker) if ticks else (secs, self.by_sector) if secs else (None, None))
+            if idx is None:
+                self.untargeted.add(r.id)
+            else:
+                for k in key: idx[k].add(r.id)
+
+    def match(self, trade: Dict[str, Any]) -> Set[int]:
+        off, tick = str(trade.get("official_id") or ""), (trade.get("ticker") or "").upper()
+        sec = trade.get("sector") or infer_sector_from_issuer(trade.get("issuer") or "") or "unknown"
+        out = set()
+        for rid in self.by_official.get(off, set()) | self.by_ticker.get(tick, set()) | self.by_sector.get(sec, set()) | self.untargeted:
+            offs, ticks, secs = self.targets[rid]
+            if (not offs or off in offs) and (not ticks or tick in ticks) and (not secs or sec in secs):
+                out.add(rid)
+        return out
+
+def build_rule_index(db: Session) -> RuleIndex:
+    return RuleIndex(db.execute(select(AlertRule).where(AlertRule.active==True)).scalars().all())
+
+def _backtest_for(db: Session, window: int, sectors: FrozenSet[str]) -> Dict[str, Any]:
+    if not sectors:
+        cached = standard_result(db, window, "SPY")
+        if cached is not None: return cached
+    return backtest_from_db(db, hold_days=window, sectors=sorted(sectors) or None)
+
+def evaluate_rules(db: Session, rules: List[AlertRule], trades: Optional[Dict[int, List[Dict[str, Any]]]] = None) -> List[Dict[str, Any]]:
+    """Notifications for the rules whose thresholds pass. Rules are grouped by (window, sector set)
+    so each distinct backtest runs once. `trades` maps rule id -> the new trades that triggered it."""
+    groups: Dict[Tuple[int, FrozenSet[str]], List[AlertRule]] = defaultdict(list)
+    for r in rules:
+        groups[(int(r.window_days or 30), _split(r.sectors))].append(r)
+    out = []
+    for (window, sectors), members in groups.items():
+        try:
+            res = _backtest_for(db, window, sectors)
+        except Exception as e:
+            print("alert backtest error", window, sorted(sectors), e); continue
+        alpha = res.get("summary",{}).get("alpha", 0)
+        sharpe = res.get("summary",{}).get("sharpe", 0)
+        for r in members:
+            if r.min_alpha is not None and alpha < float(r.min_alpha): continue
+            if r.min_sharpe is not None and sharpe < float(r.min_sharpe): continue
+            text = f"Alert '{r.name}': alpha={alpha:.2%}, sharpe={sharpe:.2f} window={r.window_days}"
+            new = (trades or {}).get(r.id) or []
+            if new:
+                text += f"\n{len(new)} new trade(s): " + ", ".join(f"{t['ticker'] or t['issuer']} {t['transaction_type']}" for t in new[:10])
+            out.append({"rule_id": r.id, "email": r.email, "name": r.name, "delivery": r.delivery.name,
+                        "webhook_url": r.webhook_url, "text": text})
+    return out
+
+async def notify_all(hits: List[Dict[str, Any]]) -> Dict[str, int]:
+    return await deliver(hits)
+
+_pending: Set["asyncio.Task"] = set()  # keeps in-loop deliveries referenced until they finish
+
+def _delivered(task: "asyncio.Task"):
+    _pending.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print("alert delivery error", task.exception())
+
+def _dispatch(hits: List[Dict[str, Any]]):
+    # called from sync code that may run inside the scheduler's event loop
+    if not hits: return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        run_sync(lambda: notify_all(hits))
+    else:
+        task = loop.create_task(notify_all(hits))
+        _pending.add(task)
+        task.add_done_callback(_delivered)
+
+def on_new_trades(db: Session, trades: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Ingest listener: evaluate only the rules the new trades can affect."""
+    index = build_rule_index(db)
+    if not index.rules: return []
+    hit: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    for t in trades:
+        for rid in index.match(t):
+            hit[rid].append(t)
+    hits = evaluate_rules(db, [index.rules[rid] for rid in sorted(hit)], hit)
+    _dispatch(hits)
+    return hits
+
+add_trade_listener(on_new_trades)
+
 async def evaluate_all_rules(db: Session):
-    # naive evaluation: run small backtest and notify if alpha exceeds min_alpha
     rules = db.execute(select(AlertRule).where(AlertRule.active==True)).scalars().all()
     if not rules: return
-    # Use dummy trades via backtest function for now
-    res = backtest_equal_weight([], hold_days=30)
-    alpha = res.get("summary",{}).get("alpha", 0)
-    sharpe = res.get("summary",{}).get("sharpe", 0)
-    for r in rules:
-        should = True
-        if r.min_alpha is not None and alpha < float(r.min_alpha): should = False
-        if r.min_sharpe is not None and sharpe < float(r.min_sharpe): should = False
-        if not should: continue
-        text = f"Alert '{r.name}': alpha={alpha:.2%}, sharpe={sharpe:.2f} window={r.window_days}"
-        if r.delivery.name == "email":
-            await send_email(r.email, f"OTP Alert: {r.name}", text)
-        elif r.delivery.name == "webhook" and r.webhook_url:
-            try:
-                async with httpx.AsyncClient(timeout=5.0) as http:
-                    await http.post(r.webhook_url, json={"text": text})
-            except Exception:
-                pass
+    await notify_all(evaluate_rules(db, rules))
@@ -2,15 +2,17 @@
 import os, json, io, csv, time
 from datetime import date
 from typing import Optional
-from fastapi import FastAPI, HTTPException, Request, Query, Depends, Header
+from fastapi import FastAPI, HTTPException, Request, Query, Depends, Header, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, PlainTextResponse, Response, JSONResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.gzip import GZipMiddleware
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 from sqlalchemy import select, and_, func, desc
 from sqlalchemy.orm import Session
-from prometheus_client import Counter, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import Counter, Histogram, CollectorRegistry
+from prometheus_client.exposition import choose_encoder
 from rq import Queue
 from rq.job import Job
 
@@ -18,27 +20,35 @@ from .db import engine, SessionLocal
 from .models import Base, Official, Trade, Brief, Chamber, TxType
 from .ai import make_brief
 from .billing import create_checkout_session, require_active_subscription
-from .scheduler import start_scheduler
-from .backtest import backtest_equal_weight
+from .scheduler import start_scheduler, price_benchmarks
+from .prices import refresh_prices
+from .backtest import backtest_from_db
+from .backtest_state import standard_result, update_standard_backtests
+from .event_study import event_study_from_db
 from .config import env
 from .security import current_user_email
 from .limits import enforce_rate_limit
 from .pdf_viewer import _download_to_cache, extract_entities, render_page_with_highlights
 from .slack_integration import install_url, oauth_exchange, verify_slack_signature, handle_slash
 from .jobs import list_jobs, job_info
-from .tasks import enqueue_backtest, get_queue
+from .job_events import stream as job_event_stream, SLOTS as JOB_STREAM_SLOTS
+from .tasks import enqueue_backtest, enqueue_event_study, enqueue_backtest_update, get_queue, all_queues
 from .middleware import NoGzipFlagMiddleware
-from .auth import require_api_token
+from .auth import require_api_token, profile_flag
 from .connectors import fetch_us_senate, fetch_us_house, fetch_uk_register, dedupe
 from .ingest import persist_records
 from .alerts import list_rules, create_rule, delete_rule
 from .metrics_extra import init as init_metrics_extra
-from .push import get_vapid_public, set_vapid_keys, add_subscription, send_test_to_all
+from .delivery import close_http_client
+from .push import get_vapid_public, set_vapid_keys, add_subscription, send_test_to_all, send_to_user
 from .data_quality import quality_report
-from .risk import top_officials
+from .risk import list_risk_scores, score_history, history_items
 from .webhooks import list_dlq, requeue_dlq
 from .fts_sqlite import init_sqlite_fts
-from .redis_client import get_redis
+from .redis_client import redis_health
+from .instrumentation import (start_request_queries, finish_request_queries, route_label, request_id, slow_request_seconds,
+                              exemplars_enabled, env_buckets, HTTP_BUCKETS)
+from . import profiling
 
 Base.metadata.create_all(bind=engine)
 app = FastAPI(title="Official Trades Pro")
@@ -51,24 +61,35 @@ app.add_middleware(GZipMiddleware, minimum_size=500)
 # Prometheus metrics
 REGISTRY = CollectorRegistry(auto_describe=True)
 REQ_COUNT = Counter("otp_http_requests_total", "HTTP requests total", ["method", "path", "status"], registry=REGISTRY)
-REQ_LATENCY = Histogram("otp_http_request_seconds", "HTTP request latency (s)", ["method", "path"], registry=REGISTRY)
+REQ_LATENCY = Histogram("otp_http_request_seconds", "HTTP request latency (s)", ["method", "path"],
+                        buckets=env_buckets("HTTP_LATENCY_BUCKETS", HTTP_BUCKETS), registry=REGISTRY)
 
 @app.middleware("http")
 async def metrics_and_rate_limit(request: Request, call_next):
-    await enforce_rate_limit(request)
     method = request.method
-    path = getattr(request.scope.get('route'), 'path', request.url.path)
+    rid = request.state.request_id = request_id(request.headers.get("x-request-id"))
     start = time.perf_counter()
     status = 500
+    queries = start_request_queries()
     try:
+        limited = await enforce_rate_limit(request)
+        if limited is not None:
+            status = 429
+            limited.headers["X-Request-ID"] = rid
+            return limited
         response = await call_next(request)
         status = response.status_code
+        response.headers["X-Request-ID"] = rid
         return response
     finally:
         dur = time.perf_counter() - start
         try:
+            path = route_label(request.scope)  # after routing: the matched template, never the raw URL
+            slow = dur >= slow_request_seconds()
             REQ_COUNT.labels(method=method, path=path, status=str(status)).inc()
-            REQ_LATENCY.labels(method=method, path=path).observe(dur)
+            REQ_LATENCY.labels(method=method, path=path).observe(dur, exemplar={"request_id": rid} if slow and exemplars_enabled() else None)
+            finish_request_queries(queries, method, path)
+            if slow: print(f"slow request {rid}: {method} {request.url.path} -> {status} in {dur:.3f}s")
         except Exception:
             pass
 
@@ -85,17 +106,20 @@ async def on_startup():
         except Exception:
             pass
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    await close_http_client()
+
 @app.get("/healthz")
 def healthz():
     ok = True
     details = {}
-    try:
-        r = get_redis()
-        r.ping()
+    r_ok, err = redis_health().check()
+    if r_ok:
         details["redis"] = "ok"
-    except Exception as e:
+    else:
         ok = False
-        details["redis"] = f"error: {e}"
+        details["redis"] = f"error: {err}"
     try:
         with SessionLocal() as db:
             db.execute(select(func.now()))
@@ -106,9 +130,10 @@ def healthz():
     return {"ok": ok, "components": details}
 
 @app.get("/metrics")
-def metrics():
-    data = generate_latest(REGISTRY)
-    return Response(content=data, media_type=CONTENT_TYPE_LATEST)
+def metrics(request: Request):
+    # OpenMetrics (which carries the latency exemplars) when the scraper asks for it
+    encoder, content_type = choose_encoder(request.headers.get("accept"))
+    return Response(content=encoder(REGISTRY), media_type=content_type)
 
 @app.get("/", response_class=HTMLResponse)
 def index():
@@ -225,6 +250,14 @@ def generate_brief_latest(email: Optional[str] = Depends(current_user_email), db
     return {"ok": True, "brief_id": brief.id, "content_md": brief.content_md, "citations": brief.citations, "trade_id": latest.id}
 
 # --- BACKTEST (sync) ---
+def _backtest(db: Session, hold_days: int, benchmark: str, **filters) -> dict:
+    # Unfiltered runs are served from the incrementally maintained standard state when it is current.
+    if not any(filters.values()):
+        cached = standard_result(db, hold_days, benchmark)
+        if cached is not None:
+            return cached
+    return backtest_from_db(db, hold_days=hold_days, benchmark=benchmark, **filters)
+
 @app.get("/api/backtest")
 def api_backtest(
     hold_days: int = Query(30, ge=5, le=365),
@@ -238,16 +271,71 @@ def api_backtest(
     db: Session = Depends(db_session),
 ):
     require_active_subscription(db, email)
-    rows = db.execute(select(Trade, Official).join(Official, Trade.official_id == Official.id, isouter=True)).all()
-    trades = [{"ticker": t.ticker, "transaction_type": t.transaction_type.value, "trade_date": t.trade_date, "chamber": off.chamber.value if off else None} for t, off in rows]
     sectors_list = [s.strip() for s in sectors.split(",")] if sectors else None
-    res = backtest_equal_weight(trades, hold_days=hold_days, benchmark=benchmark, chamber=chamber, tx_filter=transaction_type, start_date=start_date, end_date=end_date, sectors=sectors_list)
+    try:
+        res = _backtest(db, hold_days, benchmark, chamber=chamber, tx_filter=transaction_type, start_date=start_date, end_date=end_date, sectors=sectors_list)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid chamber or transaction_type")
     return {"ok": True, **res}
 
 # --- BACKTEST (async job) ---
 @app.post("/api/backtest/jobs")
-def api_backtest_enqueue(hold_days: int = Query(30, ge=5, le=365), benchmark: str = "SPY"):
-    job = enqueue_backtest(hold_days=hold_days, benchmark=benchmark, response_url=None)
+def api_backtest_enqueue(hold_days: int = Query(30, ge=5, le=365), benchmark: str = "SPY", profile: bool = Depends(profile_flag)):
+    job = enqueue_backtest(hold_days=hold_days, benchmark=benchmark, response_url=None, profile=profile)
+    return {"ok": True, **job}
+
+@app.post("/api/admin/backtest/refresh")
+def admin_backtest_refresh(full: int = Query(0), background: int = Query(1), profile: int = Query(0), ok: bool = Depends(require_api_token)):
+    if background:
+        return {"ok": True, **enqueue_backtest_update(full=bool(full), profile=bool(profile))}
+    with SessionLocal() as db:
+        return {"ok": True, "states": update_standard_backtests(db, full=bool(full))}
+
+@app.post("/api/admin/prices/refresh")
+def admin_prices_refresh(ok: bool = Depends(require_api_token)):
+    with SessionLocal() as db:
+        return {"ok": True, **refresh_prices(db, price_benchmarks())}
+
+# --- EVENT STUDY (CAR curves) ---
+def _event_study(db: Session, anchor: str, pre: int, post: int, benchmark: str, group_by: str, limit: int,
+                 chamber: Optional[str] = None, transaction_type: Optional[str] = None,
+                 start_date: Optional[date] = None, end_date: Optional[date] = None, sectors: Optional[str] = None) -> dict:
+    groups = [g.strip() for g in group_by.split(",") if g.strip()]
+    sectors_list = [s.strip() for s in sectors.split(",")] if sectors else None
+    try:
+        return event_study_from_db(db, anchor=anchor, pre=pre, post=post, benchmark=benchmark, group_by=groups, limit=limit,
+                                   chamber=chamber, tx_filter=transaction_type, start_date=start_date, end_date=end_date, sectors=sectors_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/event-study")
+def api_event_study(
+    anchor: str = Query("trade_date"),
+    pre: int = Query(-5, ge=-60, le=0),
+    post: int = Query(30, ge=0, le=250),
+    benchmark: str = Query("SPY"),
+    group_by: str = Query("official,ticker,chamber"),
+    limit: int = Query(50, ge=1, le=1000),
+    chamber: Optional[str] = None,
+    transaction_type: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    sectors: Optional[str] = None,
+    email: Optional[str] = Depends(current_user_email),
+    db: Session = Depends(db_session),
+):
+    require_active_subscription(db, email)
+    res = _event_study(db, anchor, pre, post, benchmark, group_by, limit, chamber, transaction_type, start_date, end_date, sectors)
+    return {"ok": True, **res}
+
+@app.post("/api/event-study/jobs")
+def api_event_study_enqueue(windows: str = Query("trade_date:-5:30,reported_date:-5:30"), benchmark: str = "SPY",
+                            profile: bool = Depends(profile_flag)):
+    try:
+        specs = [(a, int(p), int(q)) for a, p, q in (w.split(":") for w in windows.split(",") if w)]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="windows must be anchor:pre:post[,...]")
+    job = enqueue_event_study(windows=specs, benchmark=benchmark, profile=profile)
     return {"ok": True, **job}
 
 # --- Slack install & events ---
@@ -263,16 +351,15 @@ async def slack_oauth_callback(code: str):
     return HTMLResponse("<h3>Slack installed. You can close this window.</h3>")
 
 @app.post("/integrations/slack/events")
-async def slack_events(request: Request, x_slack_request_timestamp: str = Header(None), x_slack_signature: str = Header(None)):
+async def slack_events(request: Request, background: BackgroundTasks, x_slack_request_timestamp: str = Header(None), x_slack_signature: str = Header(None)):
     body = await request.body()
     if not verify_slack_signature(x_slack_request_timestamp or "", body, x_slack_signature or ""):
         raise HTTPException(status_code=403, detail="invalid signature")
-    # Slash command form
+    # Slash command form: ack now (Slack's 3s deadline), answer via response_url after the response is sent
     try:
         form = await request.form()
         if "command" in form:
-            with SessionLocal() as db:
-                await handle_slash(db, dict(form))
+            background.add_task(handle_slash, dict(form))
             return PlainTextResponse("")
     except Exception:
         pass
@@ -286,8 +373,26 @@ async def slack_events(request: Request, x_slack_request_timestamp: str = Header
 
 # --- Jobs endpoints ---
 @app.get("/api/jobs")
-def api_list_jobs(limit: int = 25):
-    return {"ok": True, "items": list_jobs(limit=limit)}
+def api_list_jobs(limit: int = Query(25, ge=1, le=200), offset: int = Query(0, ge=0), status: Optional[str] = None, func: Optional[str] = None):
+    try:
+        return {"ok": True, **list_jobs(limit=limit, offset=offset, status=status, func=func)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/jobs/events")
+async def api_job_events(ids: str = Query(..., description="comma-separated job ids")):
+    """Server-Sent Events: current status/progress of each job, then every change until all are done."""
+    job_ids = [x.strip() for x in ids.split(",") if x.strip()][:50]
+    if not job_ids:
+        raise HTTPException(status_code=400, detail="ids required")
+    release = JOB_STREAM_SLOTS.reserve()
+    if release is None:
+        raise HTTPException(status_code=503, detail="too many open job streams", headers={"Retry-After": "30"})
+    q = get_queue()
+    # released when the stream ends, or by the background task if the body never started
+    return StreamingResponse(job_event_stream(job_ids, q.connection if q is not None else None, release=release),
+                             media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(release))
 
 @app.get("/api/jobs/{job_id}")
 def api_job_detail(job_id: str):
@@ -326,9 +431,7 @@ def export_trades_csv(db: Session = Depends(db_session)):
 
 @app.get("/api/export/backtest.csv")
 def export_backtest_csv(hold_days: int = Query(30, ge=5, le=365), benchmark: str = "SPY", db: Session = Depends(db_session)):
-    rows = db.execute(select(Trade, Official).join(Official, Trade.official_id == Official.id, isouter=True)).all()
-    trades = [{"ticker": t.ticker, "transaction_type": t.transaction_type.value, "trade_date": t.trade_date, "chamber": off.chamber.value if off else None} for t, off in rows]
-    res = backtest_equal_weight(trades, hold_days=hold_days, benchmark=benchmark)
+    res = _backtest(db, hold_days, benchmark)
     buf = io.StringIO()
     w = csv.writer(buf)
     w.writerow(["section","col1","col2","col3","col4"])
@@ -347,6 +450,23 @@ def export_backtest_csv(hold_days: int = Query(30, ge=5, le=365), benchmark: str
     headers = {"Content-Disposition": "attachment; filename=backtest.csv"}
     return Response(content=data, media_type="text/csv", headers=headers)
 
+@app.get("/api/export/event_study.csv")
+def export_event_study_csv(anchor: str = Query("trade_date"), pre: int = Query(-5, ge=-60, le=0), post: int = Query(30, ge=0, le=250),
+                           benchmark: str = "SPY", group_by: str = "official,ticker,chamber", limit: int = Query(1000, ge=1, le=100000),
+                           db: Session = Depends(db_session)):
+    res = _event_study(db, anchor, pre, post, benchmark, group_by, limit)
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["group","key","name","n"] + [f"car_{o}" for o in res["offsets"]])
+    if res["trades"]:
+        w.writerow(["all","","",res["trades"]] + res["car"])
+    for g, items in res["groups"].items():
+        for it in items:
+            w.writerow([g, it["key"], it.get("name") or "", it["n"]] + it["car"])
+    data = buf.getvalue()
+    headers = {"Content-Disposition": "attachment; filename=event_study.csv"}
+    return Response(content=data, media_type="text/csv", headers=headers)
+
 # --- JSON/JSONL EXPORTS ---
 @app.get("/api/export/trades.jsonl")
 def export_trades_jsonl(db: Session = Depends(db_session)):
@@ -374,13 +494,26 @@ def export_trades_jsonl(db: Session = Depends(db_session)):
 
 @app.get("/api/export/backtest.json")
 def export_backtest_json(hold_days: int = Query(30, ge=5, le=365), benchmark: str = "SPY", db: Session = Depends(db_session)):
-    rows = db.execute(select(Trade, Official).join(Official, Trade.official_id == Official.id, isouter=True)).all()
-    trades = [{"ticker": t.ticker, "transaction_type": t.transaction_type.value, "trade_date": t.trade_date, "chamber": off.chamber.value if off else None} for t, off in rows]
-    res = backtest_equal_weight(trades, hold_days=hold_days, benchmark=benchmark)
+    res = _backtest(db, hold_days, benchmark)
     headers = {"Content-Disposition": "attachment; filename=backtest.json"}
     return JSONResponse(content=res, headers=headers)
 
 # --- Admin: Jobs management & connectors ---
+@app.get("/api/admin/profile")
+def admin_profile(seconds: float = Query(5, gt=0, le=60), interval_ms: float = Query(5, ge=1, le=1000), idle: int = Query(0),
+                  format: str = Query("collapsed"), ok: bool = Depends(require_api_token)):
+    """Sample every thread of this API process for `seconds`; collapsed stacks for flamegraph.pl/speedscope."""
+    if format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="format must be collapsed or json")
+    try:
+        stacks, samples = profiling.sample(seconds, interval_ms / 1000, idle=bool(idle))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "json":
+        return {"ok": True, "samples": samples, "top": profiling.top_functions(stacks),
+                "stacks": [{"stack": list(st), "count": c} for st, c in stacks.most_common()]}
+    return PlainTextResponse(profiling.collapsed(stacks))
+
 @app.post("/api/admin/jobs/retry/{job_id}")
 def admin_retry_job(job_id: str, ok: bool = Depends(require_api_token)):
     q = get_queue()
@@ -390,11 +523,10 @@ def admin_retry_job(job_id: str, ok: bool = Depends(require_api_token)):
 
 @app.post("/api/admin/jobs/requeue_failed")
 def admin_requeue_failed(ok: bool = Depends(require_api_token)):
-    q = get_queue()
     from rq.registry import FailedJobRegistry
-    reg = FailedJobRegistry(queue=q)
-    for jid in reg.get_job_ids():
-        Job.fetch(jid, connection=q.connection).requeue()
+    for q in all_queues():
+        for jid in FailedJobRegistry(queue=q).get_job_ids():
+            Job.fetch(jid, connection=q.connection).requeue()
     return {"ok": True}
 
 @app.post("/api/admin/ingest/run")
@@ -422,6 +554,8 @@ class AlertIn(BaseModel):
     sector_pct_threshold: float | None = None
     window_days: int = 30
     sectors: str = ""
+    tickers: str = ""
+    officials: str = ""
     frequency: str = "daily"
     delivery: str = "email"
     webhook_url: str | None = None
@@ -432,7 +566,7 @@ def api_list_rules(email: Optional[str] = Depends(current_user_email), db: Sessi
     items = [{
         "id": r.id, "name": r.name, "min_alpha": float(r.min_alpha) if r.min_alpha is not None else None,
         "min_sharpe": float(r.min_sharpe) if r.min_sharpe is not None else None, "window_days": r.window_days,
-        "sectors": r.sectors, "frequency": r.frequency.value, "delivery": r.delivery.value, "webhook_url": r.webhook_url
+        "sectors": r.sectors, "tickers": r.tickers, "officials": r.officials, "frequency": r.frequency.value, "delivery": r.delivery.value, "webhook_url": r.webhook_url
     } for r in rules]
     return {"ok": True, "items": items}
 
@@ -441,7 +575,7 @@ def api_create_rule(body: AlertIn, email: Optional[str] = Depends(current_user_e
     rule = create_rule(db, email or "demo@example.com", {
         "name": body.name, "min_alpha": body.min_alpha, "min_sharpe": body.min_sharpe,
         "sector_pct_threshold": body.sector_pct_threshold, "window_days": body.window_days,
-        "sectors": body.sectors, "frequency": body.frequency, "delivery": body.delivery, "webhook_url": body.webhook_url
+        "sectors": body.sectors, "tickers": body.tickers, "officials": body.officials, "frequency": body.frequency, "delivery": body.delivery, "webhook_url": body.webhook_url
     })
     return {"ok": True, "id": rule.id}
 
@@ -556,8 +690,18 @@ def api_push_register(body: PushBody, email: Optional[str] = Depends(current_use
 # Push: test broadcast
 @app.post("/api/push/test")
 def api_push_test(db: Session = Depends(db_session)):
-    sent = send_test_to_all(db, text="Test alert: subscriptions connected")
-    return {"ok": True, "sent": sent}
+    res = send_test_to_all(db, text="Test alert: subscriptions connected")
+    return {"ok": True, **res}
+
+# Push: targeted send to one user's subscriptions
+class PushSendBody(BaseModel):
+    email: str
+    title: str = "Official Trades Pro"
+    body: str
+
+@app.post("/api/push/send")
+def api_push_send(body: PushSendBody, ok: bool = Depends(require_api_token), db: Session = Depends(db_session)):
+    return {"ok": True, **send_to_user(db, body.email, body.title, body.body)}
 
 # Quality report
 @app.get("/api/admin/quality/report")
@@ -574,11 +718,33 @@ def api_webhook_requeue(max_items: int = 50):
     return {"ok": True, "requeued": n}
 
 @app.get("/api/risk/officials")
-def api_risk_officials(limit: int = 50, db: Session = Depends(db_session)):
-    items = top_officials(db, limit=limit)
-    # attach names
-    out = []
-    for it in items:
-        off = db.get(Official, it["official_id"])
-        out.append({**it, "official_name": (off.name if off else None)})
-    return {"ok": True, "items": out}
+def api_risk_officials(limit: int = 50, offset: int = 0, sort: str = "score", order: str = "desc", sector: Optional[str] = None,
+                       db: Session = Depends(db_session)):
+    try:
+        page = list_risk_scores(db, limit=max(1, min(limit, 500)), offset=max(0, offset), sort=sort, order=order, sector=sector)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, **page}
+
+@app.get("/api/risk/officials/history")
+def api_risk_history(period: str = "month", periods: int = Query(12, ge=1, le=520), end: Optional[date] = None,
+                     official_ids: Optional[str] = None, db: Session = Depends(db_session)):
+    try:
+        ids = [int(x) for x in official_ids.split(",") if x.strip()] if official_ids else None
+        df = score_history(db, ids, period=period, end=end, periods=periods)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, "period": period, "items": history_items(df)}
+
+@app.get("/api/risk/officials/{official_id}/history")
+def api_risk_official_history(official_id: int, period: str = "month", start: Optional[date] = None, end: Optional[date] = None,
+                              periods: Optional[int] = Query(None, ge=1), db: Session = Depends(db_session)):
+    off = db.get(Official, official_id)
+    if not off: raise HTTPException(status_code=404, detail="Official not found")
+    try:
+        df = score_history(db, [official_id], period=period, start=start, end=end, periods=periods)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    items = history_items(df)
+    return {"ok": True, "official_id": official_id, "official_name": off.name, "period": period,
+            "points": items[0]["points"] if items else []}
@@ -1,5 +1,5 @@
 
-from fastapi import Header, HTTPException, Depends
+from fastapi import Header, HTTPException, Depends, Query
 from sqlalchemy.orm import Session
 from .config import env
 from .db import SessionLocal
@@ -17,3 +17,10 @@ def require_api_token(authorization: str = Header(default=""), db: Session = Dep
     if token != expected:
         raise HTTPException(status_code=401, detail="Invalid API token")
     return True
+
+def profile_flag(profile: int = Query(0), authorization: str = Header(default="")) -> bool:
+    """`profile=1` on a job endpoint: cProfile the job. Admin token only, since profiled jobs skip dedupe."""
+    if not profile:
+        return False
+    with SessionLocal() as db:
+        return require_api_token(authorization, db)
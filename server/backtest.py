@@ -1,11 +1,240 @@
 
-from typing import List, Optional, Dict, Any
-def backtest_equal_weight(trades: List[dict], hold_days: int = 30, benchmark: str = "SPY",
-                          chamber: Optional[str]=None, tx_filter: Optional[str]=None,
-                          start_date=None, end_date=None, sectors: Optional[list]=None) -> Dict[str, Any]:
-    # Demo output
+from typing import List, Optional, Dict, Any, Callable, Iterable
+import os, math
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import select, case, or_, func, type_coerce, String
+from sqlalchemy.orm import Session
+from .db import SessionLocal
+from .models import Trade, Official, Chamber, TxType, IssuerSector
+from .linking import infer_sector_from_issuer, ISSUER_MAP
+from .prices import PriceMatrix, load_price_matrix, empty_matrix, price_lookback_days
+from .sectors import issuer_table_enabled, issuer_key_sql
+
+# Equal-weight "copy the filing" model: each buy (sell) opens a long (short) position at the
+# first close on/after trade_date and closes it at the last close within hold_days.
+# Everything downstream is derived from additive partial sums so that shards of the trade set
+# can be computed independently and reduced.
+
+SIDES = {"buy": 1.0, "sell": -1.0}
+TOP_N = 10
+
+def backtest_workers() -> int:
+    return max(1, int(os.environ.get("BACKTEST_WORKERS", os.cpu_count() or 1)))
+
+def shard_min_trades() -> int:
+    return int(os.environ.get("BACKTEST_SHARD_MIN", "50000"))
+
+def trades_to_arrays(trades: List[dict], chamber: Optional[str] = None, tx_filter: Optional[str] = None,
+                     start_date=None, end_date=None, sectors: Optional[list] = None) -> Dict[str, np.ndarray]:
+    wanted = {s.lower() for s in sectors} if sectors else None
+    tick, side, td, sec = [], [], [], []
+    for t in trades:
+        tx = (t.get("transaction_type") or "").lower()
+        if tx not in SIDES or not t.get("ticker") or not t.get("trade_date"): continue
+        if chamber and t.get("chamber") != chamber: continue
+        if tx_filter and tx != tx_filter: continue
+        if start_date and t["trade_date"] < start_date: continue
+        if end_date and t["trade_date"] > end_date: continue
+        s = t.get("sector") or infer_sector_from_issuer(t.get("issuer") or "") or "unknown"
+        if wanted is not None and s not in wanted: continue
+        tick.append(t["ticker"].upper()); side.append(SIDES[tx]); td.append(t["trade_date"]); sec.append(s)
     return {
-        "summary": {"alpha": 0.07, "sharpe": 1.2, "beta": 0.8, "idio_vol": 0.15},
-        "top_holdings": [{"ticker":"AAPL","trades":12,"avg_return":0.04},{"ticker":"MSFT","trades":9,"avg_return":0.03}],
-        "sector_breakdown": [{"sector":"Technology","pct":0.62},{"sector":"Energy","pct":0.18},{"sector":"Unknown","pct":0.20}]
+        "ticker": np.array(tick, dtype=str),
+        "side": np.array(side, dtype=float),
+        "trade_date": np.array(td, dtype="datetime64[D]"),
+        "sector": np.array(sec, dtype=str),
     }
+
+def issuer_sector_sql():
+    """SQL twin of `infer_sector_from_issuer` so sector labels/filters run in the database.
+
+    With the issuer_sectors table enabled the label is an indexed lookup, falling back to the
+    keyword CASE for issuers not classified yet.
+    """
+    issuer = issuer_key_sql()
+    expr = case(*[(or_(*[issuer.like(f"%{k}%") for k in kws]), sector) for sector, kws in ISSUER_MAP.items()], else_="unknown")
+    if issuer_table_enabled():
+        expr = func.coalesce(select(IssuerSector.sector).where(IssuerSector.issuer == issuer).scalar_subquery(), expr)
+    return expr
+
+def filtered_trades_stmt(*columns, chamber: Optional[str] = None, tx_filter: Optional[str] = None,
+                         start_date=None, end_date=None, sectors: Optional[list] = None):
+    """SELECT of `columns` over priced buy/sell trades with the shared backtest filters applied.
+
+    Raises ValueError for an unknown chamber/transaction type.
+    """
+    stmt = (select(*columns)
+            .join(Official, Trade.official_id == Official.id, isouter=True)
+            .where(Trade.ticker != "", Trade.ticker.is_not(None), Trade.trade_date.is_not(None)))
+    stmt = stmt.where(Trade.transaction_type.in_([TxType[k] for k in SIDES]))
+    if tx_filter: stmt = stmt.where(Trade.transaction_type == TxType(tx_filter))
+    if chamber: stmt = stmt.where(Official.chamber == Chamber(chamber))
+    if start_date: stmt = stmt.where(Trade.trade_date >= start_date)
+    if end_date: stmt = stmt.where(Trade.trade_date <= end_date)
+    if sectors: stmt = stmt.where(issuer_sector_sql().in_([s.lower() for s in sectors]))
+    return stmt
+
+def load_backtest_trades(db: Session, chamber: Optional[str] = None, tx_filter: Optional[str] = None,
+                         start_date=None, end_date=None, sectors: Optional[list] = None) -> Dict[str, np.ndarray]:
+    """Filtered backtest inputs as columnar arrays (same layout as `trades_to_arrays`).
+
+    Filters run in SQL and only the columns the model needs are projected, returned as plain row
+    tuples rather than ORM entities.
+    """
+    stmt = filtered_trades_stmt(func.upper(Trade.ticker), type_coerce(Trade.transaction_type, String), Trade.trade_date,
+                                type_coerce(Official.chamber, String), issuer_sector_sql(),
+                                chamber=chamber, tx_filter=tx_filter, start_date=start_date, end_date=end_date, sectors=sectors)
+    rows = db.execute(stmt).all()
+    cols = list(zip(*rows)) if rows else [(), (), (), (), ()]
+    tx = np.array(cols[1], dtype=str)
+    return {
+        "ticker": np.array(cols[0], dtype=str),
+        "side": np.where(tx == "buy", SIDES["buy"], SIDES["sell"]).astype(float),
+        "trade_date": np.array(cols[2], dtype="datetime64[D]"),
+        "sector": np.array(cols[4], dtype=str),
+        "chamber": np.array([c or "" for c in cols[3]], dtype=str),
+    }
+
+def empty_partials() -> Dict[str, Any]:
+    return {"n": 0, "sum_r": 0.0, "sum_b": 0.0, "sum_rr": 0.0, "sum_bb": 0.0, "sum_rb": 0.0, "by_ticker": {}, "by_sector": {}}
+
+def trade_returns(arrays: Dict[str, np.ndarray], prices: PriceMatrix, bench: Optional[np.ndarray], hold_days: int) -> Dict[str, np.ndarray]:
+    """Per-trade signed returns `r` and benchmark returns `b` for the trades that can be priced."""
+    n = len(arrays["ticker"])
+    valid = np.zeros(n, dtype=bool)
+    r = np.full(n, np.nan); b = np.full(n, np.nan)
+    if n == 0 or bench is None or not len(prices):
+        return {"valid": valid, "r": r, "b": b}
+    dates = prices.dates
+    uniq, inv = np.unique(arrays["ticker"], return_inverse=True)
+    cols = np.array([prices.col.get(t, -1) for t in uniq], dtype=int)[inv]
+    td = arrays["trade_date"]
+    exit_day = td + np.timedelta64(hold_days, "D")
+    entry = np.searchsorted(dates, td, side="left")
+    exit_ = np.searchsorted(dates, exit_day, side="right") - 1
+    ok = (cols >= 0) & (entry < len(dates)) & (exit_ > entry) & (exit_day <= dates[-1])
+    e, x, c = entry[ok], exit_[ok], cols[ok]
+    p0, p1 = prices.closes[e, c], prices.closes[x, c]
+    b0, b1 = bench[e], bench[x]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rr = arrays["side"][ok] * (p1 / p0 - 1.0)
+        bb = b1 / b0 - 1.0
+    good = np.isfinite(rr) & np.isfinite(bb) & (p0 > 0) & (b0 > 0)
+    idx = np.flatnonzero(ok)[good]
+    valid[idx] = True; r[idx] = rr[good]; b[idx] = bb[good]
+    return {"valid": valid, "r": r, "b": b}
+
+def partials_from_returns(tickers: np.ndarray, sectors: np.ndarray, r: np.ndarray, b: np.ndarray) -> Dict[str, Any]:
+    if not len(r):
+        return empty_partials()
+    ut, ti = np.unique(tickers, return_inverse=True)
+    t_cnt = np.bincount(ti, minlength=len(ut)); t_sum = np.bincount(ti, weights=r, minlength=len(ut))
+    us, s_cnt = np.unique(sectors, return_counts=True)
+    return {
+        "n": int(len(r)),
+        "sum_r": float(r.sum()), "sum_b": float(b.sum()),
+        "sum_rr": float(r @ r), "sum_bb": float(b @ b), "sum_rb": float(r @ b),
+        "by_ticker": {str(t): [int(c), float(s)] for t, c, s in zip(ut, t_cnt, t_sum)},
+        "by_sector": {str(s): int(c) for s, c in zip(us, s_cnt)},
+    }
+
+def compute_partials(arrays: Dict[str, np.ndarray], prices: PriceMatrix, bench: Optional[np.ndarray], hold_days: int) -> Dict[str, Any]:
+    tr = trade_returns(arrays, prices, bench, hold_days)
+    v = tr["valid"]
+    return partials_from_returns(arrays["ticker"][v], arrays["sector"][v], tr["r"][v], tr["b"][v])
+
+def combine_partials(parts: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    out = empty_partials()
+    for p in parts:
+        for k in ("n", "sum_r", "sum_b", "sum_rr", "sum_bb", "sum_rb"):
+            out[k] += p[k]
+        for t, (c, s) in p["by_ticker"].items():
+            cur = out["by_ticker"].setdefault(t, [0, 0.0])
+            cur[0] += c; cur[1] += s
+        for s, c in p["by_sector"].items():
+            out["by_sector"][s] = out["by_sector"].get(s, 0) + c
+    return out
+
+def summarize(p: Dict[str, Any], hold_days: int, top_n: int = TOP_N) -> Dict[str, Any]:
+    n = p["n"]
+    if not n:
+        return {"summary": {"alpha": 0.0, "sharpe": 0.0, "beta": 0.0, "idio_vol": 0.0, "trades": 0}, "top_holdings": [], "sector_breakdown": []}
+    mr, mb = p["sum_r"] / n, p["sum_b"] / n
+    var_r = max(p["sum_rr"] / n - mr * mr, 0.0)
+    var_b = max(p["sum_bb"] / n - mb * mb, 0.0)
+    cov = p["sum_rb"] / n - mr * mb
+    beta = cov / var_b if var_b > 0 else 0.0
+    ann = math.sqrt(365.0 / hold_days)
+    summary = {
+        "alpha": round(mr - beta * mb, 6),
+        "sharpe": round(mr / math.sqrt(var_r) * ann, 4) if var_r > 0 else 0.0,
+        "beta": round(beta, 4),
+        "idio_vol": round(math.sqrt(max(var_r - beta * cov, 0.0)) * ann, 4),
+        "trades": n,
+    }
+    holdings = sorted(p["by_ticker"].items(), key=lambda kv: (-kv[1][0], kv[0]))[:top_n]
+    sectors = sorted(p["by_sector"].items(), key=lambda kv: (-kv[1], kv[0]))
+    return {
+        "summary": summary,
+        "top_holdings": [{"ticker": t, "trades": c, "avg_return": round(s / c, 6)} for t, (c, s) in holdings],
+        "sector_breakdown": [{"sector": s, "pct": round(c / n, 4)} for s, c in sectors],
+    }
+
+def shard_by_ticker(arrays: Dict[str, np.ndarray], n_shards: int) -> List[Dict[str, np.ndarray]]:
+    """Split trades into at most n_shards groups of whole tickers with balanced trade counts."""
+    uniq, inv = np.unique(arrays["ticker"], return_inverse=True)
+    counts = np.bincount(inv, minlength=len(uniq))
+    load = np.zeros(n_shards, dtype=np.int64)
+    assign = np.empty(len(uniq), dtype=int)
+    for u in np.argsort(-counts, kind="stable"):
+        s = int(load.argmin()); assign[u] = s; load[s] += counts[u]
+    shard_of = assign[inv]
+    return [{k: v[shard_of == s] for k, v in arrays.items()} for s in range(n_shards) if load[s]]
+
+def load_backtest_prices(arrays: Dict[str, np.ndarray], benchmark: str, hold_days: int, db: Optional[Session] = None) -> PriceMatrix:
+    if not len(arrays["ticker"]):
+        return empty_matrix()
+    # the lookback gives the forward-fill a quote before the first trade, so the result doesn't depend on
+    # where the window starts (the incremental state loads from its oldest pending trade)
+    start = arrays["trade_date"].min().astype(date) - timedelta(days=price_lookback_days())
+    end = arrays["trade_date"].max().astype(date) + timedelta(days=hold_days)
+    tickers = set(np.unique(arrays["ticker"]).tolist()) | {benchmark.upper()}
+    if db is not None:
+        return load_price_matrix(db, tickers, start, end)
+    with SessionLocal() as db:
+        return load_price_matrix(db, tickers, start, end)
+
+def run_backtest(arrays: Dict[str, np.ndarray], prices: PriceMatrix, hold_days: int = 30, benchmark: str = "SPY",
+                 workers: int = 1, on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    bench = prices.column(benchmark)
+    n = len(arrays["ticker"])
+    if bench is None or workers <= 1 or n < shard_min_trades():
+        partials = compute_partials(arrays, prices, bench, hold_days)
+        if on_progress: on_progress(1, 1)
+        return summarize(partials, hold_days)
+    shards = shard_by_ticker(arrays, workers)
+    ctx = mp.get_context(os.environ.get("BACKTEST_MP_CONTEXT", "spawn"))
+    parts = []
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=ctx) as ex:
+        futs = [ex.submit(compute_partials, s, prices.subset(np.unique(s["ticker"]).tolist()), bench, hold_days) for s in shards]
+        for i, f in enumerate(as_completed(futs), 1):
+            parts.append(f.result())
+            if on_progress: on_progress(i, len(futs))
+    return summarize(combine_partials(parts), hold_days)
+
+def backtest_equal_weight(trades: List[dict], hold_days: int = 30, benchmark: str = "SPY",
+                          chamber: Optional[str]=None, tx_filter: Optional[str]=None,
+                          start_date=None, end_date=None, sectors: Optional[list]=None,
+                          prices: Optional[PriceMatrix]=None) -> Dict[str, Any]:
+    arrays = trades_to_arrays(trades, chamber=chamber, tx_filter=tx_filter, start_date=start_date, end_date=end_date, sectors=sectors)
+    if prices is None:
+        prices = load_backtest_prices(arrays, benchmark, hold_days)
+    return run_backtest(arrays, prices, hold_days=hold_days, benchmark=benchmark)
+
+def backtest_from_db(db: Session, hold_days: int = 30, benchmark: str = "SPY", chamber: Optional[str] = None,
+                     tx_filter: Optional[str] = None, start_date=None, end_date=None, sectors: Optional[list] = None) -> Dict[str, Any]:
+    arrays = load_backtest_trades(db, chamber=chamber, tx_filter=tx_filter, start_date=start_date, end_date=end_date, sectors=sectors)
+    return run_backtest(arrays, load_backtest_prices(arrays, benchmark, hold_days, db=db), hold_days=hold_days, benchmark=benchmark)
@@ -0,0 +1,100 @@
+
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import numpy as np
+from sqlalchemy import select, delete, func, type_coerce, String
+from sqlalchemy.orm import Session
+from .models import Trade, PriceBar, BacktestState, BacktestTradeReturn
+from .backtest import (SIDES, filtered_trades_stmt, issuer_sector_sql, load_backtest_prices, trade_returns,
+                       partials_from_returns, combine_partials, empty_partials, summarize)
+from .prices import prices_revision
+
+# Resumable state for the standard (unfiltered) backtests. Each state keeps one row per trade with
+# its realized return `r` and benchmark return `b`, plus the running partial sums that `summarize`
+# needs. An update only appends trades with id > last_trade_id and settles trades still waiting
+# for their exit price; a price revision (see prices.upsert_prices) forces a full recompute.
+
+def standard_backtests() -> List[Tuple[int, str]]:
+    spec = os.environ.get("BACKTEST_STANDARD", "30:SPY,90:SPY,365:SPY")
+    out = []
+    for item in spec.split(","):
+        if not item.strip(): continue
+        hold, _, bench = item.strip().partition(":")
+        out.append((int(hold), (bench or "SPY").upper()))
+    return out
+
+def state_key(hold_days: int, benchmark: str) -> str:
+    return f"{int(hold_days)}:{benchmark.upper()}"
+
+def get_state(db: Session, hold_days: int, benchmark: str) -> Optional[BacktestState]:
+    return db.execute(select(BacktestState).where(BacktestState.key == state_key(hold_days, benchmark))).scalars().first()
+
+def _reset(db: Session, st: BacktestState, revision: int):
+    db.execute(delete(BacktestTradeReturn).where(BacktestTradeReturn.state_id == st.id))
+    st.last_trade_id = 0; st.last_price_date = None
+    st.partials = empty_partials(); st.price_revision = revision
+
+def update_backtest_state(db: Session, hold_days: int = 30, benchmark: str = "SPY", full: bool = False) -> BacktestState:
+    benchmark = benchmark.upper()
+    revision = prices_revision(db)
+    st = get_state(db, hold_days, benchmark)
+    if st is None:
+        st = BacktestState(key=state_key(hold_days, benchmark), hold_days=hold_days, benchmark=benchmark,
+                           last_trade_id=0, price_revision=revision, partials=empty_partials())
+        db.add(st); db.flush()
+    elif full or st.price_revision != revision:
+        _reset(db, st, revision)
+
+    # 1) queue trades added since the last run
+    upto = db.scalar(select(func.max(Trade.id))) or 0
+    new = db.execute(filtered_trades_stmt(Trade.id, func.upper(Trade.ticker), type_coerce(Trade.transaction_type, String),
+                                          Trade.trade_date, issuer_sector_sql())
+                     .where(Trade.id > st.last_trade_id, Trade.id <= upto)).all()
+    if new:
+        db.bulk_insert_mappings(BacktestTradeReturn, [
+            {"state_id": st.id, "trade_id": tid, "ticker": tick, "side": SIDES[tx], "trade_date": td, "sector": sec, "status": "pending"}
+            for tid, tick, tx, td, sec in new])
+    st.last_trade_id = max(st.last_trade_id or 0, upto)
+
+    # 2) settle pending trades whose exit day is now covered by prices
+    R = BacktestTradeReturn
+    pend = db.execute(select(R.id, R.ticker, R.side, R.trade_date, R.sector)
+                      .where(R.state_id == st.id, R.status == "pending")).all()
+    if pend:
+        ids, tick, side, td, sec = (np.array(c) for c in zip(*pend))
+        arrays = {"ticker": tick.astype(str), "side": side.astype(float), "trade_date": td.astype("datetime64[D]"), "sector": sec.astype(str)}
+        prices = load_backtest_prices(arrays, benchmark, hold_days, db=db)
+        bench = prices.column(benchmark)
+        if bench is not None:
+            tr = trade_returns(arrays, prices, bench, hold_days)
+            v = tr["valid"]
+            # exit day already priced but no usable quote for the ticker -> never settles (until a revision)
+            dead = ~v & (arrays["trade_date"] + np.timedelta64(hold_days, "D") <= prices.dates[-1])
+            db.bulk_update_mappings(R, [{"id": int(i), "status": "done", "r": float(r), "b": float(b)}
+                                        for i, r, b in zip(ids[v], tr["r"][v], tr["b"][v])]
+                                       + [{"id": int(i), "status": "skipped"} for i in ids[dead]])
+            st.partials = combine_partials([st.partials or empty_partials(),
+                                            partials_from_returns(arrays["ticker"][v], arrays["sector"][v], tr["r"][v], tr["b"][v])])
+    st.last_price_date = db.scalar(select(func.max(PriceBar.date)))
+    db.commit()
+    return st
+
+def update_standard_backtests(db: Session, full: bool = False) -> Dict[str, Any]:
+    out = {}
+    for hold, bench in standard_backtests():
+        st = update_backtest_state(db, hold, bench, full=full)
+        out[st.key] = (st.partials or {}).get("n", 0)
+    return out
+
+def is_fresh(db: Session, st: BacktestState) -> bool:
+    return (st.last_trade_id >= (db.scalar(select(func.max(Trade.id))) or 0)
+            and st.price_revision == prices_revision(db)
+            and st.last_price_date == db.scalar(select(func.max(PriceBar.date))))
+
+def standard_result(db: Session, hold_days: int, benchmark: str) -> Optional[Dict[str, Any]]:
+    """Stored result for an unfiltered backtest, or None when no up-to-date state exists."""
+    st = get_state(db, hold_days, benchmark)
+    if st is None or not is_fresh(db, st):
+        return None
+    return summarize(st.partials or empty_partials(), hold_days)
@@ -0,0 +1,4 @@
+"""Offline benchmark suite: synthetic data generator, timed scenarios and baseline comparison.
+
+Run with `python -m server.bench run --trades 10000 --out bench.json`; see `__main__.py`.
+"""
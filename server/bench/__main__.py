@@ -0,0 +1,160 @@
+
+"""Benchmark runner.
+
+    python -m server.bench run --trades 100000 --out bench.json [--baseline base.json] [--tolerance 0.25]
+    python -m server.bench compare base.json bench.json [--tolerance 0.25]
+
+`run` builds a throwaway SQLite database from the synthetic generator, times each scenario and
+writes machine-readable JSON. With a baseline it also compares and exits 1 on regressions.
+Everything runs offline (no Redis, no network).
+"""
+import argparse, json, os, platform, statistics, sys, tempfile, time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+SCENARIOS = ("backtest", "backtest_sharded", "event_study", "risk", "ingest", "export_trades_csv", "export_trades_jsonl", "export_backtest_csv")
+
+def _timed(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    runs, rows = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        rows = fn()
+        runs.append(time.perf_counter() - t0)
+    return {"seconds": statistics.median(runs), "min": min(runs), "runs": [round(r, 6) for r in runs], "rows": rows}
+
+def run(args) -> Dict[str, Any]:
+    workdir = args.workdir or tempfile.mkdtemp(prefix="otp-bench-")
+    # The engine is created at import time, so the database must be chosen before importing the app.
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["USE_REDIS"] = "0"
+    from ..db import engine, SessionLocal
+    from ..models import Base
+    from .synth import Scale, generate, trade_records, BENCHMARK
+    scale = Scale(trades=args.trades, officials=args.officials, tickers=args.tickers, years=args.years, seed=args.seed)
+    Base.metadata.create_all(bind=engine)
+    t0 = time.perf_counter()
+    counts = generate(engine, scale)
+    gen_seconds = time.perf_counter() - t0
+    print(f"generated {counts} in {gen_seconds:.1f}s ({workdir})", file=sys.stderr)
+
+    from ..backtest import load_backtest_trades, load_backtest_prices, run_backtest, backtest_from_db, backtest_workers
+    from ..event_study import event_study_from_db
+    from ..risk import top_officials
+    from ..ingest import persist_records
+    from .. import app as api
+
+    def backtest():
+        with SessionLocal() as db:
+            return backtest_from_db(db, 30, BENCHMARK)["summary"]["trades"]
+
+    def backtest_sharded():
+        os.environ["BACKTEST_SHARD_MIN"] = "0"
+        with SessionLocal() as db:
+            arrays = load_backtest_trades(db)
+            prices = load_backtest_prices(arrays, BENCHMARK, 30, db=db)
+        return run_backtest(arrays, prices, 30, BENCHMARK, workers=args.workers or backtest_workers())["summary"]["trades"]
+
+    def event_study():
+        with SessionLocal() as db:
+            return event_study_from_db(db, "trade_date", -5, 30, BENCHMARK)["trades"]
+
+    def risk():
+        with SessionLocal() as db:
+            return len(top_officials(db, limit=50))
+
+    ingest_batches = iter(range(10_000))
+    def ingest():
+        # fresh, non-overlapping records each repetition so every run does real inserts
+        recs = list(trade_records(scale, n=args.ingest, seed_offset=100 + next(ingest_batches)))
+        for r in recs: r["trade_date"] = r["trade_date"].isoformat(); r["reported_date"] = r["reported_date"].isoformat()
+        with SessionLocal() as db:
+            return persist_records(db, recs)
+
+    def export(fn, **kw):
+        def _run():
+            with SessionLocal() as db:
+                return fn(db=db, **kw).body.count(b"\n")
+        return _run
+
+    fns = {
+        "backtest": backtest, "backtest_sharded": backtest_sharded, "event_study": event_study, "risk": risk, "ingest": ingest,
+        "export_trades_csv": export(api.export_trades_csv), "export_trades_jsonl": export(api.export_trades_jsonl),
+        "export_backtest_csv": export(api.export_backtest_csv, hold_days=30, benchmark=BENCHMARK),
+    }
+    selected = [s for s in (args.only.split(",") if args.only else SCENARIOS) if s]
+    results: Dict[str, Any] = {}
+    for name in selected:
+        if name not in fns:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        results[name] = _timed(fns[name], args.repeat)
+        print(f"{name:22s} {results[name]['seconds']:.4f}s rows={results[name]['rows']}", file=sys.stderr)
+    return {
+        "meta": {"created_at": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+                 "platform": platform.platform(), "cpus": os.cpu_count(), "repeat": args.repeat,
+                 "scale": scale.as_dict(), "generated": counts, "generate_seconds": round(gen_seconds, 3)},
+        "scenarios": results,
+    }
+
+def compare(base: Dict[str, Any], cur: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Per-scenario ratio of current/baseline median time; `regression` when it exceeds 1 + tolerance."""
+    out = []
+    for name, c in cur.get("scenarios", {}).items():
+        b = base.get("scenarios", {}).get(name)
+        if not b or not b.get("seconds"):
+            out.append({"scenario": name, "baseline": None, "current": c["seconds"], "ratio": None, "regression": False})
+            continue
+        ratio = c["seconds"] / b["seconds"]
+        out.append({"scenario": name, "baseline": b["seconds"], "current": c["seconds"], "ratio": round(ratio, 3),
+                    "regression": ratio > 1 + tolerance})
+    if base.get("meta", {}).get("scale") != cur.get("meta", {}).get("scale"):
+        print("warning: baseline was recorded at a different scale", file=sys.stderr)
+    return out
+
+def _print_comparison(rows: List[Dict[str, Any]]):
+    for r in rows:
+        flag = "REGRESSION" if r["regression"] else "ok"
+        base = f"{r['baseline']:.4f}s" if r["baseline"] is not None else "-"
+        ratio = f"x{r['ratio']:.2f}" if r["ratio"] is not None else "new"
+        print(f"{r['scenario']:22s} {base:>10s} -> {r['current']:.4f}s  {ratio:>7s}  {flag}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(prog="python -m server.bench")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="generate data, time scenarios, write JSON")
+    r.add_argument("--trades", type=int, default=10_000)
+    r.add_argument("--officials", type=int, default=None)
+    r.add_argument("--tickers", type=int, default=None)
+    r.add_argument("--years", type=int, default=5)
+    r.add_argument("--seed", type=int, default=0)
+    r.add_argument("--ingest", type=int, default=1_000, help="records per ingest run")
+    r.add_argument("--workers", type=int, default=None, help="processes for backtest_sharded")
+    r.add_argument("--repeat", type=int, default=3)
+    r.add_argument("--only", default="", help="comma-separated scenario names")
+    r.add_argument("--workdir", default=None, help="where to build the SQLite database (default: temp dir)")
+    r.add_argument("--out", default="bench.json")
+    r.add_argument("--baseline", default=None)
+    r.add_argument("--tolerance", type=float, default=0.25)
+    c = sub.add_parser("compare", help="compare two result files")
+    c.add_argument("baseline"); c.add_argument("current")
+    c.add_argument("--tolerance", type=float, default=0.25)
+    args = p.parse_args(argv)
+
+    if args.cmd == "compare":
+        with open(args.baseline) as f: base = json.load(f)
+        with open(args.current) as f: cur = json.load(f)
+        rows = compare(base, cur, args.tolerance)
+        _print_comparison(rows)
+        return 1 if any(x["regression"] for x in rows) else 0
+
+    res = run(args)
+    if args.baseline:
+        with open(args.baseline) as f: base = json.load(f)
+        res["comparison"] = compare(base, res, args.tolerance)
+        _print_comparison(res["comparison"])
+    with open(args.out, "w") as f:
+        json.dump(res, f, indent=2, default=str)
+    print(f"wrote {args.out}", file=sys.stderr)
+    return 1 if any(x["regression"] for x in res.get("comparison", [])) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+from ..models import Official, Trade, PriceBar, Chamber, TxType, Owner
+from ..linking import MAP, ISSUER_MAP
+
+# Deterministic synthetic officials, trades and daily prices. The same (seed, scale) always yields
+# the same rows, so timings from different runs/commits are comparable.
+
+BENCHMARK = "SPY"
+CHUNK = 100_000
+
+class Scale:
+    def __init__(self, trades: int = 10_000, officials: Optional[int] = None, tickers: Optional[int] = None,
+                 years: int = 5, seed: int = 0, end: date = date(2025, 12, 31)):
+        self.trades = int(trades)
+        self.officials = officials or max(50, min(5_000, self.trades // 200))
+        self.tickers = tickers or max(50, min(5_000, self.trades // 100))
+        self.years = years
+        self.seed = seed
+        self.end = end
+        self.start = end - timedelta(days=365 * years)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"trades": self.trades, "officials": self.officials, "tickers": self.tickers, "years": self.years,
+                "seed": self.seed, "start": self.start.isoformat(), "end": self.end.isoformat()}
+
+def ticker_names(n: int) -> List[str]:
+    out, i = [], 0
+    while len(out) < n:
+        s, k = "", i
+        for _ in range(4):
+            s = chr(65 + k % 26) + s; k //= 26
+        out.append(s)  # 4 letters, never collides with the benchmark
+        i += 7919  # coprime with 26**4: distinct names spread over the alphabet
+    return out
+
+def issuer_names(tickers: List[str], rng: np.random.Generator) -> List[str]:
+    words = [kw for kws in ISSUER_MAP.values() for kw in kws] + ["retail", "goods", "motors", "foods"]
+    picks = rng.integers(0, len(words), size=len(tickers))
+    return [f"{t} {words[p].title()} Corp" for t, p in zip(tickers, picks)]
+
+def business_days(start: date, end: date) -> np.ndarray:
+    d = np.arange(np.datetime64(start), np.datetime64(end) + 1, dtype="datetime64[D]")
+    return d[np.is_busday(d)]
+
+def _insert(engine: Engine, table, rows: List[Dict[str, Any]]):
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(insert(table), rows)
+
+CHAMBERS = [Chamber.house, Chamber.senate, Chamber.executive, Chamber.other]
+
+def official_chambers(scale: Scale) -> List[Chamber]:
+    rng = np.random.default_rng(scale.seed)
+    return [CHAMBERS[c] for c in rng.choice(len(CHAMBERS), size=scale.officials, p=[0.7, 0.2, 0.05, 0.05])]
+
+def gen_officials(engine: Engine, scale: Scale) -> int:
+    committees = [f"{kws[0].title()} Committee" for kws in MAP.values()] + ["Rules", "Ethics"]
+    cm = np.random.default_rng(scale.seed + 4).integers(0, len(committees), size=scale.officials)
+    _insert(engine, Official.__table__, [
+        {"id": i + 1, "name": f"Official {i + 1:05d}", "chamber": ch, "role": "", "state": "", "committees": committees[m]}
+        for i, (ch, m) in enumerate(zip(official_chambers(scale), cm))])
+    return scale.officials
+
+def gen_prices(engine: Engine, scale: Scale) -> int:
+    rng = np.random.default_rng(scale.seed + 1)
+    days = business_days(scale.start, scale.end + timedelta(days=400))  # room for the longest holding period
+    mkt = rng.normal(0.0003, 0.01, size=len(days))
+    tickers = [BENCHMARK] + ticker_names(scale.tickers)
+    written, step = 0, max(1, CHUNK // len(days))
+    dates = days.astype(object)
+    for lo in range(0, len(tickers), step):
+        block = tickers[lo:lo + step]
+        beta = rng.uniform(0.5, 1.5, size=len(block))
+        rets = mkt[:, None] * beta[None, :] + rng.normal(0.0001, 0.015, size=(len(days), len(block)))
+        if lo == 0: rets[:, 0] = mkt
+        px = 50.0 * np.cumprod(1 + rets, axis=0)
+        _insert(engine, PriceBar.__table__, [{"ticker": t, "date": dates[i], "close": float(px[i, j])}
+                                              for j, t in enumerate(block) for i in range(len(days))])
+        written += len(block) * len(days)
+    return written
+
+def trade_records(scale: Scale, n: Optional[int] = None, seed_offset: int = 2) -> Iterator[Dict[str, Any]]:
+    """Trades as connector-style record dicts (the shape `ingest.persist_records` consumes)."""
+    rng = np.random.default_rng(scale.seed + seed_offset)
+    tickers = ticker_names(scale.tickers)
+    issuers = issuer_names(tickers, np.random.default_rng(scale.seed + 3))
+    chambers = [c.value for c in official_chambers(scale)]
+    n = scale.trades if n is None else n
+    span = (scale.end - scale.start).days
+    # heavy-tailed popularity: a few officials/tickers account for most trades
+    off_p = 1.0 / np.arange(1, scale.officials + 1) ** 0.8; off_p /= off_p.sum()
+    tk_p = 1.0 / np.arange(1, len(tickers) + 1) ** 1.1; tk_p /= tk_p.sum()
+    for lo in range(0, n, CHUNK):
+        m = min(CHUNK, n - lo)
+        offs = rng.choice(scale.officials, size=m, p=off_p)
+        tks = rng.choice(len(tickers), size=m, p=tk_p)
+        txs = rng.choice(3, size=m, p=[0.55, 0.4, 0.05])
+        days = rng.integers(0, span, size=m); lag = rng.integers(1, 46, size=m)
+        lo_amt = rng.choice([1001, 15001, 50001, 100001, 250001], size=m)
+        for o, t, x, d, l, a in zip(offs, tks, txs, days, lag, lo_amt):
+            td = scale.start + timedelta(days=int(d))
+            yield {"official_id": int(o) + 1, "official_name": f"Official {int(o) + 1:05d}", "chamber": chambers[o],
+                   "ticker": tickers[t], "issuer": issuers[t], "transaction_type": ("buy", "sell", "exchange")[x],
+                   "owner": "self", "trade_date": td, "reported_date": td + timedelta(days=int(l)),
+                   "amount_min": float(a), "amount_max": float(a) * 2 - 1, "filing_url": ""}
+
+def gen_trades(engine: Engine, scale: Scale) -> int:
+    written, batch = 0, []
+    for r in trade_records(scale):
+        batch.append({"official_id": r["official_id"], "ticker": r["ticker"], "issuer": r["issuer"],
+                      "transaction_type": TxType(r["transaction_type"]), "owner": Owner.self, "trade_date": r["trade_date"],
+                      "reported_date": r["reported_date"], "amount_min": r["amount_min"], "amount_max": r["amount_max"], "filing_url": ""})
+        if len(batch) >= CHUNK:
+            _insert(engine, Trade.__table__, batch); written += len(batch); batch = []
+    _insert(engine, Trade.__table__, batch)
+    return written + len(batch)
+
+def generate(engine: Engine, scale: Scale) -> Dict[str, int]:
+    """Populate an empty database; returns row counts per table."""
+    return {"officials": gen_officials(engine, scale), "prices": gen_prices(engine, scale), "trades": gen_trades(engine, scale)}
@@ -2,8 +2,9 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from .config import env
+from .instrumentation import instrument_engine
 
 DATABASE_URL = env("DATABASE_URL", "sqlite:///./otp.db")
 connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, connect_args=connect_args)
+engine = instrument_engine(create_engine(DATABASE_URL, pool_pre_ping=True, connect_args=connect_args))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
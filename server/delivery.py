@@ -0,0 +1,125 @@
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from collections import defaultdict
+from urllib.parse import urlsplit
+import asyncio, os, threading, time, weakref
+from contextvars import ContextVar
+import httpx
+from prometheus_client import Counter, Histogram
+from .email_service import send_email
+from .digests import send_digest
+
+# Alert delivery stage: one pooled HTTP client per event loop, a global concurrency bound, a minimum interval
+# between requests to the same webhook host, and one digest email per recipient when several
+# alerts fire for the same user. Notifications are the dicts built by `alerts.evaluate_rules`.
+
+DELIVERY_SECONDS = Histogram("otp_alert_delivery_seconds", "Alert delivery latency (s)", ["channel"], registry=None)
+DELIVERY_TOTAL = Counter("otp_alert_deliveries_total", "Alert deliveries", ["channel", "status"], registry=None)
+
+def concurrency() -> int:
+    return max(1, int(os.environ.get("ALERT_DELIVERY_CONCURRENCY", "16")))
+
+def host_rate() -> float:
+    """Webhook requests per second per destination host (0 = unlimited)."""
+    return float(os.environ.get("ALERT_WEBHOOK_RATE_PER_HOST", "5"))
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+_scoped: ContextVar[Optional[httpx.AsyncClient]] = ContextVar("otp_http_client", default=None)
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(timeout=10.0, limits=httpx.Limits(max_connections=concurrency() * 2, max_keepalive_connections=concurrency()))
+
+def http_client() -> httpx.AsyncClient:
+    """Pooled AsyncClient for the running event loop (clients can't cross loops), or the one
+    opened by `run_sync` for the current call."""
+    scoped = _scoped.get()
+    if scoped is not None: return scoped
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            client = _clients[loop] = _new_client()
+        return client
+
+async def close_http_client():
+    with _clients_lock:
+        client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+def run_sync(make: Callable[[], Awaitable[Any]]) -> Any:
+    """asyncio.run(make()) for sync callers; http_client() inside it is a client closed before the loop ends."""
+    async def main():
+        async with _new_client() as client:
+            token = _scoped.set(client)
+            try:
+                return await make()
+            finally:
+                _scoped.reset(token)
+    return asyncio.run(main())
+
+class HostLimiter:
+    """Spaces requests to the same host at least 1/rate seconds apart."""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_at: Dict[str, float] = defaultdict(float)
+
+    async def wait(self, host: str):
+        if not self.interval: return
+        now = time.monotonic()
+        at = max(now, self.next_at[host])
+        self.next_at[host] = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+_limiter: Optional[HostLimiter] = None
+
+def host_limiter() -> HostLimiter:
+    # process-wide, so the per-host spacing holds across deliver() calls
+    global _limiter
+    if _limiter is None: _limiter = HostLimiter(host_rate())
+    return _limiter
+
+async def _timed(channel: str, coro) -> bool:
+    t0 = time.perf_counter()
+    try:
+        ok = bool(await coro)
+    except Exception:
+        ok = False
+    DELIVERY_SECONDS.labels(channel=channel).observe(time.perf_counter() - t0)
+    DELIVERY_TOTAL.labels(channel=channel, status="ok" if ok else "failed").inc()
+    return ok
+
+async def _post(client: httpx.AsyncClient, url: str, payload: Dict[str, Any]) -> bool:
+    r = await client.post(url, json=payload)
+    return r.status_code // 100 == 2
+
+async def _email(to: str, notes: List[Dict[str, Any]]) -> bool:
+    if len(notes) == 1:
+        return await send_email(to, f"OTP Alert: {notes[0]['name']}", notes[0]["text"])
+    await send_digest(to, [{"title": n["name"], "value": n["text"]} for n in notes], subject=f"OTP Alerts: {len(notes)} rules triggered")
+    return True
+
+async def deliver(notes: List[Dict[str, Any]], client: Optional[httpx.AsyncClient] = None) -> Dict[str, int]:
+    """Send all notifications concurrently; returns {"ok": n, "failed": m}."""
+    client = client or http_client()
+    sem = asyncio.Semaphore(concurrency())
+    limiter = host_limiter()
+    by_email: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    jobs = []
+
+    async def bounded(channel: str, make, host: Optional[str] = None):
+        if host is not None: await limiter.wait(host)  # before taking a slot, so a slow host doesn't starve others
+        async with sem:
+            return await _timed(channel, make())
+
+    for n in notes:
+        if n["delivery"] == "email":
+            by_email[n["email"]].append(n)
+        elif n["delivery"] == "webhook" and n.get("webhook_url"):
+            jobs.append(bounded("webhook", lambda n=n: _post(client, n["webhook_url"], {"text": n["text"]}), urlsplit(n["webhook_url"]).netloc))
+    for to, items in by_email.items():
+        jobs.append(bounded("email" if len(items) == 1 else "digest", lambda to=to, items=items: _email(to, items)))
+    results = await asyncio.gather(*jobs)
+    return {"ok": sum(results), "failed": len(results) - sum(results)}
@@ -0,0 +1,137 @@
+
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from datetime import date, timedelta
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import func, type_coerce, String, select
+from sqlalchemy.orm import Session
+from .models import Trade, Official
+from .backtest import SIDES, filtered_trades_stmt
+from .prices import PriceMatrix, load_price_matrix, empty_matrix
+
+# Per-trade cumulative abnormal returns (CAR) vs. a benchmark around an event date.
+# Day 0 is the first trading day on/after the anchor date; offsets are in trading days.
+# Abnormal return = side * (stock daily return - benchmark daily return), so sells are
+# scored as shorts, consistent with the backtest model.
+
+ANCHORS = {"trade_date": Trade.trade_date, "reported_date": Trade.reported_date}
+GROUPS = ("official", "ticker", "chamber")
+CHUNK = 250_000  # trades per vectorized block; bounds the (n x window) working set
+
+def load_event_trades(db: Session, anchor: str = "trade_date", chamber: Optional[str] = None, tx_filter: Optional[str] = None,
+                      start_date=None, end_date=None, sectors: Optional[list] = None) -> Dict[str, np.ndarray]:
+    col = ANCHORS[anchor]
+    stmt = filtered_trades_stmt(Trade.official_id, func.upper(Trade.ticker), type_coerce(Trade.transaction_type, String), col,
+                                type_coerce(Official.chamber, String),
+                                chamber=chamber, tx_filter=tx_filter, start_date=start_date, end_date=end_date, sectors=sectors)
+    rows = db.execute(stmt.where(col.is_not(None))).all()
+    cols = list(zip(*rows)) if rows else [(), (), (), (), ()]
+    tx = np.array(cols[2], dtype=str)
+    return {
+        "official": np.array([o or 0 for o in cols[0]], dtype=np.int64),
+        "ticker": np.array(cols[1], dtype=str),
+        "side": np.where(tx == "buy", SIDES["buy"], SIDES["sell"]).astype(float),
+        "event_date": np.array(cols[3], dtype="datetime64[D]"),
+        "chamber": np.array([c or "" for c in cols[4]], dtype=str),
+    }
+
+def excess_returns(prices: PriceMatrix, benchmark: str) -> Optional[np.ndarray]:
+    """Daily (T x N) returns in excess of the benchmark; row 0 is NaN."""
+    bench = prices.column(benchmark)
+    if bench is None or len(prices) < 2:
+        return None
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret = prices.closes[1:] / prices.closes[:-1] - 1.0
+        bret = bench[1:] / bench[:-1] - 1.0
+    out = np.full(prices.closes.shape, np.nan)
+    out[1:] = ret - bret[:, None]
+    return out
+
+def car_matrix(trades: Dict[str, np.ndarray], prices: PriceMatrix, excess: np.ndarray, pre: int, post: int,
+               rows: slice = slice(None)) -> Tuple[np.ndarray, np.ndarray]:
+    """CAR curves (n x window) for trades[rows] plus the mask of trades with a complete window.
+
+    All windows are gathered at once from a strided (T-W+1, N, W) view of the excess-return matrix.
+    """
+    W = post - pre + 1
+    tick = trades["ticker"][rows]
+    n = len(tick)
+    if n == 0 or excess is None or excess.shape[0] < W:
+        return np.empty((0, W)), np.zeros(n, dtype=bool)
+    uniq, inv = np.unique(tick, return_inverse=True)
+    cols = np.array([prices.col.get(t, -1) for t in uniq], dtype=int)[inv]
+    day0 = np.searchsorted(prices.dates, trades["event_date"][rows], side="left")
+    first = day0 + pre
+    ok = (cols >= 0) & (first >= 1) & (day0 + post < excess.shape[0])
+    windows = sliding_window_view(excess, W, axis=0)  # (T-W+1, N, W), no copy
+    win = windows[first[ok], cols[ok]]
+    good = ~np.isnan(win).any(axis=1)
+    car = np.cumsum(win[good] * trades["side"][rows][ok][good, None], axis=1)
+    mask = np.zeros(n, dtype=bool)
+    mask[np.flatnonzero(ok)[good]] = True
+    return car, mask
+
+def event_study(trades: Dict[str, np.ndarray], prices: PriceMatrix, benchmark: str = "SPY", pre: int = -5, post: int = 30,
+                group_by: Sequence[str] = GROUPS) -> Dict[str, Any]:
+    """Mean CAR curves overall and per group for one event window."""
+    if pre > 0 or post < 0:
+        raise ValueError("window must contain day 0")
+    W = post - pre + 1
+    excess = excess_returns(prices, benchmark)
+    n = len(trades["ticker"])
+    keys = {g: np.unique(trades[g], return_inverse=True) for g in group_by}
+    sums = {g: np.zeros((len(u), W)) for g, (u, _) in keys.items()}
+    counts = {g: np.zeros(len(u), dtype=np.int64) for g, (u, _) in keys.items()}
+    total, used = np.zeros(W), 0
+    for lo in range(0, n, CHUNK):
+        rows = slice(lo, min(lo + CHUNK, n))
+        car, mask = car_matrix(trades, prices, excess, pre, post, rows)
+        if not len(car): continue
+        total += car.sum(axis=0); used += len(car)
+        for g, (_, inv) in keys.items():
+            gi = inv[rows][mask]
+            np.add.at(sums[g], gi, car)
+            counts[g] += np.bincount(gi, minlength=len(counts[g]))
+    out: Dict[str, Any] = {"offsets": list(range(pre, post + 1)), "trades": used,
+                           "car": (total / used).round(6).tolist() if used else [], "groups": {}}
+    for g, (uniq, _) in keys.items():
+        has = counts[g] > 0
+        mean = sums[g][has] / counts[g][has][:, None]
+        order = np.argsort(-mean[:, -1], kind="stable") if len(mean) else []
+        labels = uniq[has]
+        out["groups"][g] = [{"key": labels[i].item(), "n": int(counts[g][has][i]), "final_car": round(float(mean[i, -1]), 6),
+                             "car": mean[i].round(6).tolist()} for i in order]
+    return out
+
+def load_event_prices(db: Session, trades: Dict[str, np.ndarray], benchmark: str, pre: int, post: int) -> PriceMatrix:
+    if not len(trades["ticker"]):
+        return empty_matrix()
+    # trading-day offsets -> generous calendar padding
+    start = trades["event_date"].min().astype(date) - timedelta(days=2 * -pre + 10)
+    end = trades["event_date"].max().astype(date) + timedelta(days=2 * post + 10)
+    return load_price_matrix(db, set(np.unique(trades["ticker"]).tolist()) | {benchmark.upper()}, start, end)
+
+def attach_official_names(db: Session, result: Dict[str, Any]) -> Dict[str, Any]:
+    items = result.get("groups", {}).get("official")
+    if items:
+        ids = [it["key"] for it in items]
+        names = dict(db.execute(select(Official.id, Official.name).where(Official.id.in_(ids))).all())
+        for it in items:
+            it["name"] = names.get(it["key"])
+    return result
+
+def event_study_from_db(db: Session, anchor: str = "trade_date", pre: int = -5, post: int = 30, benchmark: str = "SPY",
+                        group_by: Sequence[str] = GROUPS, limit: Optional[int] = None, **filters) -> Dict[str, Any]:
+    if anchor not in ANCHORS:
+        raise ValueError("anchor must be trade_date|reported_date")
+    if any(g not in GROUPS for g in group_by):
+        raise ValueError("group_by must be official|ticker|chamber")
+    if pre > 0 or post < 0:
+        raise ValueError("window must contain day 0")
+    trades = load_event_trades(db, anchor=anchor, **filters)
+    res = event_study(trades, load_event_prices(db, trades, benchmark, pre, post), benchmark=benchmark, pre=pre, post=post, group_by=group_by)
+    if limit:
+        res["groups"] = {g: items[:limit] for g, items in res["groups"].items()}
+    res.update({"anchor": anchor, "benchmark": benchmark})
+    return attach_official_names(db, res)
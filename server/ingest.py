@@ -1,6 +1,6 @@
 
 from __future__ import annotations
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from datetime import datetime, date
 from sqlalchemy.orm import Session
 from sqlalchemy import select, and_
@@ -9,6 +9,7 @@ from dateutil import parser as dateparser
 from .models import Official, Trade, Chamber, TxType, Owner, TradeSource
 import json
 from . import storage_s3
+from .instrumentation import StageTimer, INGEST_ROWS
 
 def parse_amount_range(txt: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
     if not txt: return (None, None)
@@ -52,65 +53,124 @@ def trade_exists(db: Session, official_id: int, trade_date: Optional[date], tick
     )).limit(1)
     return db.execute(stmt).first() is not None
 
+# Callbacks run after persist_records commits, with the session and one dict per added trade
+# (see `trade_event`; plain values, so listeners don't reload expired rows). Listener errors are
+# logged and never fail the ingest.
+TradeListener = Callable[[Session, List[Dict[str, Any]]], Any]
+_listeners: List[TradeListener] = []
+
+def add_trade_listener(fn: TradeListener) -> TradeListener:
+    if fn not in _listeners: _listeners.append(fn)
+    return fn
+
+def remove_trade_listener(fn: TradeListener):
+    if fn in _listeners: _listeners.remove(fn)
+
+def trade_event(tr: Trade) -> Dict[str, Any]:
+    return {"id": tr.id, "official_id": tr.official_id, "ticker": (tr.ticker or "").upper(), "issuer": tr.issuer or "",
+            "transaction_type": tr.transaction_type.value, "trade_date": tr.trade_date, "reported_date": tr.reported_date}
+
+def emit_new_trades(db: Session, trades: List[Dict[str, Any]]):
+    for fn in list(_listeners):
+        try:
+            fn(db, trades)
+        except Exception as e:
+            db.rollback()
+            print("trade listener error", getattr(fn, "__name__", fn), e)
+
 def persist_records(db: Session, records: List[Dict[str, Any]], source_url: str | None = None) -> int:
     """
     Records keys: official_name, chamber ('house'|'senate'|'other'), ticker|issuer, transaction_type ('buy'|'sell'|...),
     owner, amount, amount_min, amount_max, trade_date, reported_date, filing_url
     """
     added = 0
+    touched = set()
+    new_trades: List[Dict[str, Any]] = []
+    timer = StageTimer()
     for r in records:
-        name = (r.get("official_name") or "").strip()
-        chamber = (r.get("chamber") or "other").strip()
-        if not name:
-            name = "Unknown"
-        off = upsert_official(db, name, chamber, r.get("state"))
-        tx_str = (r.get("transaction_type") or "unknown").lower()
-        try:
-            tx = TxType(tx_str) if tx_str in TxType.__members__ else TxType[tx_str]  # allow enum name
-        except Exception:
-            tx = TxType.buy if "buy" in tx_str else (TxType.sell if "sell" in tx_str else TxType.unknown)
-        own_str = (r.get("owner") or "unknown").lower()
-        try:
-            owner = Owner[own_str] if own_str in Owner.__members__ else Owner.unknown
-        except Exception:
-            owner = Owner.unknown
-        trade_date = r.get("trade_date")
-        if isinstance(trade_date, str):
-            trade_date = parse_date(trade_date)
-        reported_date = r.get("reported_date")
-        if isinstance(reported_date, str):
-            reported_date = parse_date(reported_date)
-        amount_min, amount_max = r.get("amount_min"), r.get("amount_max")
-        if (amount_min, amount_max) == (None, None) and r.get("amount"):
-            amount_min, amount_max = parse_amount_range(r.get("amount"))
-        ticker = r.get("ticker") or ""
-        issuer = r.get("issuer") or ""
-        if trade_exists(db, off.id, trade_date, ticker, issuer, tx):
+        with timer.stage("normalize"):
+            name = (r.get("official_name") or "").strip()
+            chamber = (r.get("chamber") or "other").strip()
+            if not name:
+                name = "Unknown"
+            tx_str = (r.get("transaction_type") or "unknown").lower()
+            try:
+                tx = TxType(tx_str) if tx_str in TxType.__members__ else TxType[tx_str]  # allow enum name
+            except Exception:
+                tx = TxType.buy if "buy" in tx_str else (TxType.sell if "sell" in tx_str else TxType.unknown)
+            own_str = (r.get("owner") or "unknown").lower()
+            try:
+                owner = Owner[own_str] if own_str in Owner.__members__ else Owner.unknown
+            except Exception:
+                owner = Owner.unknown
+            trade_date = r.get("trade_date")
+            if isinstance(trade_date, str):
+                trade_date = parse_date(trade_date)
+            reported_date = r.get("reported_date")
+            if isinstance(reported_date, str):
+                reported_date = parse_date(reported_date)
+            amount_min, amount_max = r.get("amount_min"), r.get("amount_max")
+            if (amount_min, amount_max) == (None, None) and r.get("amount"):
+                amount_min, amount_max = parse_amount_range(r.get("amount"))
+            ticker = r.get("ticker") or ""
+            issuer = r.get("issuer") or ""
+        with timer.stage("official"):
+            off = upsert_official(db, name, chamber, r.get("state"))
+        with timer.stage("dedupe"):
+            exists = trade_exists(db, off.id, trade_date, ticker, issuer, tx)
+        if exists:
             continue
-        tr = Trade(
-            official_id=off.id,
-            filing_url=r.get("filing_url") or "",
-            transaction_type=tx,
-            owner=owner,
-            trade_date=trade_date,
-            reported_date=reported_date,
-            ticker=ticker,
-            issuer=issuer,
-            amount_min=amount_min,
-            amount_max=amount_max
-        )
-        db.add(tr); db.flush(); added += 1
+        with timer.stage("insert"):
+            tr = Trade(
+                official_id=off.id,
+                filing_url=r.get("filing_url") or "",
+                transaction_type=tx,
+                owner=owner,
+                trade_date=trade_date,
+                reported_date=reported_date,
+                ticker=ticker,
+                issuer=issuer,
+                amount_min=amount_min,
+                amount_max=amount_max
+            )
+            db.add(tr); db.flush(); added += 1
+            touched.add(off.id); new_trades.append(trade_event(tr))
         # provenance snapshot
-        try:
-            src = TradeSource(trade_id=tr.id, source=(r.get('source') or ''), source_url=(r.get('source_url') or source_url or ''), raw_json=json.dumps(r))
+        with timer.stage("provenance"):
             try:
-                s3k = storage_s3.put_json(r, key_hint='trade')
-                if s3k:
-                    src.raw_json = json.dumps({"local": r, "s3_key": s3k})
+                src = TradeSource(trade_id=tr.id, source=(r.get('source') or ''), source_url=(r.get('source_url') or source_url or ''), raw_json=json.dumps(r))
+                try:
+                    s3k = storage_s3.put_json(r, key_hint='trade')
+                    if s3k:
+                        src.raw_json = json.dumps({"local": r, "s3_key": s3k})
+                except Exception:
+                    pass
+                db.add(src)
             except Exception:
                 pass
-            db.add(src)
-        except Exception:
-            pass
-    db.commit()
+    with timer.stage("commit"):
+        db.commit()
+    INGEST_ROWS.labels(outcome="received").inc(len(records))
+    INGEST_ROWS.labels(outcome="inserted").inc(added)
+    INGEST_ROWS.labels(outcome="duplicate").inc(len(records) - added)
+    # classify new issuers, then keep the materialized risk scores current for the officials that got new trades
+    if touched:
+        with timer.stage("issuer_sectors"):
+            try:
+                from .sectors import issuer_table_enabled, sync_issuer_sectors
+                if issuer_table_enabled(): sync_issuer_sectors(db, {r.get("issuer") or "" for r in records})
+            except Exception as e:
+                db.rollback()
+                print("issuer sector sync error", e)
+        with timer.stage("risk_scores"):
+            try:
+                from .risk import refresh_risk_scores
+                refresh_risk_scores(db, touched)
+            except Exception as e:
+                db.rollback()
+                print("risk score refresh error", e)
+    if new_trades:
+        with timer.stage("listeners"):
+            emit_new_trades(db, new_trades)
+    timer.observe()
     return added
@@ -0,0 +1,223 @@
+
+from typing import Any, Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+import os, re, time, uuid
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import GaugeMetricFamily
+
+# Hot-path metrics. Collectors are created unregistered and attached to the app REGISTRY by
+# metrics_extra.init; the worker supervisor registers the job ones on its own endpoint.
+
+SQL_QUERIES = Counter("otp_db_queries_total", "SQL statements executed", ["fingerprint"], registry=None)
+SQL_SECONDS = Histogram("otp_db_query_seconds", "SQL statement latency (s)", ["fingerprint"],
+                        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5), registry=None)
+POOL_WAIT = Histogram("otp_db_pool_checkout_seconds", "Time to check a connection out of the pool (s)",
+                      buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30), registry=None)
+REQUEST_QUERIES = Histogram("otp_http_request_db_queries", "SQL statements per HTTP request", ["method", "path"],
+                            buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000), registry=None)
+INGEST_SECONDS = Histogram("otp_ingest_stage_seconds", "Ingest stage duration per batch (s)", ["stage"], registry=None)
+INGEST_ROWS = Counter("otp_ingest_rows_total", "Ingest records by outcome", ["outcome"], registry=None)
+JOB_WAIT = Histogram("otp_job_queue_wait_seconds", "Time jobs spent queued before they started (s)", ["queue"],
+                     buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800), registry=None)
+JOB_RUN = Histogram("otp_job_run_seconds", "Job run time (s)", ["func", "status"],
+                    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800), registry=None)
+
+def env_buckets(key: str, default: Tuple[float, ...]) -> Tuple[float, ...]:
+    """Histogram buckets from a comma-separated env var, e.g. HTTP_LATENCY_BUCKETS=0.01,0.05,0.1,0.5,1."""
+    raw = os.environ.get(key, "")
+    try:
+        return tuple(sorted(float(b) for b in raw.split(",") if b.strip())) or default
+    except ValueError:
+        print(f"ignoring invalid {key}={raw!r}")
+        return default
+
+# --- HTTP ---
+
+UNMATCHED = "<unmatched>"
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.4, 0.6, 1, 1.5, 2.5, 5, 10, 30)
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+def route_label(scope) -> str:
+    """Route template for metric labels, so label values are bounded by the route table; `<unmatched>` otherwise."""
+    route = scope.get("route")
+    if route is None and scope.get("app") is not None:  # not routed yet, e.g. rejected by the rate limiter
+        from starlette.routing import Match
+        partial = None
+        for r in scope["app"].router.routes:
+            match, _ = r.matches(scope)
+            if match == Match.FULL: route = r; break
+            if match == Match.PARTIAL and partial is None: partial = r
+        route = route or partial
+    path = getattr(route, "path", None)
+    if path is None: return UNMATCHED
+    from starlette.routing import Mount
+    return path + "/{path:path}" if isinstance(route, Mount) else path
+
+def request_id(header: Optional[str]) -> str:
+    """The caller's X-Request-ID when it is a sane token, else a fresh one."""
+    return header if header and _REQUEST_ID.match(header) else uuid.uuid4().hex
+
+def slow_request_seconds() -> float:
+    return float(os.environ.get("HTTP_SLOW_SECONDS", "1.0"))
+
+def exemplars_enabled() -> bool:
+    return os.environ.get("HTTP_EXEMPLARS", "1") == "1"
+
+# --- SQL ---
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+_seen: set = set()
+
+def max_fingerprints() -> int:
+    return int(os.environ.get("SQL_FINGERPRINT_MAX", "500"))
+
+@lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """Statement with literals and IN-lists collapsed to `?`, so one query shape is one label."""
+    s = _STRING.sub("?", statement)
+    s = _NUMBER.sub("?", s)
+    s = _SPACE.sub(" ", s.replace("%s", "?")).strip()
+    s = _LIST.sub("(?)", s)
+    return s[:200]
+
+def _label(statement: str) -> str:
+    fp = fingerprint(statement)
+    if fp in _seen: return fp
+    if len(_seen) >= max_fingerprints(): return "other"  # keep label cardinality bounded
+    _seen.add(fp)
+    return fp
+
+_request_queries: ContextVar[Optional[List[int]]] = ContextVar("otp_request_queries", default=None)
+
+def _before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("otp_query_start", []).append(time.perf_counter())
+
+def _after(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("otp_query_start")
+    if not starts: return
+    dur = time.perf_counter() - starts.pop()
+    label = _label(statement)
+    SQL_QUERIES.labels(fingerprint=label).inc()
+    SQL_SECONDS.labels(fingerprint=label).observe(dur)
+    counter = _request_queries.get()
+    if counter is not None: counter[0] += 1
+
+def _error(ctx):
+    starts = ctx.connection.info.get("otp_query_start") if ctx.connection is not None else None
+    if starts: starts.pop()
+
+def instrument_engine(engine):
+    """Statement count/latency by fingerprint and pool checkout wait for `engine` (idempotent)."""
+    from sqlalchemy import event
+    if getattr(engine, "_otp_instrumented", False): return engine
+    event.listen(engine, "before_cursor_execute", _before)
+    event.listen(engine, "after_cursor_execute", _after)
+    event.listen(engine, "handle_error", _error)
+    raw = engine.raw_connection  # every Connection checks out through here, also after pool.recreate()
+
+    def timed_raw_connection(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return raw(*a, **kw)
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - t0)
+
+    engine.raw_connection = timed_raw_connection
+    engine._otp_instrumented = True
+    return engine
+
+# --- per-request query counts ---
+
+def query_warn_threshold() -> int:
+    return int(os.environ.get("DB_QUERIES_WARN", "100"))
+
+def start_request_queries():
+    return _request_queries.set([0])
+
+def finish_request_queries(token, method: str, path: str) -> int:
+    n = (_request_queries.get() or [0])[0]
+    _request_queries.reset(token)
+    REQUEST_QUERIES.labels(method=method, path=path).observe(n)
+    if n > query_warn_threshold():
+        print(f"warning: {method} {path} ran {n} SQL statements")
+    return n
+
+# --- ingest ---
+
+class StageTimer:
+    """Accumulates per-stage time over a batch and observes each stage once at the end."""
+    def __init__(self):
+        self.totals: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] = self.totals.get(name, 0.0) + time.perf_counter() - t0
+
+    def observe(self):
+        for name, secs in self.totals.items():
+            INGEST_SECONDS.labels(stage=name).observe(secs)
+
+@contextmanager
+def ingest_stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        INGEST_SECONDS.labels(stage=name).observe(time.perf_counter() - t0)
+
+# --- job queues ---
+
+class QueueDepthCollector:
+    """Scrape-time depth and oldest-job age of the RQ queues (one pipeline), or of the LocalQueue."""
+    def collect(self):
+        depth = GaugeMetricFamily("otp_job_queue_depth", "Queued jobs", labels=["queue"])
+        oldest = GaugeMetricFamily("otp_job_queue_oldest_seconds", "Age of the oldest queued job (s)", labels=["queue"])
+        try:
+            from .tasks import all_queues
+            from .local_queue import QUEUE as LQ
+            queues = all_queues()
+            if not queues:
+                depth.add_metric(["local"], LQ.depth())
+                oldest.add_metric(["local"], LQ.oldest_age())
+            else:
+                self._rq(queues, depth, oldest)
+        except Exception:
+            pass
+        yield depth
+        yield oldest
+
+    def _rq(self, queues, depth, oldest):
+        from rq.job import Job
+        from datetime import datetime, timezone
+        conn = queues[0].connection
+        p = conn.pipeline(transaction=False)
+        for q in queues:
+            p.llen(q.key); p.lindex(q.key, 0)
+        res = p.execute()
+        p = conn.pipeline(transaction=False)
+        heads = [res[2 * i + 1] for i in range(len(queues))]
+        for h in heads:
+            if h: p.hget(Job.key_for(h.decode() if isinstance(h, bytes) else h), "enqueued_at")
+        enq = iter(p.execute())
+        now = datetime.now(timezone.utc)
+        for i, q in enumerate(queues):
+            age = 0.0
+            if heads[i]:
+                raw = next(enq)
+                if raw:
+                    ts = datetime.fromisoformat((raw.decode() if isinstance(raw, bytes) else raw).replace("Z", "+00:00"))
+                    if ts.tzinfo is None: ts = ts.replace(tzinfo=timezone.utc)
+                    age = max(0.0, (now - ts).total_seconds())
+            depth.add_metric([q.name], res[2 * i])
+            oldest.add_metric([q.name], age)
+
+COLLECTORS = (SQL_QUERIES, SQL_SECONDS, POOL_WAIT, REQUEST_QUERIES, INGEST_SECONDS, INGEST_ROWS, JOB_WAIT, JOB_RUN)
@@ -0,0 +1,168 @@
+
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+import asyncio, json, os, threading, weakref
+from starlette.concurrency import run_in_threadpool
+from .local_queue import QUEUE as LQ, LocalJob
+
+# Job status/progress events for the SSE stream. RQ jobs publish on `otp:job:events:{id}` (from
+# _set_progress and the job's success/failure callbacks); LocalQueue jobs go through an
+# in-process notifier fed by the queue's listeners. Subscribers get the current state first, then
+# every change, and the stream ends with an `end` event once all requested jobs are done.
+# Streams never hold a Redis connection of their own: per event loop, one RedisRelay
+# pattern-subscribes to all job channels on a dedicated connection (outside the shared pool)
+# and fans events out through the same notifier. At most SSE_MAX_STREAMS streams are open.
+
+CHANNEL_PREFIX = "otp:job:events:"
+TERMINAL = ("finished", "failed", "stopped", "canceled")
+
+def job_event(job_id: str, status: Any, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    meta = meta or {}
+    return {"id": job_id, "status": str(getattr(status, "value", status) or "unknown"),
+            "progress": meta.get("progress"), "note": meta.get("note")}
+
+def publish_rq(connection, event: Dict[str, Any]):
+    try:
+        connection.publish(CHANNEL_PREFIX + event["id"], json.dumps(event))
+    except Exception as e:
+        print("job event publish error", e)
+
+class LocalNotifier:
+    """Fan-out of LocalQueue job events to asyncio queues; publish() is safe from any thread."""
+    def __init__(self):
+        self.subs: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, job_ids: List[str]) -> asyncio.Queue:
+        sub = (asyncio.get_running_loop(), asyncio.Queue())
+        with self.lock:
+            for jid in job_ids: self.subs.setdefault(jid, set()).add(sub)
+        return sub[1]
+
+    def unsubscribe(self, job_ids: List[str], q: asyncio.Queue):
+        with self.lock:
+            for jid in job_ids:
+                subs = self.subs.get(jid, set())
+                subs.difference_update({s for s in subs if s[1] is q})
+                if not subs: self.subs.pop(jid, None)
+
+    def publish(self, event: Dict[str, Any]):
+        with self.lock:
+            subs = list(self.subs.get(event["id"], ()))
+        for loop, q in subs:
+            try: loop.call_soon_threadsafe(q.put_nowait, event)
+            except RuntimeError: pass  # subscriber's loop closed
+
+NOTIFIER = LocalNotifier()
+
+def max_streams() -> int:
+    return int(os.environ.get("SSE_MAX_STREAMS", "200"))
+
+class StreamSlots:
+    """Open-stream count bounded by SSE_MAX_STREAMS. The handler reserves a slot before it responds;
+    the returned release() is idempotent, so the stream and the response can both call it."""
+    def __init__(self):
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> Optional[Callable[[], None]]:
+        with self.lock:
+            if self.active >= max_streams(): return None
+            self.active += 1
+        done = threading.Event()
+        def release():
+            with self.lock:
+                if done.is_set(): return
+                done.set(); self.active -= 1
+        return release
+
+SLOTS = StreamSlots()
+
+def active_streams() -> int:
+    return SLOTS.active
+
+def _relay_client():
+    import redis.asyncio as aioredis
+    from .redis_client import redis_url
+    return aioredis.Redis.from_url(redis_url())  # own connection: long-lived pubsub stays out of the shared pool
+
+class RedisRelay:
+    """One PSUBSCRIBE for every job channel, feeding NOTIFIER; restarted by `ensure` if it died."""
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.ready: Optional[asyncio.Future] = None
+
+    async def ensure(self):
+        if self.task is None or self.task.done():
+            self.ready = asyncio.get_running_loop().create_future()
+            self.task = asyncio.create_task(self._run(self.ready))
+        await asyncio.shield(self.ready)
+
+    async def _run(self, ready: asyncio.Future):
+        client = _relay_client()
+        pubsub = client.pubsub()
+        try:
+            await pubsub.psubscribe(CHANNEL_PREFIX + "*")
+            ready.set_result(True)
+            while True:
+                msg = await pubsub.get_message(ignore_subscribe_messages=True, timeout=30)
+                if msg: NOTIFIER.publish(json.loads(msg["data"]))
+        except Exception as e:
+            if not ready.done(): ready.set_exception(e)
+            else: print("job event relay error", e)
+        finally:
+            try:
+                await pubsub.aclose(); await client.aclose()
+            except Exception:
+                pass
+
+_relays: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, RedisRelay]" = weakref.WeakKeyDictionary()
+
+def relay() -> RedisRelay:
+    loop = asyncio.get_running_loop()
+    r = _relays.get(loop)
+    if r is None: r = _relays[loop] = RedisRelay()
+    return r
+
+def _on_local_job(job: LocalJob):
+    NOTIFIER.publish(job_event(job.id, job.status, job.meta))
+
+LQ.listeners.append(_on_local_job)
+
+def snapshot(job_ids: List[str], connection=None, local_queue=None) -> List[Dict[str, Any]]:
+    """Current state without loading results; RQ jobs are fetched in one pipeline."""
+    if connection is None:
+        jobs = [(local_queue or LQ).get_job(jid) for jid in job_ids]
+        return [job_event(jid, j.status if j else "unknown", j.meta if j else None) for jid, j in zip(job_ids, jobs)]
+    from rq.job import Job
+    jobs = Job.fetch_many(job_ids, connection=connection)
+    return [job_event(jid, j.get_status(refresh=False) if j else "unknown", j.meta if j else None) for jid, j in zip(job_ids, jobs)]
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"event: job\ndata: {json.dumps(event)}\n\n"
+
+async def stream(job_ids: List[str], connection=None, keepalive: float = 15.0, local_queue=None,
+                 release: Optional[Callable[[], None]] = None) -> AsyncIterator[str]:
+    """SSE frames for `job_ids`. `connection` is the sync RQ Redis connection, or None for the LocalQueue.
+    `release` (from SLOTS.reserve) is called when the stream ends."""
+    pending = set(job_ids)
+    sub = None
+    try:
+        # subscribe before reading the snapshot so no change falls in between
+        sub = NOTIFIER.subscribe(job_ids)
+        if connection is not None: await relay().ensure()
+        for ev in await run_in_threadpool(snapshot, job_ids, connection, local_queue):
+            yield _sse(ev)
+            if ev["status"] in TERMINAL or ev["status"] == "unknown": pending.discard(ev["id"])
+        while pending:
+            try:
+                ev = await asyncio.wait_for(sub.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if ev["id"] not in pending: continue
+            yield _sse(ev)
+            if ev["status"] in TERMINAL: pending.discard(ev["id"])
+        yield "event: end\ndata: {}\n\n"  # tells EventSource not to reconnect
+    finally:
+        if release is not None: release()
+        if sub is not None: NOTIFIER.unsubscribe(job_ids, sub)
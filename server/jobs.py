@@ -1,6 +1,7 @@
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 import os
+from datetime import datetime, timezone
 try:
     from rq import Queue
     RQ_OK = True
@@ -8,7 +9,8 @@ except Exception:
     RQ_OK = False
 from rq.job import Job
 from rq.registry import StartedJobRegistry, FinishedJobRegistry, FailedJobRegistry, ScheduledJobRegistry, DeferredJobRegistry
-from .tasks import get_queue
+from rq.serializers import resolve_serializer
+from .tasks import get_queue, all_queues
 from .local_queue import QUEUE as LQ
 
 def _status_of(job: Job) -> str:
@@ -30,7 +32,7 @@ def job_info(job_id: str) -> Dict[str, Any]:
             "enqueued_at": j.enqueued_at,
             "started_at": j.started_at,
             "ended_at": j.ended_at,
-            "func_name": getattr(j.func, "__name__", str(j.func)),
+            "func_name": j.func_name,
             "args": j.args,
             "kwargs": j.kwargs,
             "result": j.result,
@@ -54,22 +56,105 @@ def job_info(job_id: str) -> Dict[str, Any]:
     }
     return info
 
-def list_jobs(limit: int = 25) -> List[Dict[str, Any]]:
-    q = get_queue()
-    if q is None:
-        return [{"id": jid, "status": LQ.get_job(jid).status} for jid in LQ.list_job_ids()[:limit]]
-    registries = [
-        ("queued", [j.id for j in q.jobs]),
-        ("started", StartedJobRegistry(queue=q).get_job_ids()),
-        ("finished", FinishedJobRegistry(queue=q).get_job_ids()),
-        ("failed", FailedJobRegistry(queue=q).get_job_ids()),
-        ("scheduled", ScheduledJobRegistry(queue=q).get_job_ids()),
-        ("deferred", DeferredJobRegistry(queue=q).get_job_ids()),
-    ]
+# Job index for the Jobs table. Sources are read in STATUS_ORDER, queue by queue; the finished
+# and failed registries newest first. Without a function filter a page costs three round trips:
+# counts (LLEN/ZCARD), the id ranges covering the page, and one HMGET per job, each pipelined.
+# With `func`, ids are scanned in chunks and filtered (at most SCAN_LIMIT ids).
+
+STATUS_ORDER = ("started", "queued", "deferred", "scheduled", "failed", "finished")
+REGISTRIES = {"started": StartedJobRegistry, "deferred": DeferredJobRegistry, "scheduled": ScheduledJobRegistry,
+              "failed": FailedJobRegistry, "finished": FinishedJobRegistry}
+FIELDS = ("status", "description", "origin", "created_at", "enqueued_at", "started_at", "ended_at", "meta")
+SCAN_CHUNK = 500
+SCAN_LIMIT = 5000
+
+def func_from_description(desc: Optional[str]) -> str:
+    """'server.tasks.backtest_task(30, 'SPY')' -> 'backtest_task'."""
+    return (desc or "").split("(", 1)[0].rsplit(".", 1)[-1]
+
+def _iso(ts) -> Optional[str]:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+def _sources(status: Optional[str]) -> List[Tuple[str, str, Any]]:
+    out = []
+    for st in STATUS_ORDER:
+        if status and st != status: continue
+        for q in all_queues():
+            out.append((st, q.name, q if st == "queued" else REGISTRIES[st](queue=q)))
+    return out
+
+def _ids(conn, sources, counts, start: int, n: int) -> List[Tuple[str, str, str]]:
+    """(job id, status, queue) at global positions [start, start + n), one pipelined round trip."""
+    want, pos = [], 0
+    for src, cnt in zip(sources, counts):
+        lo, hi = max(start, pos), min(start + n, pos + cnt)
+        if lo < hi: want.append((src, lo - pos, hi - pos - 1))
+        pos += cnt
+        if pos >= start + n: break
+    if not want: return []
+    p = conn.pipeline(transaction=False)
+    for (st, _, obj), lo, hi in want:
+        if st == "queued": p.lrange(obj.key, lo, hi)
+        else: p.zrange(obj.key, lo, hi, desc=st in ("finished", "failed"))
+    out = []
+    for ((st, qname, obj), _, _), raw in zip(want, p.execute()):
+        for r in raw:
+            jid = r.decode() if isinstance(r, bytes) else r
+            out.append((jid if st == "queued" else obj.parse_job_id(jid), st, qname))
+    return out
+
+def _rows(conn, ids: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+    p = conn.pipeline(transaction=False)
+    for jid, _, _ in ids: p.hmget(Job.key_for(jid), *FIELDS)
+    ser = resolve_serializer()
     out = []
-    for status, ids in registries:
-        for j in ids[:limit]:
-            out.append({"id": j, "status": status})
-            if len(out) >= limit:
-                return out
+    for (jid, st, qname), vals in zip(ids, p.execute()):
+        v = {k: (x.decode() if isinstance(x, bytes) and k != "meta" else x) for k, x in zip(FIELDS, vals)}
+        if v["description"] is None and v["status"] is None: continue  # job expired between the two reads
+        try: meta = ser.loads(v["meta"]) if v["meta"] else {}
+        except Exception: meta = {}
+        out.append({"id": jid, "status": v["status"] or st, "queue": v["origin"] or qname,
+                    "func_name": func_from_description(v["description"]), "created_at": v["created_at"] or None,
+                    "enqueued_at": v["enqueued_at"] or None, "started_at": v["started_at"] or None, "ended_at": v["ended_at"] or None,
+                    "progress": meta.get("progress"), "note": meta.get("note")})
     return out
+
+def _local_page(offset: int, limit: int, status: Optional[str], func: Optional[str]) -> Dict[str, Any]:
+    jobs = [j for j in (LQ.get_job(jid) for jid in LQ.list_job_ids()) if j is not None]  # skip jobs evicted meanwhile
+    jobs = [j for j in jobs if (not status or j.status == status) and (not func or func in j.func_name)]
+    rank = {s: i for i, s in enumerate(STATUS_ORDER)}
+    jobs.sort(key=lambda j: (rank.get(j.status, len(rank)), -(j.ended_at or j.enqueued_at or 0) if j.status in ("finished", "failed") else j.enqueued_at))
+    page = jobs[offset:offset + limit]
+    items = [{"id": j.id, "status": j.status, "queue": "local", "func_name": j.func_name, "created_at": _iso(j.created_at),
+              "enqueued_at": _iso(j.enqueued_at), "started_at": _iso(j.started_at), "ended_at": _iso(j.ended_at),
+              "progress": j.meta.get("progress"), "note": j.meta.get("note")} for j in page]
+    return {"items": items, "total": len(jobs), "next_offset": offset + limit if offset + limit < len(jobs) else None}
+
+def list_jobs(limit: int = 25, offset: int = 0, status: Optional[str] = None, func: Optional[str] = None) -> Dict[str, Any]:
+    """One page of jobs: {"items", "total", "next_offset"}; `total` is None when filtering by function."""
+    if status and status not in STATUS_ORDER:
+        raise ValueError(f"status must be one of {', '.join(STATUS_ORDER)}")
+    q = get_queue()
+    if q is None:
+        return _local_page(offset, limit, status, func)
+    conn = q.connection
+    sources = _sources(status)
+    p = conn.pipeline(transaction=False)
+    for st, _, obj in sources:
+        if st == "queued": p.llen(obj.key)
+        else: p.zcard(obj.key)
+    counts = p.execute()
+    total = sum(counts)
+    if not func:
+        items = _rows(conn, _ids(conn, sources, counts, offset, limit))
+        return {"items": items, "total": total, "next_offset": offset + limit if offset + limit < total else None}
+    items, seen, pos, more = [], 0, 0, False
+    while pos < min(total, SCAN_LIMIT) and not more:
+        for row in _rows(conn, _ids(conn, sources, counts, pos, SCAN_CHUNK)):
+            if func not in row["func_name"]: continue
+            seen += 1
+            if seen <= offset: continue
+            if len(items) < limit: items.append(row)
+            else: more = True; break
+        pos += SCAN_CHUNK
+    return {"items": items, "total": None, "next_offset": offset + limit if more else None}
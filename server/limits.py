@@ -1,16 +1,144 @@
 
+from typing import Any, Dict, Optional, Tuple
+import os, time
 from fastapi import Request
-from .redis_client import get_redis
-from .rbac import get_plan
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from prometheus_client import Counter, Histogram
+from .redis_client import get_async_redis, redis_available, redis_health
+from .rbac import get_plan, PLANS
+from .db import SessionLocal
 from .security import current_user_email
 
-async def enforce_rate_limit(request: Request):
-    try:
-        r = get_redis()
-        ip = request.client.host if request.client else "unknown"
-        key = f"ratelimit:{ip}:{request.url.path}"
-        val = r.incr(key)
-        if val == 1:
-            r.expire(key, 60)
-    except Exception:
-        pass
+# Token bucket per (user, client IP): refills at the plan's api_rate_per_min and holds
+# RATE_LIMIT_BURST_SECONDS worth of tokens. The bucket lives in Redis (one atomic Lua call over
+# the async client) or, when Redis is unavailable, in process memory. The user comes from a
+# client-supplied header, so every request first takes from a per-IP bucket
+# (RATE_LIMIT_IP_PER_MIN, default the highest plan rate); rotating the header can't reset that
+# one, and it is checked before the plan lookup.
+
+LIMIT_SECONDS = Histogram("otp_rate_limit_seconds", "Rate limiter overhead per request (s)", ["backend"],
+                          buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1), registry=None)
+LIMITED = Counter("otp_rate_limited_total", "Requests rejected by the rate limiter", ["plan"], registry=None)
+
+EXEMPT = ("/healthz", "/metrics")
+
+TOKEN_BUCKET = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens, ts = tonumber(b[1]) or burst, tonumber(b[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+def enabled() -> bool:
+    return os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+
+def burst_seconds() -> float:
+    return float(os.environ.get("RATE_LIMIT_BURST_SECONDS", "10"))
+
+def plan_cache_ttl() -> float:
+    return float(os.environ.get("PLAN_CACHE_TTL", "60"))
+
+def ip_rate_per_min() -> int:
+    return int(os.environ.get("RATE_LIMIT_IP_PER_MIN", max(p["api_rate_per_min"] for p in PLANS.values())))
+
+def plan_cache_max() -> int:
+    return int(os.environ.get("PLAN_CACHE_MAX", "10000"))
+
+_plans: Dict[str, Tuple[float, str, dict]] = {}  # email -> (expires, plan name, plan)
+
+def _prune_plans(now: float):
+    for k in [k for k, (exp, _, _) in _plans.items() if exp <= now]: del _plans[k]
+    if len(_plans) >= plan_cache_max(): _plans.clear()
+
+def _plan_name(plan: dict) -> str:
+    return next((n for n, p in PLANS.items() if p is plan), "default")
+
+def _lookup_plan(email: Optional[str]) -> dict:
+    with SessionLocal() as db:
+        return get_plan(db, email)
+
+async def cached_plan(email: Optional[str]) -> Tuple[str, dict]:
+    key = email or ""
+    hit = _plans.get(key)
+    if hit is not None and hit[0] > time.monotonic():
+        return hit[1], hit[2]
+    plan = await run_in_threadpool(_lookup_plan, email)
+    now = time.monotonic()
+    if key not in _plans and len(_plans) >= plan_cache_max(): _prune_plans(now)
+    _plans[key] = (now + plan_cache_ttl(), _plan_name(plan), plan)
+    return _plans[key][1], plan
+
+def invalidate_plan(email: Optional[str] = None):
+    if email is None: _plans.clear()
+    else: _plans.pop(email, None)
+
+class LocalBuckets:
+    """In-process token buckets; returns the seconds to wait (0 = allowed)."""
+    def __init__(self, max_keys: int = 10000):
+        self.buckets: Dict[str, list] = {}
+        self.max_keys = max_keys
+
+    def take(self, key: str, rate: float, burst: float, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        b = self.buckets.get(key)
+        if b is None:
+            if len(self.buckets) >= self.max_keys: self._prune(now)
+            b = self.buckets[key] = [burst, now]
+        tokens = min(burst, b[0] + max(0.0, now - b[1]) * rate)
+        wait = 0.0
+        if tokens >= 1: tokens -= 1
+        else: wait = (1 - tokens) / rate
+        b[0], b[1] = tokens, now
+        return wait
+
+    def _prune(self, now: float):
+        # drop buckets idle long enough to be full again (they'd start full anyway)
+        for k in [k for k, (_, ts) in self.buckets.items() if now - ts > 600]: del self.buckets[k]
+        if len(self.buckets) >= self.max_keys: self.buckets.clear()
+
+LOCAL = LocalBuckets()
+_script: Any = None
+
+async def _take_redis(key: str, rate: float, burst: float) -> float:
+    global _script
+    r = get_async_redis()
+    if _script is None: _script = r.register_script(TOKEN_BUCKET)
+    return float(await _script(keys=[key], args=[rate, burst], client=r))
+
+async def _take(key: str, rate: float, burst: float) -> Tuple[float, str]:
+    if redis_available():
+        try:
+            return await _take_redis(key, rate, burst), "redis"
+        except Exception as e:
+            redis_health().record_failure(e)
+    return LOCAL.take(key, rate, burst), "local"
+
+def _too_many(wait: float, plan: str) -> JSONResponse:
+    LIMITED.labels(plan=plan).inc()
+    return JSONResponse({"detail": "rate limit exceeded"}, status_code=429,
+                        headers={"Retry-After": str(max(1, int(wait + 0.999)))})
+
+async def enforce_rate_limit(request: Request) -> Optional[JSONResponse]:
+    """None when the request may proceed, else a 429 response with Retry-After."""
+    if not enabled() or request.url.path in EXEMPT: return None
+    t0 = time.perf_counter()
+    ip = request.client.host if request.client else "unknown"
+    ip_rate = max(1, ip_rate_per_min()) / 60.0
+    wait, backend = await _take(f"ratelimit:ip:{ip}", ip_rate, max(1.0, ip_rate * burst_seconds()))
+    if wait > 0:
+        LIMIT_SECONDS.labels(backend=backend).observe(time.perf_counter() - t0)
+        return _too_many(wait, "ip")
+    email = await current_user_email(request)
+    name, plan = await cached_plan(email)
+    rate = max(1, int(plan.get("api_rate_per_min") or 60)) / 60.0
+    wait, backend = await _take(f"ratelimit:{email or '-'}:{ip}", rate, max(1.0, rate * burst_seconds()))
+    LIMIT_SECONDS.labels(backend=backend).observe(time.perf_counter() - t0)
+    return _too_many(wait, name) if wait > 0 else None
@@ -1,5 +1,6 @@
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, FrozenSet, Optional
+from functools import lru_cache
 import re
 
 MAP = {
@@ -12,10 +13,43 @@ MAP = {
     "transportation": ["transport", "infrastructure", "aviation", "rail"],
 }
 
+def _compile(mapping: Dict[str, list], word: bool) -> "re.Pattern":
+    # One alternation with a named group per sector, in MAP order. Matches are taken inside a
+    # lookahead so overlapping keywords (e.g. "bio" and "tech" in "biotech") are all seen. Only one
+    # group can match at a given position, so keywords of different sectors must not share a prefix.
+    b = r"\b" if word else ""
+    groups = [f"(?P<{sec}>{b}(?:{'|'.join(re.escape(k) for k in kws)}){b})" for sec, kws in mapping.items()]
+    return re.compile("(?=" + "|".join(groups) + ")")
+
+def _matches(rx: "re.Pattern", s: str) -> FrozenSet[str]:
+    return frozenset(m.lastgroup for m in rx.finditer(s)) if s else frozenset()
+
+def _first(found: FrozenSet[str], order: Dict[str, int]) -> Optional[str]:
+    return min(found, key=order.__getitem__) if found else None
+
+_COMMITTEE_RX = _compile(MAP, word=True)
+_COMMITTEE_ORDER = {s: i for i, s in enumerate(MAP)}
+
+@lru_cache(maxsize=16384)
 def infer_sector_from_committees(committees: str) -> Optional[str]:
-    s = committees.lower()
-    for sector, keywords in MAP.items():
-        for kw in keywords:
-            if re.search(r"\b" + re.escape(kw) + r"\b", s):
-                return sector
-    return None
+    """First sector (in MAP order) with a whole-word keyword in `committees`; memoized per string."""
+    return _first(_matches(_COMMITTEE_RX, (committees or "").lower()), _COMMITTEE_ORDER)
+
+# Issuer-name keywords (substring match) used for trade-level sector labels.
+ISSUER_MAP = {
+    "energy": ["oil", "gas", "energy"],
+    "healthcare": ["pharma", "bio", "health"],
+    "technology": ["tech", "ai", "chip", "semiconductor", "software"],
+    "finance": ["bank", "financial", "capital", "broker"],
+}
+
+_ISSUER_RX = _compile(ISSUER_MAP, word=False)
+_ISSUER_ORDER = {s: i for i, s in enumerate(ISSUER_MAP)}
+
+@lru_cache(maxsize=65536)
+def issuer_sectors(issuer: str) -> FrozenSet[str]:
+    """Every ISSUER_MAP sector with a keyword in `issuer`; memoized per issuer name."""
+    return _matches(_ISSUER_RX, (issuer or "").lower())
+
+def infer_sector_from_issuer(issuer: str) -> Optional[str]:
+    return _first(issuer_sectors(issuer or ""), _ISSUER_ORDER)
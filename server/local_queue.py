@@ -1,13 +1,48 @@
 
-import threading, time, uuid, traceback
-from typing import Any, Callable, Dict, List, Optional
+import threading, time, uuid, traceback, heapq, importlib, itertools, json, os, pickle, sqlite3
+import multiprocessing as mp
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from prometheus_client import Gauge
+from .instrumentation import JOB_WAIT, JOB_RUN
+
+# In-process job queue used when Redis/RQ is unavailable (offline/Android). Jobs wait in a heap
+# ordered by (priority desc, enqueue order) and a pool of worker threads blocks on a condition
+# variable, so there is no polling. Finished jobs are kept for `finished_ttl` seconds and at most
+# `max_finished` of them. With LOCAL_QUEUE_DB set, jobs are persisted to SQLite and jobs that were
+# queued or running when the process stopped are queued again on start. A function marked with a
+# `lane` attribute runs through the runner registered in `lanes` (tasks.py adds a process pool).
+
+LQ_DEPTH = Gauge("otp_local_queue_depth", "Jobs waiting in the local queue", registry=None)
+LQ_RUNNING = Gauge("otp_local_queue_running", "Jobs running in the local queue", registry=None)
+
+_current = threading.local()
+
+def current_job() -> Optional["LocalJob"]:
+    """The LocalJob the calling worker thread is running, if any."""
+    return getattr(_current, "job", None)
+
+def func_path(func: Callable) -> str:
+    return f"{func.__module__}:{func.__qualname__}"
+
+def resolve_func(path: str) -> Optional[Callable]:
+    try:
+        mod, _, name = path.partition(":")
+        obj: Any = importlib.import_module(mod)
+        for part in name.split("."): obj = getattr(obj, part)
+        return obj
+    except Exception:
+        return None
 
 class LocalJob:
-    def __init__(self, func: Callable, args: tuple, kwargs: dict):
+    def __init__(self, func: Optional[Callable], args: tuple, kwargs: dict, priority: int = 0, func_name: Optional[str] = None):
         self.id = uuid.uuid4().hex
         self.func = func
+        self.func_name = func_name or getattr(func, "__name__", str(func))
+        self.func_path = func_path(func) if func is not None else ""
         self.args = args
         self.kwargs = kwargs
+        self.priority = priority
         self.status = "queued"
         self.created_at = time.time()
         self.enqueued_at = time.time()
@@ -16,6 +51,7 @@ class LocalJob:
         self.result = None
         self.exc_info = None
         self.meta: Dict[str, Any] = {}
+        self.queue: Optional["LocalQueue"] = None
 
     def get_status(self) -> str:
         return self.status
@@ -23,46 +59,244 @@ class LocalJob:
     def return_value(self):
         return self.result
 
+    def save_meta(self):
+        if self.queue is None: return
+        if self.queue.store is not None: self.queue.store.put(self)
+        self.queue._notify(self)
+
+class SQLiteJobStore:
+    """Write-behind job table: puts are coalesced per job id and flushed in one transaction every
+    `interval` seconds by a writer thread (WAL, synchronous=NORMAL)."""
+    COLS = ("id", "func", "func_name", "args", "kwargs", "priority", "status", "created_at", "enqueued_at",
+            "started_at", "ended_at", "meta", "result", "exc_info")
+
+    def __init__(self, path: str, interval: float = 0.05):
+        self.path, self.interval = path, interval
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS local_jobs (
+            id TEXT PRIMARY KEY, func TEXT, func_name TEXT, args BLOB, kwargs BLOB, priority INTEGER, status TEXT,
+            created_at REAL, enqueued_at REAL, started_at REAL, ended_at REAL, meta TEXT, result BLOB, exc_info TEXT)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_local_jobs_status ON local_jobs (status)")
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()  # one connection shared by the writer and load/close
+        self.pending: Dict[str, Optional[tuple]] = {}  # id -> row, or None for delete
+        self.wake = threading.Event()
+        self.running = True
+        self.writer = threading.Thread(target=self._writer_loop, name="local-queue-store", daemon=True)
+        self.writer.start()
+
+    def _row(self, j: LocalJob) -> tuple:
+        def dump(v):
+            try: return pickle.dumps(v)
+            except Exception: return pickle.dumps(repr(v))
+        return (j.id, j.func_path, j.func_name, dump(j.args), dump(j.kwargs), j.priority, j.status, j.created_at,
+                j.enqueued_at, j.started_at, j.ended_at, json.dumps(j.meta, default=str),
+                dump(j.result) if j.status == "finished" else None, j.exc_info)
+
+    def put(self, j: LocalJob, now: bool = False):
+        row = self._row(j)
+        with self.lock:
+            self.pending[j.id] = row
+        if now: self.flush()
+
+    def delete(self, ids: List[str]):
+        with self.lock:
+            for i in ids: self.pending[i] = None
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch: return
+        ups = [r for r in batch.values() if r is not None]
+        dels = [(i,) for i, r in batch.items() if r is None]
+        with self.db_lock, self.conn:
+            self.conn.execute("BEGIN")
+            if ups:
+                self.conn.executemany(f"INSERT OR REPLACE INTO local_jobs ({','.join(self.COLS)}) VALUES ({','.join('?' * len(self.COLS))})", ups)
+            if dels:
+                self.conn.executemany("DELETE FROM local_jobs WHERE id = ?", dels)
+
+    def _writer_loop(self):
+        while self.running:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("local queue store error", e)
+
+    def load(self) -> List[LocalJob]:
+        self.flush()
+        out = []
+        with self.db_lock:
+            rows = self.conn.execute(f"SELECT {','.join(self.COLS)} FROM local_jobs ORDER BY enqueued_at").fetchall()
+        for row in rows:
+            r = dict(zip(self.COLS, row))
+            j = LocalJob(resolve_func(r["func"]), (), {}, r["priority"] or 0, func_name=r["func_name"])
+            j.func_path = r["func"]
+            j.id, j.status = r["id"], r["status"]
+            j.args, j.kwargs = pickle.loads(r["args"]), pickle.loads(r["kwargs"])
+            j.created_at, j.enqueued_at, j.started_at, j.ended_at = r["created_at"], r["enqueued_at"], r["started_at"], r["ended_at"]
+            j.meta = json.loads(r["meta"] or "{}")
+            j.result = pickle.loads(r["result"]) if r["result"] is not None else None
+            j.exc_info = r["exc_info"]
+            out.append(j)
+        return out
+
+    def close(self):
+        self.running = False
+        self.wake.set()
+        self.writer.join(timeout=2)
+        self.flush()
+        self.conn.close()
+
 class LocalQueue:
-    def __init__(self):
+    def __init__(self, workers: Optional[int] = None, max_finished: Optional[int] = None, finished_ttl: Optional[float] = None,
+                 store: Optional[SQLiteJobStore] = None):
         self.jobs: Dict[str, LocalJob] = {}
         self.lock = threading.Lock()
-        self.worker = threading.Thread(target=self._worker_loop, daemon=True)
-        self._queue: List[str] = []
+        self.cv = threading.Condition(self.lock)
+        self._heap: List[Tuple[int, int, str]] = []
+        self._seq = itertools.count()
+        self._done: "OrderedDict[str, float]" = OrderedDict()  # finished/failed job id -> ended_at
+        self.max_finished = max_finished if max_finished is not None else int(os.environ.get("LOCAL_QUEUE_MAX_FINISHED", "500"))
+        self.finished_ttl = finished_ttl if finished_ttl is not None else float(os.environ.get("LOCAL_QUEUE_FINISHED_TTL", "3600"))
+        self.store = store
         self.running = True
-        self.worker.start()
+        self.active = 0
+        self.lanes: Dict[str, Callable[[LocalJob], Any]] = {}  # lane name -> runner(job); default: call in the worker thread
+        self.listeners: List[Callable[[LocalJob], None]] = []  # called when a job starts, saves its meta, finishes or fails
+        if store is not None:
+            self._recover(store.load())
+        n = workers or int(os.environ.get("LOCAL_QUEUE_WORKERS", "2"))
+        self.workers = [threading.Thread(target=self._worker_loop, name=f"local-queue-{i}", daemon=True) for i in range(max(1, n))]
+        for w in self.workers: w.start()
 
-    def enqueue(self, func: Callable, *args, **kwargs) -> LocalJob:
-        j = LocalJob(func, args, kwargs)
-        with self.lock:
+    def _recover(self, jobs: List[LocalJob]):
+        for j in jobs:
+            j.queue = self
             self.jobs[j.id] = j
-            self._queue.append(j.id)
+            if j.status in ("queued", "started"):
+                if j.status == "started":
+                    j.meta["recovered"] = True
+                j.status, j.started_at = "queued", None
+                heapq.heappush(self._heap, (-j.priority, next(self._seq), j.id))
+                self.store.put(j)
+            else:
+                self._done[j.id] = j.ended_at or 0.0
+        self._evict(time.time())
+        LQ_DEPTH.set(len(self._heap))
+
+    def enqueue(self, func: Callable, *args, priority: int = 0, meta: Optional[Dict[str, Any]] = None, **kwargs) -> LocalJob:
+        """Queue func(*args, **kwargs); higher `priority` runs first, FIFO within a priority."""
+        j = LocalJob(func, args, kwargs, priority)
+        j.meta.update(meta or {})
+        j.queue = self
+        if self.store is not None: self.store.put(j)
+        with self.cv:
+            self.jobs[j.id] = j
+            heapq.heappush(self._heap, (-priority, next(self._seq), j.id))
+            LQ_DEPTH.set(len(self._heap))
+            self.cv.notify()
+        return j
+
+    def _next(self) -> Optional[LocalJob]:
+        with self.cv:
+            while self.running and not self._heap:
+                self.cv.wait()
+            if not self.running: return None
+            _, _, jid = heapq.heappop(self._heap)
+            LQ_DEPTH.set(len(self._heap))
+            j = self.jobs.get(jid)
+            if j is None: return None
+            j.status = "started"; j.started_at = time.time()
+            JOB_WAIT.labels(queue="local").observe(max(0.0, j.started_at - j.enqueued_at))
+            self.active += 1
+            LQ_RUNNING.set(self.active)
         return j
 
     def _worker_loop(self):
         while self.running:
-            j: Optional[LocalJob] = None
-            with self.lock:
-                if self._queue:
-                    jid = self._queue.pop(0)
-                    j = self.jobs.get(jid)
-            if not j:
-                time.sleep(0.1); continue
-            j.status = "started"; j.started_at = time.time()
+            j = self._next()
+            if j is None: continue
+            if self.store is not None: self.store.put(j)
+            self._notify(j)
+            _current.job = j
             try:
-                j.result = j.func(*j.args, **j.kwargs)
-                j.status = "finished"
-            except Exception as e:
-                j.exc_info = traceback.format_exc()
-                j.status = "failed"
-            j.ended_at = time.time()
+                if j.func is None: raise RuntimeError(f"cannot import {j.func_path or j.func_name}")
+                run = self.lanes.get(getattr(j.func, "lane", "thread"))
+                result = run(j) if run is not None else j.func(*j.args, **j.kwargs)
+                status, exc = "finished", None
+            except Exception:
+                result, status, exc = None, "failed", traceback.format_exc()
+            finally:
+                _current.job = None
+            ended = time.time()
+            JOB_RUN.labels(func=j.func_name, status=status).observe(ended - j.started_at)
+            with self.cv:
+                j.result, j.exc_info, j.status, j.ended_at = result, exc, status, ended
+                self.active -= 1
+                LQ_RUNNING.set(self.active)
+                self._done[j.id] = ended
+                self._evict(ended)
+            if self.store is not None: self.store.put(j)
+            self._notify(j)
+
+    def _notify(self, j: LocalJob):
+        for fn in list(self.listeners):
+            try: fn(j)
+            except Exception as e: print("local queue listener error", e)
+
+    def _evict(self, now: float):
+        # caller holds the lock (or is still single-threaded in __init__)
+        gone = []
+        while self._done:
+            jid, ended = next(iter(self._done.items()))
+            if len(self._done) > self.max_finished or now - ended > self.finished_ttl:
+                self._done.popitem(last=False); self.jobs.pop(jid, None); gone.append(jid)
+            else:
+                break
+        if gone and self.store is not None: self.store.delete(gone)
 
     def get_job(self, job_id: str) -> Optional[LocalJob]:
         return self.jobs.get(job_id)
 
     def list_job_ids(self) -> List[str]:
         with self.lock:
+            self._evict(time.time())
             return list(self.jobs.keys())
 
+    def depth(self) -> int:
+        with self.lock:
+            return len(self._heap)
+
+    def oldest_age(self) -> float:
+        with self.lock:
+            ages = [time.time() - self.jobs[jid].enqueued_at for _, _, jid in self._heap if jid in self.jobs]
+        return max(ages, default=0.0)
+
+    def join(self, timeout: float = 10.0) -> bool:
+        """Wait until nothing is queued or running (tests, shutdown)."""
+        end = time.time() + timeout
+        while time.time() < end:
+            with self.lock:
+                if not self._heap and not self.active: return True
+            time.sleep(0.01)
+        return False
+
+    def shutdown(self):
+        with self.cv:
+            self.running = False
+            self.cv.notify_all()
+        if self.store is not None: self.store.close()
+
+def _default_store() -> Optional[SQLiteJobStore]:
+    path = os.environ.get("LOCAL_QUEUE_DB", "")
+    # pool children import this module too and must not recover (and re-run) the parent's jobs
+    return SQLiteJobStore(path) if path and mp.parent_process() is None else None
+
 # singleton
-QUEUE = LocalQueue()
+QUEUE = LocalQueue(store=_default_store())
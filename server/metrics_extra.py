@@ -15,5 +15,19 @@ def init(registry):
         # Don't raise during startup; metrics are optional
         pass
 
+    # Module-level collectors created with registry=None; attach them to the app registry.
+    try:
+        from .delivery import DELIVERY_SECONDS, DELIVERY_TOTAL
+        from .local_queue import LQ_DEPTH, LQ_RUNNING
+        from .limits import LIMIT_SECONDS, LIMITED
+        from .instrumentation import COLLECTORS, QueueDepthCollector
+        for c in (DELIVERY_SECONDS, DELIVERY_TOTAL, LQ_DEPTH, LQ_RUNNING, LIMIT_SECONDS, LIMITED, *COLLECTORS):
+            try: registry.register(c)
+            except ValueError: pass  # already registered (app restarted in-process)
+        if not getattr(registry, "_otp_queue_depth", False):
+            registry.register(QueueDepthCollector()); registry._otp_queue_depth = True
+    except Exception:
+        pass
+
     # Return nothing; callers only need the side-effect of registration
     return None
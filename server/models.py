@@ -1,6 +1,6 @@
 
 from sqlalchemy.orm import declarative_base, relationship, Mapped, mapped_column
-from sqlalchemy import String, Integer, Date, DateTime, ForeignKey, Numeric, Text, func, JSON, Enum, Boolean
+from sqlalchemy import String, Integer, Date, DateTime, ForeignKey, Numeric, Text, func, JSON, Enum, Boolean, Float, UniqueConstraint
 import enum
 
 Base = declarative_base()
@@ -86,6 +86,8 @@ class AlertRule(Base):
     sector_pct_threshold: Mapped = mapped_column(Numeric(8,4), nullable=True)
     window_days: Mapped[int] = mapped_column(Integer, default=30)
     sectors: Mapped[str] = mapped_column(Text, default="")
+    tickers: Mapped[str] = mapped_column(Text, default="")
+    officials: Mapped[str] = mapped_column(Text, default="")  # comma-separated official ids
     frequency: Mapped['Frequency'] = mapped_column(Enum(Frequency), default=Frequency.daily)
     delivery: Mapped['Delivery'] = mapped_column(Enum(Delivery), default=Delivery.email)
     webhook_url: Mapped[str] = mapped_column(Text, default="")
@@ -116,3 +118,57 @@ class PushSubscription(Base):
     p256dh: Mapped[str] = mapped_column(Text)
     auth: Mapped[str] = mapped_column(Text)
     created_at: Mapped = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class PriceBar(Base):
+    __tablename__ = "prices"
+    __table_args__ = (UniqueConstraint("ticker", "date", name="uq_prices_ticker_date"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    ticker: Mapped[str] = mapped_column(String(32), index=True)
+    date: Mapped = mapped_column(Date, index=True)
+    close: Mapped[float] = mapped_column(Float)
+    updated_at: Mapped = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class BacktestState(Base):
+    __tablename__ = "backtest_states"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    key: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    hold_days: Mapped[int] = mapped_column(Integer, default=30)
+    benchmark: Mapped[str] = mapped_column(String(32), default="SPY")
+    last_trade_id: Mapped[int] = mapped_column(Integer, default=0)
+    last_price_date: Mapped = mapped_column(Date, nullable=True)
+    price_revision: Mapped[int] = mapped_column(Integer, default=0)
+    partials: Mapped = mapped_column(JSON, default=dict)
+    updated_at: Mapped = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class BacktestTradeReturn(Base):
+    __tablename__ = "backtest_trade_returns"
+    __table_args__ = (UniqueConstraint("state_id", "trade_id", name="uq_bt_returns_state_trade"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    state_id: Mapped[int] = mapped_column(ForeignKey("backtest_states.id"), index=True)
+    trade_id: Mapped[int] = mapped_column(ForeignKey("trades.id"), index=True)
+    ticker: Mapped[str] = mapped_column(String(32), default="")
+    sector: Mapped[str] = mapped_column(String(32), default="unknown")
+    side: Mapped[float] = mapped_column(Float, default=1.0)
+    trade_date: Mapped = mapped_column(Date)
+    status: Mapped[str] = mapped_column(String(16), index=True, default="pending")  # pending|done|skipped
+    r: Mapped = mapped_column(Float, nullable=True)
+    b: Mapped = mapped_column(Float, nullable=True)
+
+class OfficialRiskScore(Base):
+    __tablename__ = "official_risk_scores"
+    official_id: Mapped[int] = mapped_column(ForeignKey("officials.id"), primary_key=True)
+    score: Mapped[float] = mapped_column(Float, index=True, default=0.0)
+    freq: Mapped[int] = mapped_column(Integer, index=True, default=0)
+    overlap: Mapped[int] = mapped_column(Integer, index=True, default=0)
+    alpha_proxy: Mapped[float] = mapped_column(Float, index=True, default=0.0)
+    recency: Mapped[int] = mapped_column(Integer, index=True, default=0)
+    sector: Mapped[str] = mapped_column(String(32), index=True, nullable=True)
+    as_of: Mapped = mapped_column(Date, nullable=True)
+    updated_at: Mapped = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class IssuerSector(Base):
+    __tablename__ = "issuer_sectors"
+    issuer: Mapped[str] = mapped_column(String(255), primary_key=True)  # lower(coalesce(trades.issuer, ''))
+    sector: Mapped[str] = mapped_column(String(32), index=True, default="unknown")  # first match in ISSUER_MAP order
+    sectors: Mapped[str] = mapped_column(String(255), default="")  # every matching sector, comma-separated
+    updated_at: Mapped = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,143 @@
+
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+import os
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from .models import PriceBar, Setting, Trade
+
+REVISION_KEY = "prices_revision"
+
+class PriceMatrix:
+    """Daily closes as a dense (dates x tickers) array, forward-filled per ticker."""
+    def __init__(self, dates: np.ndarray, tickers: List[str], closes: np.ndarray):
+        self.dates = dates  # datetime64[D], ascending
+        self.tickers = list(tickers)
+        self.closes = closes
+        self.col: Dict[str, int] = {t: i for i, t in enumerate(self.tickers)}
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def column(self, ticker: str) -> Optional[np.ndarray]:
+        i = self.col.get((ticker or "").upper())
+        return None if i is None else self.closes[:, i]
+
+    def subset(self, tickers: Iterable[str]) -> "PriceMatrix":
+        cols = [self.col[t] for t in tickers if t in self.col]
+        return PriceMatrix(self.dates, [self.tickers[c] for c in cols], self.closes[:, cols])
+
+def empty_matrix() -> PriceMatrix:
+    return PriceMatrix(np.array([], dtype="datetime64[D]"), [], np.empty((0, 0)))
+
+def load_price_matrix(db: Session, tickers: Iterable[str], start: Optional[date] = None, end: Optional[date] = None) -> PriceMatrix:
+    tickers = sorted({t.upper() for t in tickers if t})
+    if not tickers:
+        return empty_matrix()
+    stmt = select(PriceBar.date, PriceBar.ticker, PriceBar.close).where(PriceBar.ticker.in_(tickers))
+    if start: stmt = stmt.where(PriceBar.date >= start)
+    if end: stmt = stmt.where(PriceBar.date <= end)
+    rows = db.execute(stmt).all()
+    if not rows:
+        return empty_matrix()
+    df = pd.DataFrame(rows, columns=["date", "ticker", "close"])
+    wide = df.pivot_table(index="date", columns="ticker", values="close", aggfunc="last").sort_index().ffill()
+    dates = pd.to_datetime(wide.index).values.astype("datetime64[D]")
+    return PriceMatrix(dates, [str(c) for c in wide.columns], wide.to_numpy(dtype=float))
+
+def prices_revision(db: Session) -> int:
+    row = db.query(Setting).filter(Setting.key==REVISION_KEY).first()
+    return int(row.value or 0) if row else 0
+
+def _bump_revision(db: Session):
+    row = db.query(Setting).filter(Setting.key==REVISION_KEY).first()
+    if row: row.value = str(int(row.value or 0) + 1)
+    else: db.add(Setting(key=REVISION_KEY, value="1"))
+
+def upsert_prices(db: Session, rows: Iterable[Tuple[str, date, float]]) -> int:
+    """Insert or update (ticker, date, close) rows; returns the number of rows written.
+
+    Appending new price days is the normal path. Changing an existing close or inserting a day at or
+    before the latest stored date bumps `prices_revision`, which invalidates incremental backtest state.
+    """
+    rows = [(t.upper(), d, float(c)) for t, d, c in rows if t and d is not None and c is not None]
+    if not rows:
+        return 0
+    tickers = sorted({t for t, _, _ in rows})
+    lo = min(d for _, d, _ in rows); hi = max(d for _, d, _ in rows)
+    existing = {(t, d): (pid, c) for pid, t, d, c in db.execute(
+        select(PriceBar.id, PriceBar.ticker, PriceBar.date, PriceBar.close)
+        .where(PriceBar.ticker.in_(tickers), PriceBar.date >= lo, PriceBar.date <= hi)).all()}
+    latest = db.scalar(select(func.max(PriceBar.date)))
+    inserts, updates = [], []
+    now = datetime.now(timezone.utc)
+    for t, d, c in rows:
+        cur = existing.get((t, d))
+        if cur is None:
+            inserts.append({"ticker": t, "date": d, "close": c})
+            existing[(t, d)] = (None, c)
+        elif cur[0] is not None and cur[1] != c:
+            updates.append({"id": cur[0], "close": c, "updated_at": now})
+    if updates or (latest is not None and any(r["date"] <= latest for r in inserts)):
+        _bump_revision(db)
+    if inserts: db.bulk_insert_mappings(PriceBar, inserts)
+    if updates: db.bulk_update_mappings(PriceBar, updates)
+    db.commit()
+    return len(inserts) + len(updates)
+
+def fetch_yfinance(db: Session, tickers: List[str], start: date, end: Optional[date] = None) -> int:
+    # Lazy import to keep optional
+    try:
+        import yfinance as yf
+    except Exception:
+        return 0
+    data = yf.download(list(tickers), start=start, end=end, progress=False, auto_adjust=True, group_by="column")
+    if data is None or data.empty:
+        return 0
+    closes = data["Close"]
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(tickers[0])
+    long = closes.stack().reset_index()
+    long.columns = ["date", "ticker", "close"]
+    return upsert_prices(db, ((r.ticker, r.date.date(), r.close) for r in long.itertuples(index=False)))
+
+def price_lookback_days() -> int:
+    """Calendar days loaded before a window's first trade so the forward-fill has a quote to start from."""
+    return int(os.environ.get("PRICE_LOOKBACK_DAYS", "10"))
+
+def refresh_prices(db: Session, benchmarks: Iterable[str] = ("SPY",), fetch: Optional[Callable] = None,
+                   batch: Optional[int] = None) -> Dict[str, int]:
+    """Fetch closes for every traded ticker plus `benchmarks`. Tickers with prices resume at their
+    latest stored day; new tickers start together at the earliest of their first trades (minus the
+    lookback). Tickers sharing a start date are downloaded `PRICE_FETCH_BATCH` (200) at a time."""
+    fetch = fetch or fetch_yfinance
+    batch = batch or int(os.environ.get("PRICE_FETCH_BATCH", "200"))
+    tk = func.upper(Trade.ticker)
+    first = dict(db.execute(select(tk, func.min(Trade.trade_date))
+                            .where(Trade.ticker.is_not(None), Trade.ticker != "", Trade.trade_date.is_not(None)).group_by(tk)).all())
+    if not first:
+        return {"tickers": 0, "rows": 0}
+    earliest = min(first.values())
+    for b in benchmarks:
+        first[b.upper()] = min(first.get(b.upper(), earliest), earliest)
+    latest = dict(db.execute(select(PriceBar.ticker, func.max(PriceBar.date)).group_by(PriceBar.ticker)).all())
+    missing = [t for t in first if t not in latest]
+    groups: Dict[date, List[str]] = defaultdict(list)
+    for t in first:
+        if t in latest: groups[latest[t]].append(t)
+    if missing:
+        groups[min(first[t] for t in missing) - timedelta(days=price_lookback_days())] += missing
+    rows = 0
+    for start, tickers in sorted(groups.items()):
+        tickers.sort()
+        for i in range(0, len(tickers), batch):
+            try:
+                rows += fetch(db, tickers[i:i + batch], start)
+            except Exception as e:
+                db.rollback()
+                print("price fetch error", start, tickers[i], e)
+    return {"tickers": len(first), "rows": rows}
@@ -0,0 +1,73 @@
+
+from typing import Any, Callable, Dict, Optional, Tuple
+from collections import Counter
+import cProfile, io, os, pstats, sys, threading, time
+
+# On-demand profiling. `sample` is a wall-clock sampling profiler for the live process: it walks
+# sys._current_frames() every `interval` seconds and counts each thread's stack, which `collapsed`
+# renders in the folded format flamegraph.pl / speedscope read. Jobs started with profile=1 run
+# under cProfile instead (`profile_call`), and the top of the pstats report is kept with the result.
+
+IDLE = {"threading.py:wait", "selectors.py:select", "queue.py:get", "threading.py:_wait_for_tstate_lock",
+        "socket.py:accept", "socket.py:readinto"}  # leaf frames of threads that are just blocked
+
+_busy = threading.Lock()
+
+def max_seconds() -> float:
+    return float(os.environ.get("PROFILE_MAX_SECONDS", "60"))
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def _stack(frame) -> Tuple[str, ...]:
+    out = []
+    while frame is not None:
+        out.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(out))
+
+def sample(seconds: float, interval: float = 0.005, idle: bool = False) -> Tuple[Counter, int]:
+    """(stack counts, number of samples) over `seconds`, all threads but the sampler's own. Stacks
+    are root-first tuples prefixed with the thread name. Raises RuntimeError if a profile is already running."""
+    if not _busy.acquire(blocking=False):
+        raise RuntimeError("a profile is already running")
+    try:
+        me = threading.get_ident()
+        counts: Counter = Counter()
+        n, end = 0, time.monotonic() + min(seconds, max_seconds())
+        while time.monotonic() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me: continue
+                st = _stack(frame)
+                if not idle and st and st[-1] in IDLE: continue
+                counts[(names.get(ident, f"thread-{ident}"),) + st] += 1
+            n += 1
+            time.sleep(interval)
+        return counts, n
+    finally:
+        _busy.release()
+
+def collapsed(counts: Counter) -> str:
+    """One `frame;frame;frame count` line per stack, hottest first."""
+    return "".join(f"{';'.join(st)} {c}\n" for st, c in counts.most_common())
+
+def top_functions(counts: Counter, limit: int = 20) -> Dict[str, int]:
+    """Samples in which each function was on the CPU (leaf frame)."""
+    leaves: Counter = Counter()
+    for st, c in counts.items(): leaves[st[-1]] += c
+    return dict(leaves.most_common(limit))
+
+def profile_top() -> int:
+    return int(os.environ.get("PROFILE_TOP", "40"))
+
+def profile_call(fn: Callable, *args, **kwargs) -> Tuple[Any, str]:
+    """(fn(*args, **kwargs), pstats report sorted by cumulative time). Only the calling thread is profiled."""
+    prof = cProfile.Profile()
+    try:
+        result = prof.runcall(fn, *args, **kwargs)
+    finally:
+        prof.disable()
+    out = io.StringIO()
+    pstats.Stats(prof, stream=out).strip_dirs().sort_stats("cumulative").print_stats(profile_top())
+    return result, out.getvalue()
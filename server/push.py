@@ -1,18 +1,36 @@
 
-from typing import Dict, Any, List, Optional
-import json
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import json, time
 from sqlalchemy.orm import Session
 from .models import Setting, PushSubscription
 from .db import SessionLocal
 from .config import env
 
+# VAPID keys are cached per process; set_vapid_keys invalidates, and the TTL bounds staleness
+# in other processes.
+VAPID_TTL = 300.0
+_vapid: Optional[Tuple[float, str, str]] = None
+
+def vapid_keys(db: Session) -> Tuple[str, str]:
+    global _vapid
+    if _vapid is None or time.monotonic() - _vapid[0] > VAPID_TTL:
+        rows = dict(db.query(Setting.key, Setting.value).filter(Setting.key.in_(["vapid_public", "vapid_private"])).all())
+        _vapid = (time.monotonic(), rows.get("vapid_public") or env("VAPID_PUBLIC_KEY", "") or "",
+                  rows.get("vapid_private") or env("VAPID_PRIVATE_KEY", "") or "")
+    return _vapid[1], _vapid[2]
+
+def invalidate_vapid_cache():
+    global _vapid
+    _vapid = None
+    _vapid_signer.cache_clear()
+
 def get_vapid_public(db: Session) -> str:
-    v = db.query(Setting).filter(Setting.key=="vapid_public").first()
-    return v.value if v else (env("VAPID_PUBLIC_KEY", "") or "")
+    return vapid_keys(db)[0]
 
 def get_vapid_private(db: Session) -> str:
-    v = db.query(Setting).filter(Setting.key=="vapid_private").first()
-    return v.value if v else (env("VAPID_PRIVATE_KEY", "") or "")
+    return vapid_keys(db)[1]
 
 def set_vapid_keys(db: Session, public: str, private: str):
     row = db.query(Setting).filter(Setting.key=="vapid_public").first()
@@ -22,6 +40,7 @@ def set_vapid_keys(db: Session, public: str, private: str):
     if row2: row2.value = private
     else: db.add(Setting(key="vapid_private", value=private))
     db.commit()
+    invalidate_vapid_cache()
 
 def list_subscriptions(db: Session, email: Optional[str]=None) -> List[PushSubscription]:
     q = db.query(PushSubscription)
@@ -35,31 +54,76 @@ def add_subscription(db: Session, email: str, sub: Dict[str, Any]) -> int:
     db.add(row); db.commit(); db.refresh(row)
     return row.id
 
-def send_test_to_all(db: Session, text: str = "Hello from OTP") -> int:
-    # Lazy import to keep optional
+@lru_cache(maxsize=4)
+def _vapid_signer(private: str):
+    # parse the key once instead of on every send; pywebpush also accepts the raw string
+    try:
+        from py_vapid import Vapid02
+        return Vapid02.from_string(private)
+    except Exception:
+        return private
+
+def push_workers() -> int:
+    return max(1, int(env("PUSH_WORKERS", "16") or 16))
+
+GONE = (404, 410)
+
+def push_fanout(db: Session, payload: Dict[str, Any], email: Optional[str] = None) -> Dict[str, Any]:
+    """Send `payload` to every subscription (or those of `email`) over a thread pool.
+
+    Subscriptions answering 404/410 are deleted. Returns {"sent", "gone", "failed", "by_status"}
+    where by_status counts HTTP statuses ("error" when no response came back).
+    """
+    out: Dict[str, Any] = {"sent": 0, "gone": 0, "failed": 0, "by_status": {}}
     try:
         from pywebpush import webpush, WebPushException
+        import requests
     except Exception:
-        return 0
-    pub = get_vapid_public(db)
-    priv = get_vapid_private(db)
+        return out
+    pub, priv = vapid_keys(db)
     if not pub or not priv:
-        return 0
-    subs = list_subscriptions(db)
-    count = 0
-    for s in subs:
+        return out
+    q = db.query(PushSubscription.id, PushSubscription.endpoint, PushSubscription.p256dh, PushSubscription.auth)
+    if email: q = q.filter(PushSubscription.email==email)
+    subs = q.all()
+    if not subs:
+        return out
+    signer = _vapid_signer(priv)
+    data = json.dumps(payload)
+    subject = env("VAPID_SUBJECT", "mailto:admin@example.com")
+    workers = min(push_workers(), len(subs))
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=workers, pool_maxsize=workers))
+
+    def send(sub) -> Tuple[int, Any]:
+        sid, endpoint, p256dh, auth = sub
         try:
-            webpush(
-                subscription_info={
-                    "endpoint": s.endpoint,
-                    "keys": {"p256dh": s.p256dh, "auth": s.auth},
-                },
-                data=json.dumps({"title": "Official Trades Pro", "body": text}),
-                vapid_private_key=priv,
-                vapid_claims={"sub": "mailto:admin@example.com"},
-                vapid_public_key=pub,
-            )
-            count += 1
+            r = webpush(subscription_info={"endpoint": endpoint, "keys": {"p256dh": p256dh, "auth": auth}}, data=data,
+                        vapid_private_key=signer, vapid_claims={"sub": subject}, timeout=10, requests_session=session)
+            return sid, getattr(r, "status_code", 201)
+        except WebPushException as e:
+            return sid, getattr(e.response, "status_code", None) or "error"
         except Exception:
-            pass
-    return count
+            return sid, "error"
+
+    gone = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for sid, status in pool.map(send, subs):
+                out["by_status"][str(status)] = out["by_status"].get(str(status), 0) + 1
+                if isinstance(status, int) and status // 100 == 2: out["sent"] += 1
+                elif status in GONE: gone.append(sid)
+                else: out["failed"] += 1
+    finally:
+        session.close()
+    if gone:
+        db.query(PushSubscription).filter(PushSubscription.id.in_(gone)).delete(synchronize_session=False)
+        db.commit()
+    out["gone"] = len(gone)
+    return out
+
+def send_to_user(db: Session, email: str, title: str, body: str, **extra) -> Dict[str, Any]:
+    return push_fanout(db, {"title": title, "body": body, **extra}, email=email)
+
+def send_test_to_all(db: Session, text: str = "Hello from OTP") -> Dict[str, Any]:
+    return push_fanout(db, {"title": "Official Trades Pro", "body": text})
@@ -1,7 +1,107 @@
 
+from typing import Dict, Optional, Tuple
+import os, threading, time, weakref, asyncio
 from .config import env
 import redis
 
+# One connection pool per process (redis-py resets it after fork) and one asyncio pool per event
+# loop. Whether Redis is usable is decided by `redis_available()`, a cached flag kept fresh by a
+# background health check, so hot paths (enqueue, job lookups, rate limiting) never ping.
+
+def redis_url() -> str:
+    return env("REDIS_URL", "redis://localhost:6379/0")
+
+def _pool_kwargs() -> dict:
+    return {"max_connections": int(env("REDIS_MAX_CONNECTIONS", "50")),
+            "socket_connect_timeout": float(env("REDIS_CONNECT_TIMEOUT", "1.0")),
+            "health_check_interval": 30}
+
+_pools: Dict[str, redis.ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool() -> redis.ConnectionPool:
+    url = redis_url()
+    pool = _pools.get(url)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(url) or redis.ConnectionPool.from_url(url, **_pool_kwargs())
+            _pools[url] = pool
+    return pool
+
 def get_redis():
-    url = env("REDIS_URL", "redis://localhost:6379/0")
-    return redis.Redis.from_url(url)
+    return redis.Redis(connection_pool=get_pool())
+
+_async_pools: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def get_async_redis():
+    import redis.asyncio as aioredis
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return aioredis.Redis.from_url(redis_url(), **_pool_kwargs())  # not in a loop yet: caller owns this client
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = _async_pools[loop] = aioredis.ConnectionPool.from_url(redis_url(), **_pool_kwargs())
+    return aioredis.Redis(connection_pool=pool)
+
+class RedisHealth:
+    """Circuit breaker around a ping. While closed (healthy) a daemon thread pings every `interval`
+    seconds; a failed ping or `record_failure()` opens it, and retries then back off exponentially
+    from `retry` up to `max_backoff` seconds until a ping succeeds."""
+    def __init__(self, interval: Optional[float] = None, max_backoff: Optional[float] = None, retry: float = 1.0):
+        self.interval = interval if interval is not None else float(env("REDIS_HEALTH_INTERVAL", "5"))
+        self.retry = retry
+        self.max_backoff = max_backoff if max_backoff is not None else float(env("REDIS_RETRY_MAX", "60"))
+        self.ok = False
+        self.error: Optional[str] = None
+        self.failures = 0
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pid: Optional[int] = None
+
+    def check(self) -> Tuple[bool, Optional[str]]:
+        """Ping now and update the state."""
+        try:
+            get_redis().ping()
+            ok, err = True, None
+        except Exception as e:
+            ok, err = False, str(e)
+        with self.lock:
+            self.ok, self.error, self.checked_at = ok, err, time.time()
+            self.failures = 0 if ok else self.failures + 1
+        return ok, err
+
+    def record_failure(self, err: Exception):
+        with self.lock:
+            self.ok, self.error = False, str(err)
+            self.failures += 1
+        self.wake.set()
+
+    def delay(self) -> float:
+        if self.ok: return self.interval
+        return min(self.max_backoff, self.retry * (2 ** max(0, self.failures - 1)))
+
+    def _loop(self):
+        while True:
+            self.wake.clear()
+            if not self.wake.wait(self.delay()):  # woken early = state changed, just reschedule
+                self.check()
+
+    def available(self) -> bool:
+        if self.pid != os.getpid():  # first call, or a forked child without the checker thread
+            with self.lock:
+                start = self.pid != os.getpid()
+                self.pid = os.getpid()
+            if start:
+                self.check()
+                threading.Thread(target=self._loop, name="redis-health", daemon=True).start()
+        return self.ok
+
+_health = RedisHealth()
+
+def redis_health() -> RedisHealth:
+    return _health
+
+def redis_available() -> bool:
+    return _health.available()
@@ -1,11 +1,14 @@
 
 from __future__ import annotations
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, Iterable, List, Tuple, Optional
 from datetime import date, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
-from .models import Trade, Official
-from .linking import infer_sector_from_committees
+from sqlalchemy import select, func, type_coerce, String, or_, and_, update
+import numpy as np
+import pandas as pd
+from .models import Trade, Official, OfficialRiskScore, Setting, IssuerSector
+from .linking import infer_sector_from_committees, issuer_sectors, ISSUER_MAP
+from .sectors import issuer_table_enabled, issuer_key_sql
 
 # NOTE: This is a heuristic score (0..100). It's not a legal conclusion.
 # Features:
@@ -28,13 +31,7 @@ def score_official(db: Session, official_id: int) -> Dict[str, Any]:
     sector = infer_sector_from_committees(off.committees or "") if off else None
     overlap = 0
     if sector:
-        for t in trades:
-            issuer = (t.issuer or "").lower()
-            tick = (t.ticker or "").lower()
-            if sector in ["energy"] and any(k in issuer for k in ["oil","gas","energy"]): overlap += 1
-            if sector in ["healthcare"] and any(k in issuer for k in ["pharma","bio","health"]): overlap += 1
-            if sector in ["technology"] and any(k in issuer for k in ["tech","ai","chip","semiconductor","software"]): overlap += 1
-            if sector in ["finance"] and any(k in issuer for k in ["bank","financial","capital","broker"]): overlap += 1
+        overlap = sum(1 for t in trades if sector in issuer_sectors(t.issuer or ""))
     # alpha proxy: buys count +1, sells -0.5 (placeholder without price data)
     alpha_proxy = sum(1.0 if (t.transaction_type.name if hasattr(t.transaction_type,'name') else str(t.transaction_type)).lower().startswith("buy") else -0.5 for t in trades)
     recency = 0
@@ -49,8 +46,217 @@ def score_official(db: Session, official_id: int) -> Dict[str, Any]:
     s += min(recency / 5.0, 1.0) * 10.0
     return {"official_id": official_id, "score": round(s, 1), "freq": freq, "overlap": overlap, "alpha_proxy": alpha_proxy, "recency": recency, "sector": sector}
 
-def top_officials(db: Session, limit: int = 50) -> List[Dict[str, Any]]:
-    ids = [x[0] for x in db.query(Official.id).all()]
-    scores = [score_official(db, oid) for oid in ids]
-    scores.sort(key=lambda x: x["score"], reverse=True)
-    return scores[:limit]
+def _risk_inputs(db: Session, start: date, official_ids: Optional[Iterable[int]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Officials (index official_id, column sector) and their trades since `start` with per-trade features
+    (official_id, trade_date, overlap, alpha); two columnar queries."""
+    q_offs = select(Official.id, Official.committees)
+    stored = IssuerSector.sectors if issuer_table_enabled() else None
+    cols = [Trade.official_id, Trade.issuer, type_coerce(Trade.transaction_type, String), Trade.trade_date]
+    q_tr = (select(*cols, *([stored] if stored is not None else []))
+            .where(Trade.trade_date >= start, Trade.official_id.is_not(None)))
+    if stored is not None:
+        q_tr = q_tr.join(IssuerSector, IssuerSector.issuer == issuer_key_sql(), isouter=True)
+    if official_ids is not None:
+        ids = sorted(set(int(i) for i in official_ids))
+        q_offs = q_offs.where(Official.id.in_(ids)); q_tr = q_tr.where(Trade.official_id.in_(ids))
+    offs = pd.DataFrame(db.execute(q_offs).all(), columns=["official_id", "committees"])
+    offs["sector"] = [infer_sector_from_committees(c or "") for c in offs["committees"]]
+    offs = offs.set_index("official_id")[["sector"]]
+    tr = pd.DataFrame(db.execute(q_tr).all(), columns=["official_id", "issuer", "tx", "trade_date", "stored"][:len(q_tr.selected_columns)])
+    tr = tr[tr["official_id"].isin(offs.index)]
+    # classify each distinct issuer once (stored sets from issuer_sectors when enabled)
+    issuer = tr["issuer"].fillna("")
+    codes, uniq = pd.factorize(issuer)
+    known = dict(zip(issuer, tr["stored"])) if stored is not None else {}
+    sets = [frozenset(known[u].split(",")) - {""} if isinstance(known.get(u), str) else issuer_sectors(u) for u in uniq]
+    sector = tr["official_id"].map(offs["sector"]).to_numpy()
+    overlap = np.zeros(len(tr), dtype=np.int64)
+    for sec in ISSUER_MAP:
+        hit = np.array([sec in x for x in sets], dtype=bool)
+        overlap += (sector == sec) & hit[codes]
+    return offs, pd.DataFrame({
+        "official_id": tr["official_id"].to_numpy(),
+        "trade_date": pd.to_datetime(tr["trade_date"]).to_numpy().astype("datetime64[D]"),
+        "overlap": overlap,
+        "alpha": np.where(tr["tx"].str.lower().str.startswith("buy"), 1.0, -0.5),
+    })
+
+def _combine(freq, overlap, alpha_proxy, recency) -> np.ndarray:
+    s = np.minimum(np.asarray(freq) / 20.0, 1.0) * 40.0
+    s = s + np.minimum(np.asarray(overlap) / 5.0, 1.0) * 30.0
+    s = s + np.minimum(np.maximum(np.asarray(alpha_proxy, dtype=float), 0.0) / 10.0, 1.0) * 20.0
+    s = s + np.minimum(np.asarray(recency) / 5.0, 1.0) * 10.0
+    return np.array([round(float(x), 1) for x in s])
+
+def score_officials(db: Session, today: Optional[date] = None, official_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """Set-based `score_official` for every official (or just `official_ids`), vectorized over all trades.
+
+    Returns one row per official (index official_id) with the same fields and values as score_official.
+    """
+    now = today or date.today()
+    offs, tr = _risk_inputs(db, now - timedelta(days=365), official_ids)
+    age = (np.datetime64(now, "D") - tr["trade_date"].to_numpy().astype("datetime64[D]")).astype(np.int64)
+    feats = pd.DataFrame({
+        "official_id": tr["official_id"].to_numpy(),
+        "freq": 1,
+        "overlap": tr["overlap"].to_numpy(),
+        "alpha_proxy": tr["alpha"].to_numpy(),
+        "recency": (age <= 30).astype(np.int64),
+    }).groupby("official_id").sum()
+    out = offs.join(feats, how="left")
+    out[["freq", "overlap", "recency"]] = out[["freq", "overlap", "recency"]].fillna(0).astype(np.int64)
+    out["alpha_proxy"] = out["alpha_proxy"].fillna(0.0).astype(float)
+    out["score"] = _combine(out["freq"], out["overlap"], out["alpha_proxy"], out["recency"])
+    return out
+
+def top_officials(db: Session, limit: int = 50, today: Optional[date] = None) -> List[Dict[str, Any]]:
+    df = score_officials(db, today=today)
+    df = df.reset_index().sort_values(["score", "official_id"], ascending=[False, True], kind="stable").head(limit)
+    names = dict(db.execute(select(Official.id, Official.name).where(Official.id.in_(df["official_id"].tolist()))).all()) if len(df) else {}
+    return [{"official_id": int(r.official_id), "score": r.score, "freq": int(r.freq), "overlap": int(r.overlap),
+             "alpha_proxy": float(r.alpha_proxy), "recency": int(r.recency), "sector": r.sector if isinstance(r.sector, str) else None,
+             "official_name": names.get(int(r.official_id))} for r in df.itertuples(index=False)]
+
+# Score time series: the score as of each week/month end, computed from cumulative sums over the
+# trades sorted by (official, date). Each point counts trades in [T-365, T] (recency: [T-30, T]),
+# i.e. point-in-time; trades dated after T are not seen at T.
+
+PERIODS = ("month", "week")
+
+def period_ends(start: date, end: date, period: str = "month") -> np.ndarray:
+    if period == "month":
+        months = np.arange(np.datetime64(start, "M"), np.datetime64(end, "M") + 1)
+        ends = (months + 1).astype("datetime64[D]") - 1
+    elif period == "week":  # weeks end on Sunday; 1970-01-04 was one
+        d0 = np.datetime64(start, "D")
+        ends = np.arange(d0 + (3 - d0.astype(np.int64)) % 7, np.datetime64(end, "D") + 1, 7)
+    else:
+        raise ValueError("period must be month|week")
+    return ends[(ends >= np.datetime64(start, "D")) & (ends <= np.datetime64(end, "D"))]
+
+def score_history(db: Session, official_ids: Optional[Iterable[int]] = None, period: str = "month",
+                  start: Optional[date] = None, end: Optional[date] = None, periods: Optional[int] = None) -> pd.DataFrame:
+    """Scores per (official_id, date) at each period end between start and end (default: first trade .. today).
+
+    `periods` keeps only the last N period ends.
+    """
+    end = end or date.today()
+    if start is None:
+        q = select(func.min(Trade.trade_date))
+        if official_ids is not None: q = q.where(Trade.official_id.in_(list(official_ids)))
+        start = db.scalar(q) or end
+    ends = period_ends(start, end, period)
+    if periods: ends = ends[-periods:]
+    cols = ["official_id", "date", "sector", "freq", "overlap", "alpha_proxy", "recency", "score"]
+    if not len(ends):
+        return pd.DataFrame(columns=cols)
+    base = ends[0] - 365
+    offs, tr = _risk_inputs(db, base.astype(date), official_ids)
+    day = (tr["trade_date"].to_numpy().astype("datetime64[D]") - base).astype(np.int64)
+    K = int((ends[-1] - base).astype(np.int64)) + 1
+    keep = day < K
+    code = pd.Index(offs.index).get_indexer(tr["official_id"].to_numpy()[keep])
+    key = code.astype(np.int64) * K + day[keep]
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    cum = {c: np.concatenate([[0], np.cumsum(v)]) for c, v in
+           (("freq", np.ones(len(key), dtype=np.int64)), ("overlap", tr["overlap"].to_numpy()[keep][order]),
+            ("alpha_proxy", tr["alpha"].to_numpy()[keep][order]))}
+    t = (ends - base).astype(np.int64)
+    rows = np.arange(len(offs), dtype=np.int64)[:, None] * K
+    hi = np.searchsorted(key, (rows + t[None, :]).ravel(), side="right")
+    lo = np.searchsorted(key, (rows + t[None, :] - 365).ravel(), side="left")
+    rlo = np.searchsorted(key, (rows + t[None, :] - 30).ravel(), side="left")
+    out = pd.DataFrame({
+        "official_id": np.repeat(offs.index.to_numpy(), len(ends)),
+        "date": np.tile(ends, len(offs)),
+        "sector": np.repeat(offs["sector"].to_numpy(), len(ends)),
+        "freq": cum["freq"][hi] - cum["freq"][lo],
+        "overlap": cum["overlap"][hi] - cum["overlap"][lo],
+        "alpha_proxy": (cum["alpha_proxy"][hi] - cum["alpha_proxy"][lo]).round(6),
+        "recency": cum["freq"][hi] - cum["freq"][rlo],
+    })
+    out["score"] = _combine(out["freq"], out["overlap"], out["alpha_proxy"], out["recency"])
+    return out[cols]
+
+def history_items(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """score_history frame -> [{official_id, sector, points: [...]}]."""
+    out = []
+    for oid, g in df.groupby("official_id", sort=True):
+        sec = g["sector"].iloc[0]
+        out.append({"official_id": int(oid), "sector": sec if isinstance(sec, str) else None,
+                    "points": [{"date": str(r.date)[:10], "score": float(r.score), "freq": int(r.freq), "overlap": int(r.overlap),
+                                "alpha_proxy": float(r.alpha_proxy), "recency": int(r.recency)} for r in g.itertuples(index=False)]})
+    return out
+
+# Materialized scores (official_risk_scores). Ingest refreshes the officials whose trades changed;
+# a daily pass refreshes the ones whose trades crossed the 365-day or 30-day window edges since the
+# last pass. Reads are then an indexed ORDER BY ... LIMIT/OFFSET on the table.
+
+AS_OF_KEY = "risk_scores_as_of"
+SORT_FIELDS = ("score", "freq", "overlap", "alpha_proxy", "recency", "sector", "official_id")
+
+def _get_as_of(db: Session) -> Optional[date]:
+    row = db.query(Setting).filter(Setting.key==AS_OF_KEY).first()
+    return date.fromisoformat(row.value) if row and row.value else None
+
+def _set_as_of(db: Session, d: date):
+    row = db.query(Setting).filter(Setting.key==AS_OF_KEY).first()
+    if row: row.value = d.isoformat()
+    else: db.add(Setting(key=AS_OF_KEY, value=d.isoformat()))
+
+def refresh_risk_scores(db: Session, official_ids: Optional[Iterable[int]] = None, today: Optional[date] = None) -> int:
+    """Recompute and store scores for `official_ids` (all officials when None); returns rows written."""
+    now = today or date.today()
+    if official_ids is not None:
+        official_ids = set(official_ids)
+        if not official_ids: return 0
+    df = score_officials(db, today=now, official_ids=official_ids)
+    S = OfficialRiskScore
+    existing = set(db.execute(select(S.official_id).where(S.official_id.in_(df.index.tolist()))).scalars()) if len(df) else set()
+    rows = [{"official_id": int(r.Index), "score": float(r.score), "freq": int(r.freq), "overlap": int(r.overlap),
+             "alpha_proxy": float(r.alpha_proxy), "recency": int(r.recency),
+             "sector": r.sector if isinstance(r.sector, str) else None, "as_of": now} for r in df.itertuples()]
+    db.bulk_update_mappings(S, [r for r in rows if r["official_id"] in existing])
+    db.bulk_insert_mappings(S, [r for r in rows if r["official_id"] not in existing])
+    if official_ids is None: _set_as_of(db, now)
+    db.commit()
+    return len(rows)
+
+def refresh_expired_risk_scores(db: Session, today: Optional[date] = None) -> int:
+    """Daily pass: only officials with trades that left the 12-month or 30-day window since the last pass."""
+    now = today or date.today()
+    last = _get_as_of(db)
+    if last is None or (now - last).days > 30:
+        return refresh_risk_scores(db, today=now)
+    if last >= now:
+        return 0
+    edges = [and_(Trade.trade_date >= last - timedelta(days=d), Trade.trade_date < now - timedelta(days=d)) for d in (365, 30)]
+    ids = set(db.execute(select(Trade.official_id).where(or_(*edges), Trade.official_id.is_not(None)).distinct()).scalars())
+    # officials never scored (e.g. created without trades) get a row too
+    ids |= set(db.execute(select(Official.id).where(Official.id.not_in(select(OfficialRiskScore.official_id)))).scalars())
+    n = refresh_risk_scores(db, ids, today=now)
+    db.execute(update(OfficialRiskScore).values(as_of=now))
+    _set_as_of(db, now)
+    db.commit()
+    return n
+
+def list_risk_scores(db: Session, limit: int = 50, offset: int = 0, sort: str = "score", order: str = "desc",
+                     sector: Optional[str] = None) -> Dict[str, Any]:
+    """Page of stored scores; computes the table on first use."""
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"sort must be one of {'|'.join(SORT_FIELDS)}")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc|desc")
+    if _get_as_of(db) is None:
+        refresh_risk_scores(db)
+    S = OfficialRiskScore
+    col = getattr(S, sort)
+    q = select(S, Official.name).join(Official, Official.id == S.official_id)
+    cnt = select(func.count()).select_from(S)
+    if sector:
+        q = q.where(S.sector == sector); cnt = cnt.where(S.sector == sector)
+    q = q.order_by(col.desc() if order == "desc" else col.asc(), S.official_id.asc()).limit(limit).offset(offset)
+    items = [{"official_id": s.official_id, "score": s.score, "freq": s.freq, "overlap": s.overlap, "alpha_proxy": s.alpha_proxy,
+              "recency": s.recency, "sector": s.sector, "official_name": name} for s, name in db.execute(q).all()]
+    return {"items": items, "total": db.scalar(cnt) or 0, "as_of": _get_as_of(db)}
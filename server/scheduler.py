@@ -5,6 +5,14 @@ from fastapi import FastAPI
 from .db import SessionLocal
 from .connectors import fetch_us_senate, fetch_us_house, fetch_uk_register, dedupe
 from .ingest import persist_records
+from .backtest_state import update_standard_backtests, standard_backtests
+from .prices import refresh_prices
+from .risk import refresh_expired_risk_scores
+from .instrumentation import ingest_stage
+from . import alerts  # noqa: F401  (registers the new-trade alert listener)
+
+def price_benchmarks() -> set:
+    return {"SPY"} | {b for _, b in standard_backtests()}
 
 def start_scheduler(app: FastAPI):
     scheduler = AsyncIOScheduler()
@@ -14,18 +22,33 @@ def start_scheduler(app: FastAPI):
             return
         with SessionLocal() as db:
             recs = []
-            try: recs += fetch_us_house(limit=None)
-            except Exception as e: print("house fetch error", e)
-            try: recs += fetch_us_senate(limit=None)
-            except Exception as e: print("senate fetch error", e)
-            try: recs += fetch_uk_register(limit=None)
-            except Exception as e: print("uk fetch error", e)
+            for name, fetch in (("house", fetch_us_house), ("senate", fetch_us_senate), ("uk", fetch_uk_register)):
+                try:
+                    with ingest_stage(f"fetch_{name}"): recs += fetch(limit=None)
+                except Exception as e: print(f"{name} fetch error", e)
             unique = dedupe(recs)
             try:
                 added = persist_records(db, unique)
                 print(f"Ingest: added {added} records")
             except Exception as e:
                 print("persist error", e)
+            try:
+                with ingest_stage("prices"):
+                    print("Prices:", refresh_prices(db, price_benchmarks()))
+            except Exception as e:
+                print("price refresh error", e)
+            try:
+                print("Backtest state:", update_standard_backtests(db))
+            except Exception as e:
+                print("backtest update error", e)
+
+    async def risk_expiry():
+        with SessionLocal() as db:
+            try:
+                print("Risk scores refreshed:", refresh_expired_risk_scores(db))
+            except Exception as e:
+                print("risk refresh error", e)
 
     scheduler.add_job(run_all, "cron", hour=3, minute=15)
+    scheduler.add_job(risk_expiry, "cron", hour=0, minute=5)
     scheduler.start()
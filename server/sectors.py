@@ -0,0 +1,41 @@
+
+from __future__ import annotations
+from typing import Iterable, Optional
+import os
+from sqlalchemy import select, delete, func
+from sqlalchemy.orm import Session
+from .models import Trade, IssuerSector
+from .linking import ISSUER_MAP, issuer_sectors
+
+# Optional persisted issuer -> sector table (ISSUER_SECTOR_TABLE=1). Keys are the SQL expression
+# `issuer_key_sql()` so the backtest filters can join on them directly; risk reads the stored
+# sector sets instead of classifying in Python. Rows only ever cache what `linking` computes, so
+# a missing row just falls back to the in-process classifier / SQL CASE.
+
+def issuer_table_enabled() -> bool:
+    return os.environ.get("ISSUER_SECTOR_TABLE", "0") == "1"
+
+def issuer_key_sql():
+    return func.lower(func.coalesce(Trade.issuer, ""))
+
+def _row(key: str) -> dict:
+    found = issuer_sectors(key)
+    ordered = [s for s in ISSUER_MAP if s in found]
+    return {"issuer": key, "sector": ordered[0] if ordered else "unknown", "sectors": ",".join(ordered)}
+
+def sync_issuer_sectors(db: Session, issuers: Optional[Iterable[str]] = None) -> int:
+    """Classify trade issuers missing from the table (only `issuers` when given); returns rows added."""
+    q = select(issuer_key_sql()).distinct().where(issuer_key_sql().not_in(select(IssuerSector.issuer)))
+    if issuers is not None:
+        q = q.where(issuer_key_sql().in_(list({(i or "").lower() for i in issuers})))
+    keys = [k for k in db.execute(q).scalars() if len(k) <= 255]
+    if keys:
+        db.bulk_insert_mappings(IssuerSector, [_row(k) for k in keys])
+        db.commit()
+    return len(keys)
+
+def rebuild_issuer_sectors(db: Session) -> int:
+    """Drop and reclassify everything, e.g. after the keyword lists in `linking` change."""
+    db.execute(delete(IssuerSector))
+    db.commit()
+    return sync_issuer_sectors(db)
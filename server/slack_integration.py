@@ -1,11 +1,12 @@
 
-import hmac, hashlib, time, re
-from typing import Dict, Any
+import asyncio, hmac, hashlib, time, re
+from typing import Dict, Any, Callable, Tuple
 from urllib.parse import urlencode
 import httpx
-from sqlalchemy.orm import Session
 from sqlalchemy import select, desc
+from starlette.concurrency import run_in_threadpool
 from .config import env
+from .db import SessionLocal
 from .tasks import enqueue_brief, enqueue_backtest
 from .models import Trade, Official
 
@@ -42,76 +43,113 @@ def verify_slack_signature(timestamp: str, body: bytes, signature: str) -> bool:
     return hmac.compare_digest(expected, signature or "")
 
 async def respond(response_url: str, text: str):
+    if not response_url: return
+    from .delivery import http_client
     try:
-        async with httpx.AsyncClient(timeout=10.0) as http:
-            await http.post(response_url, json={"text": text})
+        await http_client().post(response_url, json={"text": text})
     except Exception:
         pass
 
-async def handle_slash(db: Session, payload: Dict[str, Any]):
+# `latest`/`digest` replies are cached briefly: a whole channel tends to run the same command at
+# once. Concurrent misses for the same key share one query. N is clamped to 1..MAX_ROWS, so there
+# are at most 2 * MAX_ROWS keys, and expired entries are pruned on insert.
+CACHE_TTL = float(env("SLACK_CACHE_TTL", "15") or 0)
+MAX_ROWS = 50
+_cache: Dict[Tuple[str, int], Tuple[float, str]] = {}
+_inflight: Dict[Tuple[str, int], "asyncio.Future"] = {}
+
+async def cached_text(key: Tuple[str, int], compute: Callable[[], str]) -> str:
+    hit = _cache.get(key)
+    if hit and hit[0] > time.monotonic():
+        return hit[1]
+    if key in _inflight:
+        return await asyncio.shield(_inflight[key])
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        text = await run_in_threadpool(compute)
+        if CACHE_TTL > 0:
+            now = time.monotonic()
+            for k in [k for k, (exp, _) in _cache.items() if exp <= now]: del _cache[k]
+            _cache[key] = (now + CACHE_TTL, text)
+        fut.set_result(text)
+        return text
+    except Exception as e:
+        fut.set_exception(e); fut.exception()  # mark retrieved; waiters re-raise
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+def _rows_arg(parts) -> int:
+    """First integer argument clamped to 1..MAX_ROWS (default 5)."""
+    for p in parts:
+        try: return max(1, min(MAX_ROWS, int(p)))
+        except ValueError: pass
+    return 5
+
+def _recent(n: int):
+    with SessionLocal() as db:
+        return db.execute(select(Trade, Official).join(Official, Trade.official_id==Official.id, isouter=True).order_by(desc(Trade.created_at)).limit(n)).all()
+
+def latest_text(n: int) -> str:
+    lines = ["*Latest trades:*"]
+    for tr, off in _recent(n):
+        who = off.name if off else "Unknown"
+        what = tr.ticker or tr.issuer or "(unknown)"
+        lines.append(f"- {tr.trade_date}: {tr.transaction_type.value.upper()} {what} by {who} (#{tr.id})")
+    return "\n".join(lines) if lines else "No trades."
+
+def digest_text(n: int) -> str:
+    rows = _recent(n)
+    if not rows:
+        return "No recent trades to include in digest."
+    lines = [f"*Official Trades Digest — Top {len(rows)}*"]
+    for tr, off in rows:
+        who = off.name if off else "Unknown"
+        what = tr.ticker or tr.issuer or "(unknown)"
+        when = tr.trade_date or tr.reported_date
+        lines.append(f"• {when}: {tr.transaction_type.value.upper()} {what} by {who} (#{tr.id})")
+    return "\n".join(lines)
+
+def latest_trade_id() -> int:
+    with SessionLocal() as db:
+        return db.execute(select(Trade.id).order_by(desc(Trade.created_at)).limit(1)).scalar() or 0
+
+async def handle_slash(payload: Dict[str, Any]):
+    """Runs after the slash command was acknowledged; DB and queue calls go to the threadpool."""
     text = (payload.get("text") or "").strip()
     response_url = payload.get("response_url")
 
-    def latest_trade_id() -> int:
-        row = db.execute(select(Trade).order_by(desc(Trade.created_at))).scalars().first()
-        return row.id if row else 0
-
     if text.startswith("latest"):
-        parts = text.split()
-        n = 5
-        if len(parts) > 1:
-            try: n = int(parts[1])
-            except: pass
-        rows = db.execute(select(Trade, Official).join(Official, Trade.official_id==Official.id, isouter=True).order_by(desc(Trade.created_at)).limit(n)).all()
-        lines = ["*Latest trades:*"]
-        for tr, off in rows:
-            who = off.name if off else "Unknown"
-            what = tr.ticker or tr.issuer or "(unknown)"
-            lines.append(f"- {tr.trade_date}: {tr.transaction_type.value.upper()} {what} by {who} (#{tr.id})")
-        await respond(response_url, "\n".join(lines) if lines else "No trades.")
+        n = _rows_arg(text.split()[1:2])
+        await respond(response_url, await cached_text(("latest", n), lambda: latest_text(n)))
     elif text.startswith("backtest"):
         parts = text.split()
         hold = 30
         if len(parts) > 1:
             try: hold = int(parts[1])
             except: pass
-        job = enqueue_backtest(hold_days=hold, response_url=response_url)
-        await respond(response_url, f"Backtest queued (hold_days={hold}). Job: `{job['job_id']}`")
+        job = await run_in_threadpool(enqueue_backtest, hold_days=hold, response_url=response_url)
+        verb = "already queued" if job.get("deduped") else "queued"
+        await respond(response_url, f"Backtest {verb} (hold_days={hold}). Job: `{job['job_id']}`")
     elif text.startswith("brief"):
         if "latest" in text or text.strip() == "brief":
-            tid = latest_trade_id()
+            tid = await run_in_threadpool(latest_trade_id)
             if not tid:
                 await respond(response_url, "No trades found.")
                 return
-            job = enqueue_brief(tid, response_url=response_url)
+            job = await run_in_threadpool(enqueue_brief, tid, response_url=response_url)
             await respond(response_url, f"Generating brief for latest trade #{tid}… job `{job['job_id']}`")
             return
         m = re.search(r"brief\s+(\d+)", text)
         if m:
             trade_id = int(m.group(1))
-            job = enqueue_brief(trade_id, response_url=response_url)
+            job = await run_in_threadpool(enqueue_brief, trade_id, response_url=response_url)
             await respond(response_url, f"Generating brief for trade #{trade_id}… job `{job['job_id']}`")
         else:
             await respond(response_url, "Usage: `/otp brief {trade_id}` or `/otp brief latest`")
     elif text.startswith("digest"):
-        parts = text.split()
-        n = 5
-        for p in parts[1:]:
-            try:
-                n = int(p)
-                break
-            except:
-                pass
-        rows = db.execute(select(Trade, Official).join(Official, Trade.official_id==Official.id, isouter=True).order_by(desc(Trade.created_at)).limit(n)).all()
-        if not rows:
-            await respond(response_url, "No recent trades to include in digest.")
-            return
-        lines = [f"*Official Trades Digest — Top {len(rows)}*"]
-        for tr, off in rows:
-            who = off.name if off else "Unknown"
-            what = tr.ticker or tr.issuer or "(unknown)"
-            when = tr.trade_date or tr.reported_date
-            lines.append(f"• {when}: {tr.transaction_type.value.upper()} {what} by {who} (#{tr.id})")
-        await respond(response_url, "\n".join(lines))
+        n = _rows_arg(text.split()[1:])
+        await respond(response_url, await cached_text(("digest", n), lambda: digest_text(n)))
     else:
         await respond(response_url, "Usage: `/otp latest [N]` | `/otp backtest [hold_days]` | `/otp brief {trade_id|latest}` | `/otp digest [N]`")
@@ -1,49 +1,180 @@
 
-from typing import Optional, Dict, Any, List
-import os
+from typing import Optional, Dict, Any, List, Tuple
+import os, threading, time, json, hashlib, uuid, functools
+from datetime import datetime, timezone
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 try:
     from rq import Queue, get_current_job
+    from rq.job import Job, Callback
+    from rq.exceptions import NoSuchJobError
     RQ_OK = True
 except Exception:
     RQ_OK = False
-from typing import Optional, Dict, Any, List
-from .redis_client import get_redis
-from .local_queue import QUEUE as LQ, LocalJob
+from redis.exceptions import ConnectionError as RedisConnectionError
+from .redis_client import get_redis, redis_available, redis_health
+from .local_queue import QUEUE as LQ, LocalJob, current_job as current_local_job, func_path
+from .job_events import job_event, publish_rq
+from .profiling import profile_call
 from .db import SessionLocal
 from .models import Trade, Official, Brief
 from .ai import make_brief
-from .backtest import backtest_equal_weight
+from .backtest import load_backtest_trades, load_backtest_prices, run_backtest, backtest_workers
+from .event_study import event_study_from_db
+from .backtest_state import update_standard_backtests
 
 
 def _use_local_queue() -> bool:
     if not RQ_OK: return True
     if os.environ.get("USE_REDIS", "1") != "1": return True
-    try:
-        r = get_redis(); r.ping()
-        return False
-    except Exception:
-        return True
+    return not redis_available()
+
 
+# RQ queues in priority order: workers serve interactive jobs (Slack briefs) before batch work
+# (backtests, event studies) before ingest maintenance. On the LocalQueue the same routing maps to
+# job priorities. "otp" is the old single queue; workers still drain it.
+QUEUES = ("interactive", "batch", "ingest")
+LEGACY_QUEUE = "otp"
+PRIORITY = {"interactive": 10, "batch": 0, "ingest": -10}
 
-def get_queue() -> Queue:
+def get_queue(name: str = "batch") -> Queue:
     if _use_local_queue():
         return None  # type: ignore
-    return Queue("otp", connection=get_redis())
+    return Queue(name, connection=get_redis())
+
+def all_queues() -> List[Queue]:
+    if _use_local_queue(): return []
+    r = get_redis()
+    return [Queue(n, connection=r) for n in QUEUES + (LEGACY_QUEUE,)]
+
+def queue_for(func) -> str:
+    return getattr(func, "queue", "batch")
+
+# Execution lanes. Tasks run in a LocalQueue worker thread ("thread" lane) unless marked
+# @lane("process"): CPU-bound tasks then run in a shared process pool so they don't hold the
+# API's GIL. Only the (small) call arguments cross the process boundary; the child loads its
+# own data. Progress from the child goes back over a multiprocessing queue. RQ already runs
+# every job in a forked work horse, so lanes only change how the LocalQueue executes them.
+# Jobs enqueued with profile=True (meta["profile"]) run under cProfile, wherever they run.
+
+def lane(name: str, queue: str = "batch"):
+    """Execution lane ("thread"/"process") and RQ queue (see QUEUES) for a task."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def task(*args, **kwargs):
+            if not _profile_requested(): return fn(*args, **kwargs)
+            result, report = profile_call(fn, *args, **kwargs)
+            if isinstance(result, dict): return {**result, "profile": report}
+            _set_meta({"profile_report": report})
+            return result
+        task.lane, task.queue = name, queue
+        return task
+    return deco
+
+def process_workers() -> int:
+    return max(1, int(os.environ.get("TASK_PROCESS_WORKERS", max(1, (os.cpu_count() or 2) // 2))))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_progress_q = None
+_running: Dict[str, LocalJob] = {}  # parent side: job id -> job running in the pool
+
+# child side
+_child_job_id: Optional[str] = None
+_child_meta: Dict[str, Any] = {}
+_child_profile = False
+
+def _child_init(q):
+    global _progress_q
+    _progress_q = q
+
+def _child_run(fn, job_id: str, args: tuple, kwargs: dict, profile: bool = False):
+    global _child_job_id, _child_meta, _child_profile
+    _child_job_id, _child_meta, _child_profile = job_id, {}, profile
+    try:
+        return fn(*args, **kwargs), _child_meta  # final meta rides with the result, so "Done" can't race it
+    finally:
+        _child_job_id = None
+
+def _progress_pump(q):
+    while True:
+        job_id, meta = q.get()
+        j = _running.get(job_id)
+        if j is not None:
+            j.meta.update(meta); j.save_meta()
+
+def process_pool() -> ProcessPoolExecutor:
+    global _pool, _progress_q
+    with _pool_lock:
+        if _pool is None:
+            ctx = mp.get_context(os.environ.get("TASK_MP_CONTEXT", "spawn"))
+            if _progress_q is None:
+                _progress_q = ctx.Queue()
+                threading.Thread(target=_progress_pump, args=(_progress_q,), name="task-progress", daemon=True).start()
+            _pool = ProcessPoolExecutor(max_workers=process_workers(), mp_context=ctx, initializer=_child_init, initargs=(_progress_q,))
+        return _pool
+
+def run_in_process(job: LocalJob):
+    """LocalQueue runner for the "process" lane."""
+    global _pool
+    _running[job.id] = job
+    try:
+        result, meta = process_pool().submit(_child_run, job.func, job.id, job.args, job.kwargs, bool(job.meta.get("profile"))).result()
+    except BrokenProcessPool:
+        with _pool_lock: _pool = None  # a child died; start a fresh pool for the next job
+        raise
+    finally:
+        _running.pop(job.id, None)
+    if meta:
+        job.meta.update(meta); job.save_meta()
+    return result
+
+LQ.lanes["process"] = run_in_process
+
+def _profile_requested() -> bool:
+    if _child_job_id is not None: return _child_profile
+    job = current_local_job() or (get_current_job() if RQ_OK else None)
+    return bool(job is not None and job.meta.get("profile"))
 
 def _set_progress(pct: int, note: str = ""):
-    job = get_current_job() if RQ_OK and not _use_local_queue() else None
+    meta = {"progress": max(0, min(100, int(pct)))}
+    if note: meta["note"] = str(note)
+    _set_meta(meta)
+
+def _set_meta(meta: Dict[str, Any]):
+    if _child_job_id is not None:
+        _child_meta.update(meta)
+        _progress_q.put((_child_job_id, meta))
+        return
+    local = current_local_job()
+    job = local or (get_current_job() if RQ_OK and not _use_local_queue() else None)
     if not job:
         return
-    job.meta["progress"] = max(0, min(100, int(pct)))
-    if note: job.meta["note"] = str(note)
-    job.save_meta()
+    job.meta.update(meta)
+    job.save_meta()  # LocalQueue notifies its listeners from here
+    if local is None: publish_rq(job.connection, job_event(job.id, "started", job.meta))
+
+def _send_replies(urls: List[str], text: Optional[str]):
+    if not urls or not text: return
+    import asyncio
+    from .slack_integration import respond
+    from .delivery import run_sync
+    async def _all():
+        await asyncio.gather(*(respond(u, text) for u in urls), return_exceptions=True)
+    run_sync(_all)
 
+def _reply(response_url: Optional[str], text: str):
+    # kept in the job meta so callers joining this job later (see single flight below) get it too
+    _set_meta({"reply": text})
+    if response_url: _send_replies([response_url], text)
+
+@lane("thread", queue="interactive")
 def brief_task(trade_id: int, response_url: Optional[str] = None) -> dict:
     with SessionLocal() as db:
         tr = db.get(Trade, trade_id)
         if not tr:
-            if response_url:
-                import asyncio; asyncio.run(respond(response_url, f"Trade {trade_id} not found."))
+            _reply(response_url, f"Trade {trade_id} not found.")
             return {"ok": False, "error": "not_found"}
         off = db.get(Official, tr.official_id) if tr.official_id else None
         trade_dict = {
@@ -65,45 +196,184 @@ def brief_task(trade_id: int, response_url: Optional[str] = None) -> dict:
         brief = Brief(trade_id=tr.id, provider="openai", content_md=out.get("text",""), citations=out.get("citations",[]))
         db.add(brief); db.commit(); db.refresh(brief)
         _set_progress(100, "Done")
-        msg = f"*Brief for trade #{tr.id}:* {tr.ticker or tr.issuer} — {out.get('text','')[:300]}..."
-        if response_url:
-            import asyncio
-            from .slack_integration import respond
-            asyncio.run(respond(response_url, msg))
+        _reply(response_url, f"*Brief for trade #{tr.id}:* {tr.ticker or tr.issuer} — {out.get('text','')[:300]}...")
         return {"ok": True, "brief_id": brief.id}
 
+@lane("process")
 def backtest_task(hold_days: int = 30, benchmark: str = "SPY", chamber: str = None, tx_filter: str = None,
                   start_date=None, end_date=None, sectors: Optional[List[str]] = None, response_url: Optional[str] = None) -> Dict[str, Any]:
     _set_progress(5, "Preparing trades")
     with SessionLocal() as db:
-        rows = db.query(Trade, Official).join(Official, Trade.official_id==Official.id, isouter=True).all()
-        trades = [{"ticker": t.ticker, "transaction_type": t.transaction_type.value, "trade_date": t.trade_date, "chamber": off.chamber.value if off else None} for t,off in rows]
-        _set_progress(30, "Running model")
-        res = backtest_equal_weight(trades, hold_days=hold_days, benchmark=benchmark, chamber=chamber, tx_filter=tx_filter, start_date=start_date, end_date=end_date, sectors=sectors)
-        _set_progress(90, "Wrapping up")
+        arrays = load_backtest_trades(db, chamber=chamber, tx_filter=tx_filter, start_date=start_date, end_date=end_date, sectors=sectors)
+        _set_progress(20, "Loading prices")
+        prices = load_backtest_prices(arrays, benchmark, hold_days, db=db)
+    _set_progress(30, "Running model")
+    res = run_backtest(arrays, prices, hold_days=hold_days, benchmark=benchmark, workers=backtest_workers(),
+                       on_progress=lambda done, total: _set_progress(30 + 60 * done // total, f"Shard {done}/{total}"))
     _set_progress(100, "Done")
-    if response_url:
-        import asyncio
-        alpha = res.get("summary",{}).get("alpha")
-        sharpe = res.get("summary",{}).get("sharpe")
-        msg = f"*Backtest* {hold_days}d vs {benchmark}: alpha={alpha:.2%}, sharpe={sharpe:.2f}"
-        from .slack_integration import respond
-        asyncio.run(respond(response_url, msg))
+    alpha = res.get("summary",{}).get("alpha") or 0.0
+    sharpe = res.get("summary",{}).get("sharpe") or 0.0
+    _reply(response_url, f"*Backtest* {hold_days}d vs {benchmark}: alpha={alpha:.2%}, sharpe={sharpe:.2f}")
     return {"ok": True, **res}
 
+@lane("process", queue="ingest")
+def backtest_update_task(full: bool = False) -> Dict[str, Any]:
+    _set_progress(5, "Full recompute" if full else "Incremental update")
+    with SessionLocal() as db:
+        states = update_standard_backtests(db, full=full)
+    _set_progress(100, "Done")
+    return {"ok": True, "states": states}
+
+DEFAULT_EVENT_WINDOWS = [("trade_date", -5, 30), ("reported_date", -5, 30)]
+
+@lane("process")
+def event_study_task(windows: Optional[List[tuple]] = None, benchmark: str = "SPY", chamber: str = None, tx_filter: str = None,
+                     start_date=None, end_date=None, sectors: Optional[List[str]] = None) -> Dict[str, Any]:
+    windows = [tuple(w) for w in (windows or DEFAULT_EVENT_WINDOWS)]
+    out = []
+    with SessionLocal() as db:
+        for i, (anchor, pre, post) in enumerate(windows):
+            _set_progress(5 + 90 * i // len(windows), f"Window {anchor} [{pre}, {post}]")
+            res = event_study_from_db(db, anchor=anchor, pre=int(pre), post=int(post), benchmark=benchmark, chamber=chamber,
+                                      tx_filter=tx_filter, start_date=start_date, end_date=end_date, sectors=sectors)
+            out.append({"window": [anchor, int(pre), int(post)], **res})
+    _set_progress(100, "Done")
+    return {"ok": True, "windows": out}
+
+# Single flight: identical enqueue calls share one job while it is queued or running, and a
+# finished job is reused for JOB_DEDUPE_TTL seconds. The key covers the normalized arguments but
+# not the Slack response_url; callers that join an existing job are "followers" and get the job's
+# reply text when it finishes (or right away when it already has).
+
+JOB_KEY_PREFIX = "otp:jobkey:"
+FOLLOWERS_PREFIX = "otp:job:followers:"
+ACTIVE = ("queued", "started", "deferred", "scheduled")
+
+def dedupe_ttl() -> int:
+    return int(os.environ.get("JOB_DEDUPE_TTL", "300"))
+
+def job_key(func, *args) -> str:
+    raw = json.dumps([func_path(func), args], default=str, sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+_flight_lock = threading.Lock()
+_local_keys: Dict[str, str] = {}  # job key -> LocalQueue job id
+_local_followers: Dict[str, List[str]] = {}  # job id -> response urls, guarded by LQ.lock
+
+def _on_local_done(job: LocalJob):
+    if job.status not in ("finished", "failed"): return
+    with LQ.lock:
+        urls = _local_followers.pop(job.id, [])
+    if job.status == "finished": _send_replies(urls, job.meta.get("reply"))
+
+LQ.listeners.append(_on_local_done)
+
+def _local_single_flight(key: str, func, args: tuple, response_url: Optional[str]) -> Tuple[str, bool]:
+    reply = None
+    with _flight_lock:
+        with LQ.lock:
+            j = LQ.jobs.get(_local_keys.get(key, ""))
+            if j is not None and j.status in ACTIVE:
+                if response_url: _local_followers.setdefault(j.id, []).append(response_url)
+                return j.id, True
+            if j is not None and j.status == "finished" and time.time() - (j.ended_at or 0) < dedupe_ttl():
+                reply = j.meta.get("reply")
+            else:
+                j = None
+        if j is None:
+            j = LQ.enqueue(func, *args, priority=PRIORITY[queue_for(func)])
+            if len(_local_keys) > 1000:
+                for k in [k for k, jid in _local_keys.items() if jid not in LQ.jobs]: del _local_keys[k]
+            _local_keys[key] = j.id
+            return j.id, False
+    if response_url: _send_replies([response_url], reply)
+    return j.id, True
+
+def _rq_job_age(job) -> float:
+    ended = job.ended_at
+    if ended is None: return float("inf")
+    if ended.tzinfo is None: ended = ended.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - ended).total_seconds()
+
+def _rq_reply_followers(job, connection, result, *args, **kwargs):
+    """RQ on_success callback: send the reply to callers that joined while the job ran."""
+    key = FOLLOWERS_PREFIX + job.id
+    urls = [u.decode() for u in connection.lrange(key, 0, -1)]
+    connection.delete(key)
+    _send_replies(urls, job.get_meta(refresh=True).get("reply"))
+
+def _rq_success(job, connection, result, *args, **kwargs):
+    _rq_reply_followers(job, connection, result)
+    publish_rq(connection, job_event(job.id, "finished", job.get_meta(refresh=False)))
+
+def _rq_failure(job, connection, *exc_info, **kwargs):
+    publish_rq(connection, job_event(job.id, "failed", job.meta))
+
+def _rq_callbacks() -> Dict[str, Any]:
+    return {"on_success": Callback(_rq_success), "on_failure": Callback(_rq_failure)}
+
+def _rq_single_flight(q, key: str, func, args: tuple, response_url: Optional[str], job_timeout: int) -> Tuple[str, bool]:
+    r = q.connection
+    for _ in range(2):
+        jid = r.get(JOB_KEY_PREFIX + key)
+        if jid is not None:
+            try:
+                job = Job.fetch(jid.decode(), connection=r)
+            except NoSuchJobError:
+                job = None
+            status = str(getattr(job.get_status(), "value", job.get_status())) if job is not None else None
+            if status in ACTIVE:
+                if response_url:
+                    r.rpush(FOLLOWERS_PREFIX + job.id, response_url)
+                    r.expire(FOLLOWERS_PREFIX + job.id, job_timeout + dedupe_ttl())
+                return job.id, True
+            if status == "finished" and _rq_job_age(job) < dedupe_ttl():
+                if response_url: _send_replies([response_url], job.get_meta(refresh=True).get("reply"))
+                return job.id, True
+        new_id = uuid.uuid4().hex
+        # NX only when no key existed, so two racing callers can't both start a job
+        if r.set(JOB_KEY_PREFIX + key, new_id, ex=job_timeout + dedupe_ttl(), nx=jid is None):
+            job = q.enqueue(func, *args, job_id=new_id, job_timeout=job_timeout, result_ttl=max(500, dedupe_ttl()),
+                            **_rq_callbacks())
+            return job.id, False
+    raise RuntimeError("job key contention")  # lost the NX race twice; practically unreachable
+
+def _enqueue(func, *args, job_timeout: int = 600, key: Optional[str] = None, response_url: Optional[str] = None,
+             profile: bool = False) -> Dict[str, Any]:
+    """Enqueue func(*args); with `key`, identical jobs are coalesced (see above). `response_url`
+    is passed as the last argument. Profiled jobs always run on their own."""
+    args = args + (response_url,) if key is not None else args
+    key = None if profile else key
+    meta = {"profile": True} if profile else None
+    q = get_queue(queue_for(func))
+    if q is not None:
+        try:
+            if key is None:
+                return {"ok": True, "job_id": q.enqueue(func, *args, job_timeout=job_timeout, meta=meta, **_rq_callbacks()).get_id()}
+            jid, deduped = _rq_single_flight(q, key, func, args, response_url, job_timeout)
+            return {"ok": True, "job_id": jid, "deduped": deduped}
+        except RedisConnectionError as e:
+            redis_health().record_failure(e)  # open the breaker and run this one locally
+    if key is None:
+        return {"ok": True, "job_id": LQ.enqueue(func, *args, priority=PRIORITY[queue_for(func)], meta=meta).id}
+    jid, deduped = _local_single_flight(key, func, args, response_url)
+    return {"ok": True, "job_id": jid, "deduped": deduped}
+
 def enqueue_brief(trade_id: int, response_url: Optional[str] = None):
-    q = get_queue()
-    if q is None:
-        job = LQ.enqueue(brief_task, trade_id, response_url)
-        return {"ok": True, "job_id": job.id}
-    job = q.enqueue(brief_task, trade_id, response_url, job_timeout=300)
-    return {"ok": True, "job_id": job.get_id()}
+    return _enqueue(brief_task, int(trade_id), job_timeout=300, key=job_key(brief_task, int(trade_id)), response_url=response_url)
 
 def enqueue_backtest(hold_days: int = 30, benchmark: str = "SPY", chamber: str = None, tx_filter: str = None,
-                     start_date=None, end_date=None, sectors: Optional[List[str]] = None, response_url: Optional[str] = None):
-    q = get_queue()
-    if q is None:
-        job = LQ.enqueue(backtest_task, hold_days, benchmark, chamber, tx_filter, start_date, end_date, sectors, response_url)
-        return {"ok": True, "job_id": job.id}
-    job = q.enqueue(backtest_task, hold_days, benchmark, chamber, tx_filter, start_date, end_date, sectors, response_url, job_timeout=600)
-    return {"ok": True, "job_id": job.get_id()}
+                     start_date=None, end_date=None, sectors: Optional[List[str]] = None, response_url: Optional[str] = None,
+                     profile: bool = False):
+    args = (int(hold_days), (benchmark or "SPY").upper(), chamber or None, (tx_filter or "").lower() or None,
+            start_date or None, end_date or None, sorted({s.lower() for s in sectors}) if sectors else None)
+    return _enqueue(backtest_task, *args, job_timeout=600, key=job_key(backtest_task, *args), response_url=response_url,
+                    profile=profile)
+
+def enqueue_event_study(windows: Optional[List[tuple]] = None, benchmark: str = "SPY", chamber: str = None, tx_filter: str = None,
+                        start_date=None, end_date=None, sectors: Optional[List[str]] = None, profile: bool = False):
+    return _enqueue(event_study_task, windows, benchmark, chamber, tx_filter, start_date, end_date, sectors, job_timeout=1800,
+                    profile=profile)
+
+def enqueue_backtest_update(full: bool = False, profile: bool = False):
+    return _enqueue(backtest_update_task, full, job_timeout=1800, profile=profile)
@@ -0,0 +1,50 @@
+
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from .models import Base, AlertRule
+from . import alerts
+from .ingest import persist_records
+
+def _db():
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng)
+    return Session(eng)
+
+def test_rule_index_matches_only_targeted_rules():
+    rules = [AlertRule(id=1, email="a", sectors="energy"), AlertRule(id=2, email="a", tickers="xom"),
+             AlertRule(id=3, email="a", officials="7", tickers="AAPL"), AlertRule(id=4, email="a")]
+    idx = alerts.RuleIndex(rules)
+    assert idx.match({"official_id": 1, "ticker": "XOM", "issuer": "Exxon Oil"}) == {1, 2, 4}
+    assert idx.match({"official_id": 7, "ticker": "AAPL", "issuer": "Apple"}) == {3, 4}
+    assert idx.match({"official_id": 8, "ticker": "AAPL", "issuer": "Apple"}) == {4}
+
+def test_ingest_evaluates_matching_rules_once_per_group(monkeypatch):
+    runs, sent = [], []
+    monkeypatch.setattr(alerts, "_backtest_for", lambda db, w, s: runs.append((w, s)) or {"summary": {"alpha": 0.01, "sharpe": 1.0}})
+    monkeypatch.setattr(alerts, "_dispatch", sent.extend)
+    with _db() as db:
+        db.add_all([AlertRule(email="a@x", name="oil", sectors="energy", window_days=30),
+                    AlertRule(email="b@x", name="oil2", sectors="energy", window_days=30),
+                    AlertRule(email="c@x", name="bank", sectors="finance", window_days=30),
+                    AlertRule(email="d@x", name="strict", tickers="XOM", min_sharpe=5)])
+        db.commit()
+        n = persist_records(db, [{"official_name": "Rep A", "chamber": "house", "ticker": "XOM", "issuer": "Exxon Oil",
+                                  "transaction_type": "buy", "trade_date": date(2024, 3, 1).isoformat()}])
+    assert n == 1
+    assert sorted(runs, key=str) == sorted([(30, frozenset({"energy"})), (30, frozenset())], key=str)
+    assert sorted(x["name"] for x in sent) == ["oil", "oil2"]
+    assert "XOM buy" in sent[0]["text"]
+
+def test_in_loop_dispatch_keeps_task_and_logs_failure(monkeypatch, capsys):
+    import asyncio
+    async def boom(hits): raise RuntimeError("smtp down")
+    monkeypatch.setattr(alerts, "notify_all", boom)
+    async def run():
+        alerts._dispatch([{"rule_id": 1}])
+        assert len(alerts._pending) == 1
+        await asyncio.gather(*alerts._pending, return_exceptions=True)
+        await asyncio.sleep(0)
+    asyncio.run(run())
+    assert not alerts._pending
+    assert "alert delivery error smtp down" in capsys.readouterr().out
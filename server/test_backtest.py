@@ -0,0 +1,64 @@
+
+from datetime import date, timedelta
+import numpy as np
+from .prices import PriceMatrix
+from .backtest import trades_to_arrays, run_backtest, compute_partials, combine_partials, summarize, shard_by_ticker
+
+def _matrix(days: int = 120) -> PriceMatrix:
+    rng = np.random.default_rng(7)
+    dates = np.arange(np.datetime64("2024-01-01"), np.datetime64("2024-01-01") + days, dtype="datetime64[D]")
+    tickers = ["AAA", "BBB", "CCC", "SPY"]
+    closes = 100 * np.cumprod(1 + rng.normal(0, 0.01, size=(days, len(tickers))), axis=0)
+    return PriceMatrix(dates, tickers, closes)
+
+def _trades(n: int = 60):
+    out = []
+    for i in range(n):
+        out.append({"ticker": ["AAA", "BBB", "CCC", "ZZZ"][i % 4], "issuer": ["Oil Co", "Big Bank", "Chip Inc", "Misc"][i % 4],
+                    "transaction_type": "buy" if i % 3 else "sell", "trade_date": date(2024, 1, 1) + timedelta(days=i), "chamber": "house"})
+    return out
+
+def test_backtest_summary_shapes():
+    pm = _matrix()
+    arrays = trades_to_arrays(_trades())
+    res = run_backtest(arrays, pm, hold_days=30, benchmark="SPY")
+    assert res["summary"]["trades"] > 0
+    assert {h["ticker"] for h in res["top_holdings"]} <= {"AAA", "BBB", "CCC"}
+    assert abs(sum(b["pct"] for b in res["sector_breakdown"]) - 1.0) < 1e-3
+
+def test_sharded_partials_match_single_pass(monkeypatch):
+    pm = _matrix()
+    arrays = trades_to_arrays(_trades())
+    bench = pm.column("SPY")
+    whole = summarize(compute_partials(arrays, pm, bench, 30), 30)
+    shards = shard_by_ticker(arrays, 3)
+    parts = [compute_partials(s, pm.subset(np.unique(s["ticker"]).tolist()), bench, 30) for s in shards]
+    assert summarize(combine_partials(parts), 30) == whole
+    monkeypatch.setenv("BACKTEST_SHARD_MIN", "0")
+    seen = []
+    res = run_backtest(arrays, pm, hold_days=30, benchmark="SPY", workers=2, on_progress=lambda d, t: seen.append((d, t)))
+    assert res["summary"] == whole["summary"]
+    assert seen[-1][0] == seen[-1][1]
+
+def test_load_backtest_trades_filters_in_sql():
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from .models import Base, Official, Trade, Chamber, TxType
+    from .backtest import load_backtest_trades
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng)
+    trades = _trades(40)
+    with Session(eng) as db:
+        house = Official(name="H", chamber=Chamber.house); senate = Official(name="S", chamber=Chamber.senate)
+        db.add_all([house, senate]); db.flush()
+        for i, t in enumerate(trades):
+            db.add(Trade(official_id=(house if i % 2 else senate).id, ticker=t["ticker"], issuer=t["issuer"],
+                         transaction_type=TxType(t["transaction_type"]), trade_date=t["trade_date"]))
+        db.commit()
+        got = load_backtest_trades(db, chamber="house", tx_filter="buy", sectors=["finance", "technology"], start_date=date(2024, 1, 5))
+    for i, t in enumerate(trades):
+        t["chamber"] = "house" if i % 2 else "senate"
+    want = trades_to_arrays(trades, chamber="house", tx_filter="buy", sectors=["finance", "technology"], start_date=date(2024, 1, 5))
+    order = np.lexsort((got["ticker"], got["trade_date"]))
+    for k in ("ticker", "side", "trade_date", "sector"):
+        assert list(got[k][order]) == list(want[k])
@@ -0,0 +1,83 @@
+
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from .models import Base, Official, Trade, Chamber, TxType
+from .prices import upsert_prices, prices_revision
+from .backtest import backtest_from_db, summarize
+from .backtest_state import update_backtest_state, standard_result
+
+START = date(2024, 1, 1)
+
+def _prices(db, days):
+    rng = np.random.default_rng(11)
+    rows = []
+    for t in ("AAA", "BBB", "SPY"):
+        px = 100 * np.cumprod(1 + rng.normal(0, 0.01, size=200))
+        rows += [(t, START + timedelta(days=i), float(px[i])) for i in days]
+    upsert_prices(db, rows)
+
+def _add_trades(db, off, start, n):
+    for i in range(start, start + n):
+        db.add(Trade(official_id=off.id, ticker=["AAA", "BBB"][i % 2], issuer="Oil Co" if i % 2 else "Big Bank",
+                     transaction_type=TxType.buy if i % 3 else TxType.sell, trade_date=START + timedelta(days=i)))
+    db.commit()
+
+def test_incremental_matches_full_recompute():
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng)
+    with Session(eng) as db:
+        off = Official(name="X", chamber=Chamber.house); db.add(off); db.commit()
+        _prices(db, range(0, 80))
+        _add_trades(db, off, 0, 40)
+        st = update_backtest_state(db, 30, "SPY")
+        assert standard_result(db, 30, "SPY") is not None
+        # new trades and new price days arrive
+        _add_trades(db, off, 40, 30)
+        _prices(db, range(80, 150))
+        assert standard_result(db, 30, "SPY") is None
+        rev = prices_revision(db)
+        st = update_backtest_state(db, 30, "SPY")
+        assert st.price_revision == rev
+        assert summarize(st.partials, 30) == backtest_from_db(db, 30, "SPY")
+        assert standard_result(db, 30, "SPY") == backtest_from_db(db, 30, "SPY")
+        # revised history falls back to a full recompute
+        upsert_prices(db, [("AAA", START + timedelta(days=10), 1.0)])
+        assert prices_revision(db) == rev + 1
+        st = update_backtest_state(db, 30, "SPY")
+        assert summarize(st.partials, 30) == backtest_from_db(db, 30, "SPY")
+
+def test_ingest_then_price_refresh_feeds_backtest():
+    from .ingest import persist_records
+    from .prices import refresh_prices
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng)
+    calls = []
+    def fake_fetch(db, tickers, start):
+        calls.append((tuple(tickers), start))
+        rng = np.random.default_rng(len(calls))
+        return upsert_prices(db, [(t, start + timedelta(days=i), 100 + float(rng.normal())) for t in tickers for i in range(120)])
+    with Session(eng) as db:
+        persist_records(db, [{"official_name": "Rep A", "chamber": "house", "ticker": t, "transaction_type": "buy",
+                              "trade_date": (START + timedelta(days=d)).isoformat()} for t, d in (("AAA", 3), ("bbb", 5), ("AAA", 20))])
+        assert backtest_from_db(db, 30, "SPY")["summary"]["trades"] == 0
+        assert refresh_prices(db, ("SPY",), fetch=fake_fetch) == {"tickers": 3, "rows": 360}
+        assert calls == [(("AAA", "BBB", "SPY"), START - timedelta(days=7))]  # first trade minus the 10-day lookback
+        assert backtest_from_db(db, 30, "SPY")["summary"]["trades"] == 3
+        refresh_prices(db, ("SPY",), fetch=fake_fetch)
+        assert calls[-1] == (("AAA", "BBB", "SPY"), START + timedelta(days=112))  # resumes from the latest stored day
+
+def test_pending_trade_without_same_day_quote_matches_full_recompute():
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng)
+    with Session(eng) as db:
+        off = Official(name="X", chamber=Chamber.house); db.add(off); db.commit()
+        upsert_prices(db, [("SPY", START + timedelta(days=i), 100.0 + i) for i in range(120)]
+                      + [("AAA", START + timedelta(days=i), 50.0 + i) for i in range(0, 120, 2)])  # AAA quoted every other day
+        db.add(Trade(official_id=off.id, ticker="AAA", transaction_type=TxType.buy, trade_date=START)); db.commit()
+        update_backtest_state(db, 30, "SPY")
+        db.add(Trade(official_id=off.id, ticker="AAA", transaction_type=TxType.buy, trade_date=START + timedelta(days=41))); db.commit()
+        st = update_backtest_state(db, 30, "SPY")
+        assert st.partials["n"] == 2
+        assert summarize(st.partials, 30) == backtest_from_db(db, 30, "SPY")
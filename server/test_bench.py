@@ -0,0 +1,16 @@
+
+from .bench.__main__ import compare
+from .bench.synth import Scale, trade_records, ticker_names
+
+def test_synthetic_records_are_deterministic():
+    a = list(trade_records(Scale(trades=500, seed=1)))
+    b = list(trade_records(Scale(trades=500, seed=1)))
+    assert a == b and len(a) == 500
+    assert len(set(ticker_names(1000))) == 1000
+
+def test_compare_flags_regressions():
+    base = {"scenarios": {"backtest": {"seconds": 1.0}, "risk": {"seconds": 0.5}}}
+    cur = {"scenarios": {"backtest": {"seconds": 1.1}, "risk": {"seconds": 0.9}, "ingest": {"seconds": 2.0}}}
+    rows = {r["scenario"]: r for r in compare(base, cur, tolerance=0.25)}
+    assert not rows["backtest"]["regression"] and rows["risk"]["regression"]
+    assert rows["ingest"]["baseline"] is None
@@ -0,0 +1,47 @@
+
+import asyncio
+import httpx
+from . import delivery
+
+def test_deliver_batches_per_user_and_pools_webhooks(monkeypatch):
+    digests, emails, posted = [], [], []
+    async def fake_digest(to, items, subject=""): digests.append((to, len(items)))
+    async def fake_email(to, subject, text): emails.append(to); return True
+    monkeypatch.setattr(delivery, "send_digest", fake_digest)
+    monkeypatch.setattr(delivery, "send_email", fake_email)
+    def handler(req: httpx.Request):
+        posted.append(req.url.host)
+        return httpx.Response(500 if req.url.host == "down.example" else 200)
+    notes = [{"delivery": "email", "email": "a@x", "name": f"r{i}", "text": "t", "webhook_url": ""} for i in range(3)]
+    notes += [{"delivery": "email", "email": "b@x", "name": "solo", "text": "t", "webhook_url": ""}]
+    notes += [{"delivery": "webhook", "email": "c@x", "name": "w", "text": "t", "webhook_url": f"https://{h}/hook"}
+              for h in ("hooks.example", "hooks.example", "down.example")]
+    monkeypatch.setenv("ALERT_WEBHOOK_RATE_PER_HOST", "0")
+    monkeypatch.setattr(delivery, "_limiter", None)
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await delivery.deliver(notes, client=client)
+    res = asyncio.run(run())
+    assert digests == [("a@x", 3)] and emails == ["b@x"]
+    assert sorted(posted) == ["down.example", "hooks.example", "hooks.example"]
+    assert res == {"ok": 4, "failed": 1}
+
+def test_http_client_is_per_loop_and_sync_calls_close_theirs():
+    import threading
+    async def grab():
+        return delivery.http_client(), delivery.http_client()
+    seen = []
+    def worker():
+        seen.append(delivery.run_sync(grab))
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert all(a is b and a.is_closed for a, b in seen)
+    assert len({id(a) for a, _ in seen}) == 3
+    async def pooled():
+        a = delivery.http_client()
+        assert delivery.http_client() is a
+        await delivery.close_http_client()
+        assert asyncio.get_running_loop() not in delivery._clients
+        return a
+    assert asyncio.run(pooled()).is_closed
@@ -0,0 +1,45 @@
+
+import numpy as np
+from fastapi.testclient import TestClient
+from .prices import PriceMatrix
+from .event_study import event_study, excess_returns, car_matrix
+
+def _setup():
+    rng = np.random.default_rng(3)
+    T = 80
+    dates = np.arange(np.datetime64("2024-01-01"), np.datetime64("2024-01-01") + T, dtype="datetime64[D]")
+    closes = 50 * np.cumprod(1 + rng.normal(0, 0.02, size=(T, 3)), axis=0)
+    pm = PriceMatrix(dates, ["AAA", "BBB", "SPY"], closes)
+    trades = {
+        "official": np.array([1, 1, 2, 2, 3]),
+        "ticker": np.array(["AAA", "BBB", "AAA", "BBB", "ZZZ"]),
+        "side": np.array([1.0, -1.0, 1.0, 1.0, 1.0]),
+        "event_date": np.array(["2024-01-10", "2024-01-20", "2024-02-01", "2024-03-15", "2024-01-10"], dtype="datetime64[D]"),
+        "chamber": np.array(["house", "house", "senate", "senate", "house"]),
+    }
+    return pm, trades
+
+def test_car_matches_naive_loop():
+    pm, trades = _setup()
+    ex = excess_returns(pm, "SPY")
+    car, mask = car_matrix(trades, pm, ex, -5, 10)
+    assert mask.tolist() == [True, True, True, False, False]
+    for row, i in enumerate(np.flatnonzero(mask)):
+        d0 = int(np.searchsorted(pm.dates, trades["event_date"][i]))
+        c = pm.col[trades["ticker"][i]]
+        naive = np.cumsum([trades["side"][i] * ex[d, c] for d in range(d0 - 5, d0 + 11)])
+        assert np.allclose(car[row], naive)
+
+def test_group_curves():
+    pm, trades = _setup()
+    res = event_study(trades, pm, pre=-5, post=10)
+    assert res["trades"] == 3 and len(res["car"]) == 16
+    assert {g["key"] for g in res["groups"]["official"]} == {1, 2}
+    assert sum(g["n"] for g in res["groups"]["chamber"]) == 3
+
+def test_event_study_endpoint():
+    from .app import app
+    with TestClient(app) as c:
+        assert c.get("/api/event-study", params={"pre": -2, "post": 5}).status_code == 200
+        assert c.get("/api/event-study", params={"anchor": "bogus"}).status_code == 400
+        assert c.get("/api/export/event_study.csv").status_code == 200
@@ -0,0 +1,65 @@
+
+from sqlalchemy import create_engine, text
+from fastapi.testclient import TestClient
+from .instrumentation import (fingerprint, instrument_engine, start_request_queries, finish_request_queries,
+                              SQL_QUERIES, POOL_WAIT, REQUEST_QUERIES)
+
+def _sample(metric, name, **labels):
+    for fam in metric.collect():
+        for s in fam.samples:
+            if s.name == name and all(s.labels.get(k) == v for k, v in labels.items()):
+                return s.value
+    return 0.0
+
+def test_fingerprint_collapses_literals_and_in_lists():
+    a = fingerprint("SELECT *  FROM trades WHERE id IN (1, 2, 3) AND ticker = 'AAPL'")
+    b = fingerprint("SELECT * FROM trades WHERE id IN (?, ?) AND ticker = 'it''s'")
+    assert a == b == "SELECT * FROM trades WHERE id IN (?) AND ticker = ?"
+
+def test_engine_events_count_statements_per_request():
+    eng = instrument_engine(create_engine("sqlite://"))
+    assert instrument_engine(eng) is eng  # idempotent
+    fp = fingerprint("SELECT ?")
+    before, waits = _sample(SQL_QUERIES, "otp_db_queries_total", fingerprint=fp), _sample(POOL_WAIT, "otp_db_pool_checkout_seconds_count")
+    token = start_request_queries()
+    with eng.connect() as c:
+        for i in range(3): c.execute(text(f"SELECT {i}"))
+    assert finish_request_queries(token, "GET", "/test") == 3
+    assert _sample(SQL_QUERIES, "otp_db_queries_total", fingerprint=fp) == before + 3
+    assert _sample(POOL_WAIT, "otp_db_pool_checkout_seconds_count") >= waits + 1
+    assert _sample(REQUEST_QUERIES, "otp_http_request_db_queries_sum", method="GET", path="/test") >= 3
+
+def test_metrics_endpoint_exposes_instrumentation():
+    from .app import app
+    with TestClient(app) as c:
+        c.get("/api/trades")
+        body = c.get("/metrics").text
+    for name in ("otp_db_queries_total", "otp_db_query_seconds_bucket", "otp_http_request_db_queries_bucket",
+                 "otp_job_queue_depth", "otp_db_pool_checkout_seconds_count"):
+        assert name in body
+
+def test_route_labels_are_bounded_and_slow_requests_get_exemplars(monkeypatch):
+    from .app import app
+    monkeypatch.setenv("HTTP_SLOW_SECONDS", "0")
+    with TestClient(app) as c:
+        for i in range(3): c.get(f"/wp-admin/{i}.php")
+        r = c.get("/api/jobs/abc123", headers={"X-Request-ID": "trace-42"})
+        assert r.headers["x-request-id"] == "trace-42"
+        assert len(c.get("/healthz", headers={"X-Request-ID": "bad id\\n"}).headers["x-request-id"]) == 32
+        text = c.get("/metrics").text
+        om = c.get("/metrics", headers={"Accept": "application/openmetrics-text; version=1.0.0"})
+    assert "wp-admin" not in text and 'path="<unmatched>",status="404"' in text
+    assert 'path="/api/jobs/{job_id}"' in text and "abc123" not in text
+    assert om.headers["content-type"].startswith("application/openmetrics-text")
+    assert '# {request_id="trace-42"}' in om.text
+    from .instrumentation import route_label  # before routing (rate-limited requests) the route table is matched
+    scope = {"type": "http", "method": "GET", "path": "/api/jobs/x", "root_path": "", "app": app}
+    assert route_label(scope) == "/api/jobs/{job_id}"
+    assert route_label({**scope, "path": "/.env"}) == "<unmatched>"
+
+def test_env_buckets(monkeypatch):
+    from .instrumentation import env_buckets
+    monkeypatch.setenv("HTTP_LATENCY_BUCKETS", "1, 0.1,0.5")
+    assert env_buckets("HTTP_LATENCY_BUCKETS", (9.0,)) == (0.1, 0.5, 1.0)
+    monkeypatch.setenv("HTTP_LATENCY_BUCKETS", "fast")
+    assert env_buckets("HTTP_LATENCY_BUCKETS", (9.0,)) == (9.0,)
@@ -0,0 +1,91 @@
+
+import asyncio, json, threading
+import fakeredis
+from rq import Queue
+from .local_queue import LocalQueue
+from .job_events import NOTIFIER, job_event, publish_rq, stream, snapshot, _on_local_job, CHANNEL_PREFIX
+from .tasks import _set_progress
+
+GATE = threading.Event()
+
+def stepped():
+    _set_progress(10, "one")
+    GATE.wait(5)
+    _set_progress(60, "two")
+    return "ok"
+
+def _events(frames):
+    return [json.loads(f.split("data: ", 1)[1]) for f in frames if f.startswith("event: job")]
+
+def test_local_stream_follows_job_until_done():
+    q = LocalQueue(workers=1)
+    q.listeners.append(_on_local_job)
+    GATE.clear()
+
+    async def run():
+        j = q.enqueue(stepped)
+        frames = []
+        async def consume():
+            async for f in stream([j.id], keepalive=0.05, local_queue=q):
+                frames.append(f)
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.2)
+        GATE.set()
+        await asyncio.wait_for(task, 5)
+        return j, frames
+
+    j, frames = asyncio.run(run())
+    evs = _events(frames)
+    assert evs[-1]["status"] == "finished" and evs[-1]["progress"] == 60
+    assert frames[-1].startswith("event: end")
+    assert {"two"} <= {e["note"] for e in evs}
+    assert not NOTIFIER.subs  # unsubscribed when the stream ended
+    q.shutdown()
+
+def test_rq_snapshot_and_publish():
+    r = fakeredis.FakeRedis()
+    job = Queue("batch", connection=r).enqueue(stepped)
+    job.meta["progress"] = 30; job.save_meta()
+    assert snapshot([job.id, "missing"], r) == [job_event(job.id, "queued", {"progress": 30}), job_event("missing", "unknown")]
+    p = r.pubsub(); p.subscribe(CHANNEL_PREFIX + job.id); p.get_message(timeout=1)
+    publish_rq(r, job_event(job.id, "finished", {"progress": 100}))
+    msg = p.get_message(timeout=1)
+    assert json.loads(msg["data"])["status"] == "finished"
+
+def test_rq_streams_share_one_relay_connection(monkeypatch):
+    import fakeredis.aioredis
+    from . import job_events
+    server = fakeredis.FakeServer()
+    r = fakeredis.FakeRedis(server=server)
+    clients = []
+    monkeypatch.setattr(job_events, "_relay_client", lambda: clients.append(1) or fakeredis.aioredis.FakeRedis(server=server))
+    jobs = [Queue("batch", connection=r).enqueue(stepped) for _ in range(2)]
+
+    async def run():
+        async def consume(job):
+            return [f async for f in stream([job.id], connection=r, keepalive=0.05, release=job_events.SLOTS.reserve())]
+        tasks = [asyncio.create_task(consume(j)) for j in jobs]
+        await asyncio.sleep(0.3)
+        assert job_events.active_streams() == 2
+        for j in jobs: publish_rq(r, job_event(j.id, "finished", {"progress": 100}))
+        return await asyncio.wait_for(asyncio.gather(*tasks), 5)
+
+    results = asyncio.run(run())
+    assert clients == [1]  # one pubsub connection for both streams
+    assert [_events(f)[-1]["status"] for f in results] == ["finished", "finished"]
+    assert job_events.active_streams() == 0
+
+def test_job_stream_cap_reserves_before_responding(monkeypatch):
+    from fastapi import HTTPException
+    from . import job_events
+    from .app import api_job_events
+    monkeypatch.setenv("SSE_MAX_STREAMS", "2")
+    async def run():
+        return await asyncio.gather(*[api_job_events(ids=f"j{i}") for i in range(5)], return_exceptions=True)
+    out = asyncio.run(run())  # none of the bodies has started yet
+    ok = [r for r in out if not isinstance(r, Exception)]
+    busy = [r for r in out if isinstance(r, HTTPException)]
+    assert len(ok) == 2 and job_events.active_streams() == 2
+    assert [e.status_code for e in busy] == [503] * 3 and busy[0].headers["Retry-After"] == "30"
+    for resp in ok: asyncio.run(resp.background())  # body never ran: the response still frees the slot
+    assert job_events.active_streams() == 0
@@ -0,0 +1,37 @@
+
+import fakeredis
+from rq import Queue
+from rq.registry import FinishedJobRegistry
+from . import jobs
+from .jobs import list_jobs, func_from_description
+
+def backtest_task(x): return x
+def brief_task(x): return x
+
+def test_func_from_description():
+    assert func_from_description("server.tasks.backtest_task(30, 'SPY', None)") == "backtest_task"
+    assert func_from_description(None) == ""
+
+def test_paginated_listing_across_queues(monkeypatch):
+    r = fakeredis.FakeRedis()
+    batch, inter = Queue("batch", connection=r), Queue("interactive", connection=r)
+    monkeypatch.setattr(jobs, "get_queue", lambda name="batch": batch)
+    monkeypatch.setattr(jobs, "all_queues", lambda: [inter, batch])
+    queued = [batch.enqueue(backtest_task, i) for i in range(5)] + [inter.enqueue(brief_task, i) for i in range(3)]
+    done = queued[0]
+    batch.remove(done)
+    done.set_status("finished"); done.meta["progress"] = 100; done.save()
+    FinishedJobRegistry(queue=batch).add(done, 600)
+
+    page = list_jobs(limit=3)
+    assert page["total"] == 8 and page["next_offset"] == 3
+    assert [x["queue"] for x in page["items"]] == ["interactive"] * 3
+    assert page["items"][0]["func_name"] == "brief_task" and page["items"][0]["enqueued_at"]
+    rest = list_jobs(limit=10, offset=3)
+    assert len(rest["items"]) == 5 and rest["next_offset"] is None
+    assert rest["items"][-1] == {**rest["items"][-1], "id": done.id, "status": "finished", "progress": 100}
+    assert [x["id"] for x in list_jobs(status="finished")["items"]] == [done.id]
+    f = list_jobs(limit=2, func="backtest")
+    assert f["total"] is None and len(f["items"]) == 2 and f["next_offset"] == 2
+    assert all(x["func_name"] == "backtest_task" for x in list_jobs(limit=10, offset=2, func="backtest")["items"])
+    assert len(list_jobs(limit=10, offset=2, func="backtest")["items"]) == 3
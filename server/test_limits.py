@@ -0,0 +1,48 @@
+
+from fastapi.testclient import TestClient
+from . import limits
+from .limits import LocalBuckets, invalidate_plan
+from .rbac import PLANS
+from .app import app
+
+def test_local_bucket_refills_at_rate():
+    b = LocalBuckets()
+    assert [b.take("k", 1.0, 2, now=0) for _ in range(3)] == [0, 0, 1.0]
+    assert b.take("k", 1.0, 2, now=0.5) == 0.5  # half a token back, half a second more to wait
+    assert b.take("k", 1.0, 2, now=2.0) == 0
+
+def test_middleware_returns_429_with_retry_after(monkeypatch):
+    lookups = []
+    monkeypatch.setattr(limits, "_lookup_plan", lambda email: lookups.append(email) or PLANS["free"])
+    monkeypatch.setattr(limits, "redis_available", lambda: False)
+    monkeypatch.setenv("RATE_LIMIT_BURST_SECONDS", "2")  # free plan: 1 token/s, bucket of 2
+    monkeypatch.setattr(limits, "LOCAL", LocalBuckets())
+    invalidate_plan()
+    try:
+        with TestClient(app) as c:
+            codes = [c.get("/api/search", params={"q": "x"}, headers={"X-Demo-Email": "free@example.com"}) for _ in range(3)]
+            assert [r.status_code for r in codes] == [200, 200, 429]
+            assert codes[2].headers["Retry-After"] == "1"
+            assert c.get("/healthz").status_code == 200
+        assert lookups == ["free@example.com"]  # plan looked up once, then cached
+    finally:
+        invalidate_plan()
+
+def test_rotating_user_header_hits_ip_bucket_and_plan_cache_is_bounded(monkeypatch):
+    lookups = []
+    monkeypatch.setattr(limits, "_lookup_plan", lambda email: lookups.append(email) or PLANS["pro"])
+    monkeypatch.setattr(limits, "redis_available", lambda: False)
+    monkeypatch.setenv("RATE_LIMIT_BURST_SECONDS", "2")
+    monkeypatch.setenv("RATE_LIMIT_IP_PER_MIN", "60")  # 1/s, bucket of 2 per client IP
+    monkeypatch.setenv("PLAN_CACHE_MAX", "2")
+    monkeypatch.setattr(limits, "LOCAL", LocalBuckets())
+    invalidate_plan()
+    try:
+        with TestClient(app) as c:
+            codes = [c.get("/api/search", params={"q": "x"}, headers={"X-Demo-Email": f"u{i}@example.com"}).status_code
+                     for i in range(4)]
+        assert codes == [200, 200, 429, 429]
+        assert lookups == ["u0@example.com", "u1@example.com"]  # rejected by IP before any plan lookup
+        assert len(limits._plans) <= 2
+    finally:
+        invalidate_plan()
@@ -0,0 +1,71 @@
+
+import os, threading, time
+from .local_queue import LocalQueue, SQLiteJobStore, current_job
+from .tasks import lane, run_in_process, _set_progress
+
+GATE = threading.Event()
+
+def record(out, x):
+    out.append(x)
+    return x
+
+def wait_gate():
+    GATE.wait(5)
+    return "gate"
+
+def double(x):
+    current_job().meta["progress"] = 100
+    return 2 * x
+
+@lane("process")
+def square_in_child(x):
+    _set_progress(50, "half")
+    return os.getpid(), x * x
+
+def test_process_lane_runs_in_child_and_reports_progress():
+    q = LocalQueue(workers=1)
+    q.lanes["process"] = run_in_process
+    j = q.enqueue(square_in_child, 7)
+    assert q.join(60)
+    assert j.status == "finished", j.exc_info
+    pid, val = j.result
+    assert pid != os.getpid() and val == 49
+    assert j.meta == {"progress": 50, "note": "half"}
+    q.shutdown()
+
+def test_priorities_pool_and_eviction():
+    q = LocalQueue(workers=1, max_finished=2, finished_ttl=60)
+    GATE.clear()
+    order = []
+    q.enqueue(wait_gate)
+    time.sleep(0.05)
+    jobs = [q.enqueue(record, order, "low", priority=0), q.enqueue(record, order, "high", priority=10),
+            q.enqueue(record, order, "low2", priority=0)]
+    assert q.depth() == 3
+    GATE.set()
+    assert q.join(5)
+    assert order == ["high", "low", "low2"]
+    assert [j.status for j in jobs] == ["finished"] * 3
+    assert len(q.list_job_ids()) == 2
+    q.shutdown()
+
+def test_sqlite_store_recovers_interrupted_jobs(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    GATE.clear()
+    q1 = LocalQueue(workers=1, store=SQLiteJobStore(path))
+    blocker = q1.enqueue(wait_gate)
+    time.sleep(0.05)
+    waiting = q1.enqueue(double, 21)
+    q1.store.flush()
+    # simulate a crash: the new process sees one started and one queued job
+    q2 = LocalQueue(workers=2, store=SQLiteJobStore(path))
+    assert q2.get_job(waiting.id) is not None
+    GATE.set()
+    assert q2.join(5)
+    j = q2.get_job(waiting.id)
+    assert (j.status, j.result, j.meta["progress"]) == ("finished", 42, 100)
+    assert q2.get_job(blocker.id).meta.get("recovered") is True
+    q2.shutdown(); q1.shutdown()
+    q3 = LocalQueue(workers=1, store=SQLiteJobStore(path))
+    assert q3.get_job(waiting.id).result == 42 and q3.get_job(waiting.id).func_name == "double"
+    q3.shutdown()
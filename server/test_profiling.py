@@ -0,0 +1,63 @@
+
+import threading
+from fastapi.testclient import TestClient
+from .local_queue import LocalQueue
+from .tasks import lane
+from . import profiling
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+@lane("thread")
+def summed(n):
+    return {"ok": True, "total": sum(range(n))}
+
+def test_sample_collapses_busy_thread_stacks():
+    stop = threading.Event()
+    t = threading.Thread(target=busy_loop, args=(stop,), name="spinner")
+    t.start()
+    try:
+        stacks, samples = profiling.sample(0.3, 0.005)
+    finally:
+        stop.set(); t.join()
+    assert samples > 10
+    hot = [st for st in stacks if st[0] == "spinner"]
+    assert hot and all("test_profiling.py:busy_loop" in st for st in hot)
+    line = profiling.collapsed(stacks).splitlines()[0]
+    assert ";" in line and line.rsplit(" ", 1)[1].isdigit()
+
+def test_one_profile_at_a_time():
+    with profiling._busy:
+        try:
+            profiling.sample(0.01)
+            assert False, "expected RuntimeError"
+        except RuntimeError:
+            pass
+
+def test_profiled_job_keeps_pstats_with_result():
+    q = LocalQueue(workers=1)
+    plain, prof = q.enqueue(summed, 10), q.enqueue(summed, 10, meta={"profile": True})
+    assert q.join(5)
+    assert plain.result == {"ok": True, "total": 45}
+    assert prof.result["total"] == 45 and "summed" in prof.result["profile"] and "cumulative" in prof.result["profile"]
+    q.shutdown()
+
+def test_admin_profile_endpoint():
+    from .app import app
+    with TestClient(app) as c:
+        r = c.get("/api/admin/profile", params={"seconds": 0.1, "format": "json"})
+        assert r.status_code == 200 and r.json()["samples"] > 0
+        assert c.get("/api/admin/profile", params={"seconds": 0.1}).headers["content-type"].startswith("text/plain")
+        assert c.get("/api/admin/profile", params={"format": "svg"}).status_code == 400
+
+def test_profile_option_needs_admin_token(monkeypatch):
+    from .app import app
+    calls = []
+    monkeypatch.setattr("server.app.enqueue_backtest", lambda **kw: calls.append(kw["profile"]) or {"ok": True, "job_id": "j"})
+    monkeypatch.setenv("API_TOKEN", "secret")
+    with TestClient(app) as c:
+        assert c.post("/api/backtest/jobs").status_code == 200
+        assert c.post("/api/backtest/jobs", params={"profile": 1}).status_code == 401
+        assert c.post("/api/backtest/jobs", params={"profile": 1}, headers={"Authorization": "Bearer secret"}).status_code == 200
+    assert calls == [False, True]
@@ -0,0 +1,30 @@
+
+from types import SimpleNamespace
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+import pywebpush
+from .models import Base, PushSubscription
+from . import push
+
+def test_fanout_counts_statuses_and_prunes_gone(monkeypatch):
+    def fake_webpush(subscription_info, data=None, **kw):
+        code = int(subscription_info["endpoint"].rsplit("/", 1)[1])
+        if code >= 400:
+            raise pywebpush.WebPushException("push failed", response=SimpleNamespace(status_code=code))
+        return SimpleNamespace(status_code=code)
+    monkeypatch.setattr(pywebpush, "webpush", fake_webpush)
+    eng = create_engine("sqlite://", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(eng)
+    with Session(eng) as db:
+        push.set_vapid_keys(db, "pub", "priv")
+        for i, code in enumerate([201, 201, 410, 404, 500]):
+            db.add(PushSubscription(email="a@x" if i < 3 else "b@x", endpoint=f"https://push.example/{code}", p256dh="k", auth="a"))
+        db.commit()
+        assert push.get_vapid_public(db) == "pub"
+        res = push.send_to_user(db, "a@x", "t", "b")
+        assert res == {"sent": 2, "gone": 1, "failed": 0, "by_status": {"201": 2, "410": 1}}
+        res = push.send_test_to_all(db)
+        assert res["sent"] == 2 and res["gone"] == 1 and res["failed"] == 1
+        assert db.query(PushSubscription).count() == 3
+        push.set_vapid_keys(db, "pub2", "priv2")
+        assert push.get_vapid_public(db) == "pub2"
@@ -0,0 +1,30 @@
+
+from . import redis_client
+from .redis_client import RedisHealth, get_redis, get_pool
+
+class _Pinger:
+    def __init__(self, ok=True):
+        self.ok, self.pings = ok, 0
+    def ping(self):
+        self.pings += 1
+        if not self.ok: raise ConnectionError("down")
+        return True
+
+def test_pool_is_shared():
+    assert get_redis().connection_pool is get_pool() is get_redis().connection_pool
+
+def test_health_is_cached_and_breaker_backs_off(monkeypatch):
+    p = _Pinger()
+    monkeypatch.setattr(redis_client, "get_redis", lambda: p)
+    h = RedisHealth(interval=3600, max_backoff=40, retry=10)
+    assert all(h.available() for _ in range(100))
+    assert p.pings == 1  # one synchronous check, then the cached flag
+    h.record_failure(ConnectionError("boom"))
+    assert not h.available() and h.error == "boom"
+    p.ok = False
+    h.check(); h.check()
+    assert h.failures == 3 and h.delay() == 40
+    h.failures = 1
+    assert h.delay() == 10
+    p.ok = True
+    assert h.check() == (True, None) and h.available() and h.delay() == 3600
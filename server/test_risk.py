@@ -6,3 +6,132 @@ def test_risk_endpoint():
     with TestClient(app) as c:
         r = c.get("/api/risk/officials")
         assert r.status_code in (200, 500)
+
+def test_set_based_scores_match_per_official():
+    from datetime import date, timedelta
+    import random
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from .models import Base, Official, Trade, Chamber, TxType
+    from .risk import score_official, top_officials
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng)
+    rnd = random.Random(5)
+    committees = ["Finance", "Energy and Commerce", "Health", "Science, Space, and Technology", "Rules", ""]
+    issuers = ["Exxon Oil", "Pfizer Pharma", "Nvidia Chip", "First Bank", "Walmart", None]
+    with Session(eng) as db:
+        offs = [Official(name=f"O{i}", chamber=Chamber.house, committees=rnd.choice(committees)) for i in range(30)]
+        db.add_all(offs); db.flush()
+        for _ in range(600):
+            db.add(Trade(official_id=rnd.choice(offs).id, issuer=rnd.choice(issuers), ticker="X",
+                         transaction_type=rnd.choice(list(TxType)), trade_date=date.today() - timedelta(days=rnd.randint(-5, 500))))
+        db.commit()
+        want = sorted((score_official(db, o.id) for o in offs), key=lambda x: (-x["score"], x["official_id"]))
+        got = top_officials(db, limit=100)
+        assert [(g["official_id"], g["score"], g["freq"], g["overlap"], g["alpha_proxy"], g["recency"], g["sector"]) for g in got] == \
+               [(w["official_id"], w["score"], w["freq"], w["overlap"], w["alpha_proxy"], w["recency"], w["sector"]) for w in want]
+        assert top_officials(db, limit=3)[0]["official_name"].startswith("O")
+
+def test_materialized_scores_refresh_incrementally():
+    from datetime import date, timedelta
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+    from .models import Base, Official, Trade, Chamber, TxType, OfficialRiskScore
+    from .risk import refresh_risk_scores, refresh_expired_risk_scores, list_risk_scores, top_officials
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng)
+    day = date(2025, 6, 1)
+    with Session(eng) as db:
+        offs = [Official(name=f"O{i}", chamber=Chamber.house, committees="Finance") for i in range(5)]
+        db.add_all(offs); db.flush()
+        for i in range(40):
+            db.add(Trade(official_id=offs[i % 5].id, issuer="First Bank", ticker="X", transaction_type=TxType.buy,
+                         trade_date=day - timedelta(days=3 * i)))
+        db.commit()
+        assert refresh_risk_scores(db, today=day) == 5
+        db.add(Trade(official_id=offs[0].id, issuer="First Bank", ticker="X", transaction_type=TxType.buy, trade_date=day))
+        db.commit()
+        assert refresh_risk_scores(db, [offs[0].id], today=day) == 1
+        def stored():
+            return [(s.official_id, s.score, s.freq, s.recency) for s in db.execute(select(OfficialRiskScore).order_by(OfficialRiskScore.official_id)).scalars()]
+        def fresh(d):
+            return sorted((t["official_id"], t["score"], t["freq"], t["recency"]) for t in top_officials(db, 100, today=d))
+        assert stored() == fresh(day)
+        later = day + timedelta(days=20)
+        assert refresh_expired_risk_scores(db, today=later) > 0
+        assert stored() == fresh(later)
+        page = list_risk_scores(db, limit=2, offset=1, sort="freq", order="asc")
+        assert page["total"] == 5 and len(page["items"]) == 2
+        assert [i["freq"] for i in page["items"]] == sorted(i["freq"] for i in page["items"])
+
+def test_issuer_sector_table_matches_classifier(monkeypatch):
+    from datetime import date, timedelta
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+    from .models import Base, Official, Trade, Chamber, TxType, IssuerSector
+    from .linking import infer_sector_from_issuer
+    from .sectors import sync_issuer_sectors
+    from .backtest import load_backtest_trades
+    from .risk import score_officials
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng)
+    issuers = ["Biotech Chip Inc", "First Bank", "Oil & Gas", "Walmart", None]
+    with Session(eng) as db:
+        off = Official(name="O", chamber=Chamber.house, committees="Science, Space, and Technology")
+        db.add(off); db.flush()
+        for i in range(25):
+            db.add(Trade(official_id=off.id, issuer=issuers[i % 5], ticker="X", transaction_type=TxType.buy,
+                         trade_date=date.today() - timedelta(days=i)))
+        db.commit()
+        plain = score_officials(db)
+        arrays = load_backtest_trades(db, sectors=["healthcare", "unknown"])
+        monkeypatch.setenv("ISSUER_SECTOR_TABLE", "1")
+        assert sync_issuer_sectors(db) == 5 and sync_issuer_sectors(db) == 0
+        stored = dict(db.execute(select(IssuerSector.issuer, IssuerSector.sector)).all())
+        assert stored["biotech chip inc"] == infer_sector_from_issuer("Biotech Chip Inc") == "healthcare"
+        assert stored[""] == "unknown"
+        assert score_officials(db).equals(plain)
+        assert list(load_backtest_trades(db, sectors=["healthcare", "unknown"])["sector"]) == list(arrays["sector"])
+
+def test_score_history_matches_window_recount():
+    from datetime import date, timedelta
+    import random
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from .models import Base, Official, Trade, Chamber, TxType
+    from .linking import infer_sector_from_committees, issuer_sectors
+    from .risk import score_history, _combine
+    eng = create_engine("sqlite://")
+    Base.metadata.create_all(eng)
+    rnd = random.Random(11)
+    end = date(2025, 6, 30)
+    with Session(eng) as db:
+        offs = [Official(name=f"O{i}", chamber=Chamber.house, committees=rnd.choice(["Energy", "Finance", "Rules"])) for i in range(6)]
+        db.add_all(offs); db.flush()
+        trades = []
+        for _ in range(300):
+            t = Trade(official_id=rnd.choice(offs).id, issuer=rnd.choice(["Oil Co", "First Bank", "Shop"]), ticker="X",
+                      transaction_type=rnd.choice([TxType.buy, TxType.sell]), trade_date=end - timedelta(days=rnd.randint(0, 900)))
+            db.add(t); trades.append(t)
+        db.commit()
+        for period in ("month", "week"):
+            df = score_history(db, period=period, end=end, periods=10)
+            assert len(df) == 10 * len(offs)
+            for r in df.sample(20, random_state=1).itertuples(index=False):
+                T = r.date.date()
+                off = db.get(Official, r.official_id)
+                sec = infer_sector_from_committees(off.committees)
+                win = [t for t in trades if t.official_id == r.official_id and T - timedelta(days=365) <= t.trade_date <= T]
+                freq = len(win)
+                overlap = sum(1 for t in win if sec in issuer_sectors(t.issuer))
+                alpha = sum(1.0 if t.transaction_type == TxType.buy else -0.5 for t in win)
+                rec = sum(1 for t in win if (T - t.trade_date).days <= 30)
+                assert (r.freq, r.overlap, r.alpha_proxy, r.recency) == (freq, overlap, alpha, rec)
+                assert r.score == _combine([freq], [overlap], [alpha], [rec])[0]
+
+def test_risk_history_rejects_bad_official_ids():
+    from fastapi.testclient import TestClient
+    from .app import app
+    with TestClient(app) as c:
+        assert c.get("/api/risk/officials/history", params={"official_ids": "abc"}).status_code == 400
+        assert c.get("/api/risk/officials/history", params={"period": "decade"}).status_code == 400
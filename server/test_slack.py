@@ -0,0 +1,43 @@
+
+import asyncio
+from . import slack_integration as slack
+
+def test_slash_caches_and_coalesces_latest(monkeypatch):
+    calls, sent = [], []
+    def fake_latest(n):
+        calls.append(n)
+        return f"latest {n}"
+    async def fake_respond(url, text): sent.append((url, text))
+    monkeypatch.setattr(slack, "latest_text", fake_latest)
+    monkeypatch.setattr(slack, "respond", fake_respond)
+    monkeypatch.setattr(slack, "_cache", {})
+    async def run():
+        await asyncio.gather(*[slack.handle_slash({"text": "latest 3", "response_url": f"u{i}"}) for i in range(5)])
+        await slack.handle_slash({"text": "latest 4", "response_url": "u9"})
+    asyncio.run(run())
+    assert calls == [3, 4]
+    assert sorted(sent) == sorted([(f"u{i}", "latest 3") for i in range(5)] + [("u9", "latest 4")])
+
+def test_slash_command_is_acked_before_work(monkeypatch):
+    from fastapi.testclient import TestClient
+    from .app import app
+    done = []
+    async def slow(payload): done.append(payload["text"])
+    monkeypatch.setattr("server.app.handle_slash", slow)
+    with TestClient(app) as c:
+        r = c.post("/integrations/slack/events", data={"command": "/otp", "text": "digest 3", "response_url": ""})
+    assert r.status_code == 200 and r.text == ""
+    assert done == ["digest 3"]
+
+def test_slash_clamps_rows_and_prunes_expired_cache(monkeypatch):
+    calls = []
+    monkeypatch.setattr(slack, "latest_text", lambda n: calls.append(n) or f"latest {n}")
+    async def fake_respond(url, text): pass
+    monkeypatch.setattr(slack, "respond", fake_respond)
+    monkeypatch.setattr(slack, "_cache", {("digest", 9): (0.0, "stale")})
+    async def run():
+        for t in ("latest 999999", "latest -3", "latest x"):
+            await slack.handle_slash({"text": t, "response_url": "u"})
+    asyncio.run(run())
+    assert calls == [slack.MAX_ROWS, 1, 5]
+    assert set(slack._cache) == {("latest", slack.MAX_ROWS), ("latest", 1), ("latest", 5)}
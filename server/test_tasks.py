@@ -0,0 +1,53 @@
+
+import threading
+from datetime import datetime, timezone
+import fakeredis
+from rq import Queue
+from rq.job import Job
+from . import tasks
+from .tasks import _enqueue, _reply, job_key
+from .local_queue import QUEUE as LQ
+
+GATE = threading.Event()
+
+def slow_reply(x, response_url=None):
+    GATE.wait(5)
+    _reply(response_url, f"done {x}")
+    return x
+
+def test_local_single_flight_coalesces_and_reuses(monkeypatch):
+    sent = []
+    monkeypatch.setattr(tasks, "get_queue", lambda name="batch": None)
+    monkeypatch.setattr(tasks, "_send_replies", lambda urls, text: sent.append((list(urls), text)))
+    GATE.clear()
+    key = job_key(slow_reply, 1)
+    a = _enqueue(slow_reply, 1, key=key, response_url="u1")
+    b = _enqueue(slow_reply, 1, key=key, response_url="u2")
+    assert (a["deduped"], b["deduped"], b["job_id"]) == (False, True, a["job_id"])
+    GATE.set()
+    assert LQ.join(5)
+    c = _enqueue(slow_reply, 1, key=key, response_url="u3")
+    assert c["job_id"] == a["job_id"] and c["deduped"]
+    assert sorted(sent) == [(["u1"], "done 1"), (["u2"], "done 1"), (["u3"], "done 1")]
+    d = _enqueue(slow_reply, 2, key=job_key(slow_reply, 2))
+    assert d["job_id"] != a["job_id"] and not d["deduped"]
+    assert LQ.join(5)
+
+def test_rq_single_flight(monkeypatch):
+    r = fakeredis.FakeRedis()
+    q = Queue("otp", connection=r)
+    sent = []
+    monkeypatch.setattr(tasks, "get_queue", lambda name="batch": q)
+    monkeypatch.setattr(tasks, "_send_replies", lambda urls, text: sent.append((list(urls), text)))
+    key = job_key(slow_reply, 1)
+    a = _enqueue(slow_reply, 1, key=key, response_url="u1")
+    b = _enqueue(slow_reply, 1, key=key, response_url="u2")
+    assert b["job_id"] == a["job_id"] and b["deduped"] and len(q) == 1
+    assert r.lrange(tasks.FOLLOWERS_PREFIX + a["job_id"], 0, -1) == [b"u2"]
+    job = Job.fetch(a["job_id"], connection=r)
+    job.meta["reply"] = "done 1"; job.save_meta()
+    tasks._rq_reply_followers(job, r, 1)
+    assert sent == [(["u2"], "done 1")]
+    job.set_status("finished"); job.ended_at = datetime.now(timezone.utc); job.save()
+    c = _enqueue(slow_reply, 1, key=key, response_url="u3")
+    assert c["job_id"] == a["job_id"] and sent[-1] == (["u3"], "done 1")
@@ -0,0 +1,32 @@
+
+import asyncio, json, time
+import httpx
+import fakeredis
+from .webhooks import OUTBOX_KEY, DLQ_KEY
+from .webhook_dispatcher import OutboxDispatcher, RETRY_KEY
+
+def test_outbox_delivers_retries_and_dead_letters():
+    calls = {}
+    def handler(req: httpx.Request):
+        calls[req.url.host] = calls.get(req.url.host, 0) + 1
+        if req.url.host == "down.example": return httpx.Response(503)
+        if req.url.host == "flaky.example" and calls[req.url.host] == 1: return httpx.Response(500)
+        return httpx.Response(200)
+
+    async def run():
+        r = fakeredis.FakeAsyncRedis()
+        for host in ("ok.example", "flaky.example", "down.example"):
+            await r.rpush(OUTBOX_KEY, json.dumps({"url": f"https://{host}/h", "payload": {"h": host}, "ts": time.time()}))
+        await r.rpush("otp:webhook:processing:t1", json.dumps({"url": "https://ok.example/crashed", "payload": {}}))
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            d = OutboxDispatcher(r, client=client, consumer="t1", max_attempts=2, per_host=1)
+            assert await d.recover() == 1
+            await d.drain()
+            assert await r.zcard(RETRY_KEY) == 2 and await r.llen(DLQ_KEY) == 0
+            assert await d.promote_due(now=time.time() + 10_000) == 2
+            await d.drain()
+            assert await r.llen(d.processing) == 0 and await r.llen(OUTBOX_KEY) == 0 and await r.zcard(RETRY_KEY) == 0
+            dead = [json.loads(x) for x in await r.lrange(DLQ_KEY, 0, -1)]
+            assert [x["url"] for x in dead] == ["https://down.example/h"] and dead[0]["error"] == "HTTP 503"
+    asyncio.run(run())
+    assert calls == {"ok.example": 2, "flaky.example": 2, "down.example": 2}
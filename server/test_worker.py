@@ -0,0 +1,66 @@
+
+from datetime import datetime, timedelta, timezone
+import fakeredis
+from rq import Queue
+from .worker import Supervisor, desired_workers, INTERACTIVE, GENERAL
+
+class FakeProc:
+    def __init__(self, queues):
+        self.queues, self.alive, self.terminated = queues, True, False
+    def is_alive(self): return self.alive
+    def terminate(self): self.terminated = True; self.alive = False
+    def join(self, timeout=None): pass
+    def kill(self): self.alive = False
+
+def noop(): return None
+
+def test_desired_workers():
+    assert desired_workers(0, 0, 3, 1, 8, 4, 30) == 1
+    assert desired_workers(9, 0, 1, 1, 8, 4, 30) == 3
+    assert desired_workers(2, 45, 3, 1, 8, 4, 30) == 4  # old jobs waiting: add one
+    assert desired_workers(100, 0, 1, 1, 8, 4, 30) == 8
+
+def test_supervisor_scales_with_depth_and_cools_down(monkeypatch):
+    for k, v in {"WORKER_MIN": "1", "WORKER_MAX": "4", "WORKER_JOBS_PER_WORKER": "2", "WORKER_SCALE_DOWN_AFTER": "60"}.items():
+        monkeypatch.setenv(k, v)
+    r = fakeredis.FakeRedis()
+    spawned = []
+    sup = Supervisor(r, spawn=lambda qs: spawned.append(FakeProc(qs)) or spawned[-1])
+    assert sup.tick(now=0) == 1
+    assert [p.queues for p in spawned] == [INTERACTIVE, GENERAL]
+    q = Queue("batch", connection=r)
+    jobs = [q.enqueue(noop) for _ in range(6)]
+    assert sup.tick(now=1) == 3
+    for j in jobs: q.remove(j)
+    assert sup.tick(now=30) == 3  # still cooling down
+    assert sup.tick(now=61) == 2 and sum(p.terminated for p in spawned) == 1
+    spawned[0].alive = False  # interactive worker died: replaced
+    sup.tick(now=62)
+    assert len(sup.pools["interactive"]) == 1 and len(spawned) == 5
+    sup.shutdown(grace=0)
+    assert not any(p.is_alive() for p in spawned)
+
+def test_supervisor_reports_oldest_job_age():
+    r = fakeredis.FakeRedis()
+    sup = Supervisor(r, spawn=FakeProc)
+    q = Queue("interactive", connection=r)
+    q.enqueue(noop)
+    depth, oldest = sup.stats(now=datetime.now(timezone.utc) + timedelta(seconds=90))
+    assert depth == 1 and 89 <= oldest <= 91
+
+def _wait_count(queue):
+    from .worker import WAIT
+    return next((s.value for fam in WAIT.collect() for s in fam.samples
+                 if s.name.endswith("_count") and s.labels.get("queue") == queue), 0.0)
+
+def test_wait_recorded_for_jobs_finishing_between_polls():
+    from rq import SimpleWorker
+    r = fakeredis.FakeRedis()
+    sup = Supervisor(r, spawn=FakeProc)
+    sup.stats()  # seeds the registries
+    before = _wait_count("interactive")
+    q = Queue("interactive", connection=r)
+    for _ in range(3): q.enqueue(noop)
+    SimpleWorker([q], connection=r).work(burst=True)  # start and finish before the next poll
+    sup.stats(); sup.stats()
+    assert _wait_count("interactive") == before + 3
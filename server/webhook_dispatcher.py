@@ -0,0 +1,156 @@
+
+"""Webhook outbox dispatcher.
+
+    python -m server.webhook_dispatcher
+
+Consumes `otp:webhook:outbox` with BLMOVE into a per-consumer processing list and acknowledges
+(LREM) only after the item was delivered, rescheduled or dead-lettered, so a crash never loses an
+item: on start the consumer moves whatever is left in its processing list back to the outbox.
+Failed deliveries go to the `otp:webhook:retry` sorted set scored by due time (exponential
+backoff) and are promoted back to the outbox when due; after WEBHOOK_MAX_ATTEMPTS they land in
+the DLQ that /api/admin/webhooks/dlq shows.
+"""
+from typing import Any, Dict, Optional
+from collections import defaultdict
+from urllib.parse import urlsplit
+import asyncio, json, os, socket, time
+import httpx
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, start_http_server
+from .webhooks import OUTBOX_KEY, DLQ_KEY
+
+RETRY_KEY = "otp:webhook:retry"
+PROCESSING_PREFIX = "otp:webhook:processing:"
+
+SENT = Counter("otp_webhook_outbox_deliveries_total", "Outbox deliveries by outcome", ["status"], registry=None)
+SEND_SECONDS = Histogram("otp_webhook_outbox_send_seconds", "Webhook POST latency (s)", registry=None)
+LAG = Histogram("otp_webhook_outbox_lag_seconds", "Time from enqueue to delivery attempt (s)",
+                buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600), registry=None)
+DEPTH = Gauge("otp_webhook_outbox_depth", "Items waiting", ["queue"], registry=None)
+
+def _env_int(key: str, default: int) -> int:
+    return int(os.environ.get(key, str(default)))
+
+class OutboxDispatcher:
+    def __init__(self, redis, client: Optional[httpx.AsyncClient] = None, consumer: Optional[str] = None,
+                 concurrency: Optional[int] = None, per_host: Optional[int] = None, max_attempts: Optional[int] = None,
+                 backoff: float = 2.0, max_backoff: float = 3600.0):
+        self.r = redis
+        self.client = client
+        self.consumer = consumer or os.environ.get("WEBHOOK_CONSUMER") or socket.gethostname()
+        self.processing = PROCESSING_PREFIX + self.consumer
+        self.concurrency = concurrency or _env_int("WEBHOOK_CONCURRENCY", 32)
+        self.per_host = per_host or _env_int("WEBHOOK_PER_HOST", 4)
+        self.max_attempts = max_attempts or _env_int("WEBHOOK_MAX_ATTEMPTS", 6)
+        self.backoff, self.max_backoff = backoff, max_backoff
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.hosts: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        self.inflight: set = set()
+
+    async def recover(self) -> int:
+        """Return items left in this consumer's processing list (previous crash) to the outbox."""
+        n = 0
+        while await self.r.lmove(self.processing, OUTBOX_KEY, "RIGHT", "LEFT"):
+            n += 1
+        return n
+
+    async def promote_due(self, now: Optional[float] = None) -> int:
+        due = await self.r.zrangebyscore(RETRY_KEY, "-inf", now or time.time(), start=0, num=500)
+        n = 0
+        for raw in due:
+            if await self.r.zrem(RETRY_KEY, raw):  # only the dispatcher that removed it re-queues it
+                await self.r.rpush(OUTBOX_KEY, raw); n += 1
+        return n
+
+    async def _post(self, url: str, payload: Any) -> Optional[str]:
+        t0 = time.perf_counter()
+        try:
+            r = await self.client.post(url, json=payload)
+            return None if r.status_code // 100 == 2 else f"HTTP {r.status_code}"
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+        finally:
+            SEND_SECONDS.observe(time.perf_counter() - t0)
+
+    async def handle(self, raw: bytes):
+        try:
+            item = json.loads(raw)
+            url = item["url"]
+        except Exception:
+            item, url = None, None
+        if url is None:
+            err = "malformed item"
+        else:
+            LAG.observe(max(0.0, time.time() - float(item.get("ts") or time.time())))
+            async with self.hosts[urlsplit(url).netloc]:
+                err = await self._post(url, item.get("payload"))
+        async with self.r.pipeline(transaction=True) as p:
+            if err is None:
+                SENT.labels(status="ok").inc()
+            elif item is None or int(item.get("attempts") or 0) + 1 >= self.max_attempts:
+                SENT.labels(status="dead").inc()
+                dead = dict(item or {"raw": raw.decode("utf-8", "replace")}, error=err, ts=time.time())
+                p.lpush(DLQ_KEY, json.dumps(dead))
+            else:
+                SENT.labels(status="retry").inc()
+                item["attempts"] = int(item.get("attempts") or 0) + 1
+                item["error"] = err
+                delay = min(self.max_backoff, self.backoff * (2 ** (item["attempts"] - 1)))
+                p.zadd(RETRY_KEY, {json.dumps(item): time.time() + delay})
+            p.lrem(self.processing, 1, raw)  # ack
+            await p.execute()
+
+    async def _run_one(self, raw: bytes):
+        try:
+            await self.handle(raw)
+        finally:
+            self.slots.release()
+
+    async def step(self, timeout: float = 1.0) -> bool:
+        """Promote due retries, then pop and start at most one item; False when the outbox was empty."""
+        await self.promote_due()
+        await self.slots.acquire()
+        raw = await self.r.blmove(OUTBOX_KEY, self.processing, timeout, "LEFT", "RIGHT")
+        if raw is None:
+            self.slots.release()
+            return False
+        t = asyncio.create_task(self._run_one(raw))
+        self.inflight.add(t); t.add_done_callback(self.inflight.discard)
+        return True
+
+    async def drain(self, timeout: float = 0.05):
+        """Process until the outbox is empty and nothing is in flight (retries stay scheduled)."""
+        while await self.step(timeout) or self.inflight:
+            if self.inflight: await asyncio.wait(set(self.inflight))
+
+    async def update_depth(self):
+        DEPTH.labels(queue="outbox").set(await self.r.llen(OUTBOX_KEY))
+        DEPTH.labels(queue="retry").set(await self.r.zcard(RETRY_KEY))
+        DEPTH.labels(queue="dlq").set(await self.r.llen(DLQ_KEY))
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        stop = stop or asyncio.Event()
+        own_client = self.client is None
+        if own_client:
+            self.client = httpx.AsyncClient(timeout=10.0, limits=httpx.Limits(max_connections=self.concurrency,
+                                                                             max_keepalive_connections=self.concurrency))
+        print(f"webhook dispatcher {self.consumer}: recovered {await self.recover()} in-flight items")
+        last_depth = 0.0
+        try:
+            while not stop.is_set():
+                await self.step()
+                if time.monotonic() - last_depth > 5:
+                    await self.update_depth(); last_depth = time.monotonic()
+        finally:
+            if self.inflight: await asyncio.wait(set(self.inflight))
+            if own_client: await self.client.aclose()
+
+def main():
+    from .redis_client import get_async_redis
+    registry = CollectorRegistry()
+    for c in (SENT, SEND_SECONDS, LAG, DEPTH):
+        registry.register(c)
+    start_http_server(_env_int("WEBHOOK_METRICS_PORT", 9108), registry=registry)
+    asyncio.run(OutboxDispatcher(get_async_redis()).run())
+
+if __name__ == "__main__":
+    main()
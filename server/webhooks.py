@@ -1,28 +1,31 @@
 
-import json, time, os, asyncio
-from typing import Dict, Any, Optional
-import httpx
+import json, time
+from typing import Dict, Any
 from .redis_client import get_redis
 
 DLQ_KEY = "otp:webhook:dlq"
 OUTBOX_KEY = "otp:webhook:outbox"
 
-async def send_webhook(url: str, payload: Dict[str, Any], retries: int = 3, backoff: float = 1.0) -> bool:
-    for i in range(retries):
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as http:
-                r = await http.post(url, json=payload)
-                if r.status_code // 100 == 2:
-                    return True
-        except Exception:
-            pass
-        await asyncio.sleep(backoff * (2 ** i))
-    # push to DLQ
+# Retries are owned by the outbox dispatcher (python -m server.webhook_dispatcher): a failed
+# send is queued once and the caller returns immediately.
+
+def enqueue_webhook(url: str, payload: Dict[str, Any], attempts: int = 0) -> bool:
     try:
-        r = get_redis()
-        r.lpush(DLQ_KEY, json.dumps({"url": url, "payload": payload, "ts": time.time()}))
+        get_redis().rpush(OUTBOX_KEY, json.dumps({"url": url, "payload": payload, "attempts": attempts, "ts": time.time()}))
+        return True
+    except Exception:
+        return False
+
+async def send_webhook(url: str, payload: Dict[str, Any]) -> bool:
+    """One attempt over the shared client; on failure the delivery is handed to the outbox."""
+    from .delivery import http_client
+    try:
+        r = await http_client().post(url, json=payload)
+        if r.status_code // 100 == 2:
+            return True
     except Exception:
         pass
+    enqueue_webhook(url, payload, attempts=1)
     return False
 
 def list_dlq(max_items: int = 50):
@@ -38,7 +41,8 @@ def requeue_dlq(max_items: int = 50):
         r = get_redis()
         items = r.lrange(DLQ_KEY, 0, max_items-1)
         for x in items:
-            r.rpush(OUTBOX_KEY, x)  # back to outbox
+            item = json.loads(x); item["attempts"] = 0; item["ts"] = time.time()
+            r.rpush(OUTBOX_KEY, json.dumps(item))  # back to outbox with a fresh retry budget
         r.ltrim(DLQ_KEY, max_items, -1)
         return len(items)
     except Exception:
@@ -1,9 +1,183 @@
 
-from rq import Worker
-from .tasks import get_queue
+"""RQ worker supervisor.
+
+    python -m server.worker
+
+Keeps WORKER_INTERACTIVE (1) workers on the `interactive` queue only, so Slack briefs never wait
+behind a backtest, plus WORKER_MIN..WORKER_MAX general workers that serve interactive, batch and
+ingest in that order. Every WORKER_POLL seconds the general pool is sized from the queued job
+count (one worker per WORKER_JOBS_PER_WORKER jobs) and grows by one while the oldest queued job
+has waited longer than WORKER_MAX_WAIT seconds; it shrinks by at most one worker per
+WORKER_SCALE_DOWN_AFTER seconds. SIGTERM/SIGINT stop every worker warmly (the current job
+finishes) and kill what is left after WORKER_SHUTDOWN_GRACE seconds.
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import math, os, signal, threading, time
+import multiprocessing as mp
+from datetime import datetime, timezone
+from prometheus_client import CollectorRegistry, Gauge, start_http_server
+from rq import Queue
+from rq.job import Job
+from rq.registry import StartedJobRegistry, FinishedJobRegistry, FailedJobRegistry
 from .redis_client import get_redis
+from .tasks import QUEUES, LEGACY_QUEUE
+from .jobs import func_from_description
+from .instrumentation import JOB_WAIT as WAIT, JOB_RUN as RUN
+DEPTH = Gauge("otp_job_queue_depth", "Queued jobs", ["queue"], registry=None)
+OLDEST = Gauge("otp_job_queue_oldest_seconds", "Age of the oldest queued job (s)", ["queue"], registry=None)
+WORKERS = Gauge("otp_rq_workers", "Running worker processes", ["pool"], registry=None)
 
-if __name__ == "__main__":
+INTERACTIVE = ("interactive",)
+GENERAL = QUEUES + (LEGACY_QUEUE,)
+
+def _env(key: str, default: float) -> float:
+    return float(os.environ.get(key, str(default)))
+
+def _utc(ts: Optional[datetime]) -> Optional[datetime]:
+    if ts is None: return None
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+def desired_workers(depth: int, oldest: float, current: int, lo: int, hi: int, per_worker: int, max_wait: float) -> int:
+    want = math.ceil(depth / per_worker) if depth else 0
+    if oldest > max_wait: want = max(want, current + 1)
+    return max(lo, min(hi, want))
+
+def _work(queues: Sequence[str]):
+    from rq import Worker
     r = get_redis()
-    q = get_queue()
-    Worker([q.name], connection=r).work(with_scheduler=True)
+    Worker([Queue(n, connection=r) for n in queues], connection=r).work(with_scheduler=True)
+
+def _spawn(queues: Sequence[str]):
+    p = mp.get_context("spawn").Process(target=_work, args=(tuple(queues),), daemon=False)
+    p.start()
+    return p
+
+class Supervisor:
+    def __init__(self, redis, spawn: Callable = _spawn):
+        self.r = redis
+        self.spawn = spawn
+        self.queues = {n: Queue(n, connection=redis) for n in GENERAL}
+        self.interactive_n = int(_env("WORKER_INTERACTIVE", 1))
+        self.lo = int(_env("WORKER_MIN", 1))
+        self.hi = max(self.lo, int(_env("WORKER_MAX", os.cpu_count() or 2)))
+        self.per_worker = max(1, int(_env("WORKER_JOBS_PER_WORKER", 4)))
+        self.max_wait = _env("WORKER_MAX_WAIT", 30)
+        self.cooldown = _env("WORKER_SCALE_DOWN_AFTER", 60)
+        self.pools: Dict[str, List] = {"interactive": [], "general": []}
+        self.stopping: List = []
+        self.last_change = 0.0
+        self.started: Dict[str, set] = {n: set() for n in GENERAL}
+        self.ended: Dict[Tuple[str, str], set] = {}
+        self.waited: set = set()  # started jobs whose wait is already observed
+
+    def stats(self, now: Optional[datetime] = None) -> Tuple[int, float]:
+        """Total queued jobs and the age of the oldest one; also feeds the queue metrics."""
+        now = now or datetime.now(timezone.utc)
+        total, oldest = 0, 0.0
+        for name, q in self.queues.items():
+            n = q.count
+            age = 0.0
+            head_id = q.get_job_ids(0, 1) if n else []
+            if head_id:
+                head = q.fetch_job(head_id[0])
+                enq = _utc(head.enqueued_at) if head is not None else None
+                if enq is not None: age = max(0.0, (now - enq).total_seconds())
+            DEPTH.labels(queue=name).set(n); OLDEST.labels(queue=name).set(age)
+            total += n; oldest = max(oldest, age)
+            self._observe_waits(name, q)
+            self._observe_runs(name, q)
+        return total, oldest
+
+    def _observe_waits(self, name: str, q: Queue):
+        ids = set(StartedJobRegistry(queue=q).get_job_ids())
+        new = ids - self.started[name]
+        self.started[name] = ids
+        for job in Job.fetch_many(list(new), connection=self.r) if new else []:
+            if job is None: continue
+            self._observe_wait(name, job)
+        if len(self.waited) > 10000: self.waited.clear()  # started jobs that never showed up as ended
+
+    def _observe_wait(self, name: str, job: Job):
+        if job.id in self.waited: return
+        self.waited.add(job.id)
+        start, enq = _utc(job.started_at), _utc(job.enqueued_at)
+        if start and enq: WAIT.labels(queue=name).observe(max(0.0, (start - enq).total_seconds()))
+
+    def _observe_runs(self, name: str, q: Queue, recent: int = 200):
+        # newest entries of the finished/failed registries; the first pass only seeds what was seen.
+        # Jobs that started and ended between two polls were never in a started snapshot, so their
+        # wait is observed here.
+        for status, reg in (("finished", FinishedJobRegistry(queue=q)), ("failed", FailedJobRegistry(queue=q))):
+            ids = set(reg.get_job_ids(0, recent - 1, desc=True, cleanup=False))
+            seen = self.ended.get((name, status))
+            self.ended[(name, status)] = ids
+            new = ids - seen if seen is not None else set()
+            for job in Job.fetch_many(list(new), connection=self.r) if new else []:
+                if job is None: continue
+                self._observe_wait(name, job)
+                self.waited.discard(job.id)
+                start, end = _utc(job.started_at), _utc(job.ended_at)
+                if start and end: RUN.labels(func=func_from_description(job.description), status=status).observe(max(0.0, (end - start).total_seconds()))
+
+    def _reap(self):
+        for pool in self.pools.values():
+            pool[:] = [p for p in pool if p.is_alive()]
+        self.stopping = [p for p in self.stopping if p.is_alive()]
+
+    def tick(self, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        self._reap()
+        inter = self.pools["interactive"]
+        while len(inter) < self.interactive_n:
+            inter.append(self.spawn(INTERACTIVE))
+        gen = self.pools["general"]
+        depth, oldest = self.stats()
+        want = desired_workers(depth, oldest, len(gen), self.lo, self.hi, self.per_worker, self.max_wait)
+        if want > len(gen):
+            while len(gen) < want: gen.append(self.spawn(GENERAL))
+            self.last_change = now
+        elif want < len(gen) and now - self.last_change >= self.cooldown:
+            p = gen.pop()
+            p.terminate()  # SIGTERM = warm shutdown: RQ finishes the current job first
+            self.stopping.append(p)
+            self.last_change = now
+        WORKERS.labels(pool="interactive").set(len(inter)); WORKERS.labels(pool="general").set(len(gen))
+        return len(gen)
+
+    def shutdown(self, grace: Optional[float] = None):
+        grace = _env("WORKER_SHUTDOWN_GRACE", 60) if grace is None else grace
+        procs = self.pools["interactive"] + self.pools["general"] + self.stopping
+        for p in procs:
+            if p.is_alive(): p.terminate()
+        end = time.monotonic() + grace
+        for p in procs:
+            p.join(max(0.0, end - time.monotonic()))
+            if p.is_alive(): p.kill()
+        self.pools = {"interactive": [], "general": []}
+        self.stopping = []
+
+    def run(self, stop: Optional[threading.Event] = None):
+        stop = stop or threading.Event()
+        poll = _env("WORKER_POLL", 2)
+        try:
+            while not stop.is_set():
+                try:
+                    self.tick()
+                except Exception as e:
+                    print("worker supervisor error", e)
+                stop.wait(poll)
+        finally:
+            self.shutdown()
+
+def main():
+    registry = CollectorRegistry()
+    for c in (WAIT, RUN, DEPTH, OLDEST, WORKERS):
+        registry.register(c)
+    start_http_server(int(_env("WORKER_METRICS_PORT", 9109)), registry=registry)
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    Supervisor(get_redis()).run(stop)
+
+if __name__ == "__main__":
+    main()
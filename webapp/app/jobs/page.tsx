@@ -2,25 +2,35 @@
 "use client";
 import { useEffect, useState } from "react";
 const API = process.env.NEXT_PUBLIC_API_BASE || "http://localhost:8001";
+const DONE = ["finished", "failed", "stopped", "canceled", "unknown"];  // the server ends the stream on these
 export default function JobsPage() {
   const [items, setItems] = useState<any[]>([]);
   const [selected, setSelected] = useState<any | null>(null);
   const [jobId, setJobId] = useState("");
-  async function load() {
-    const r = await fetch(`${API}/api/jobs?limit=50`, { credentials: "include" });
+  const [status, setStatus] = useState("");
+  const [next, setNext] = useState<number | null>(null);
+  async function load(offset = 0) {
+    const r = await fetch(`${API}/api/jobs?limit=50&offset=${offset}${status ? `&status=${status}` : ""}`, { credentials: "include" });
     const d = await r.json();
-    if (d.ok) setItems(d.items || []);
+    if (d.ok) { setItems(offset ? [...items, ...(d.items || [])] : (d.items || [])); setNext(d.next_offset ?? null); }
   }
   async function open(job_id: string) {
     const r = await fetch(`${API}/api/jobs/${job_id}`, { credentials: "include" });
     const d = await r.json();
     if (d.ok) setSelected(d.item);
   }
-  useEffect(()=>{ load(); }, []);
+  useEffect(()=>{ load(); }, [status]);
   useEffect(()=>{
-    if (!selected?.id) return;
-    const t = setInterval(()=> open(selected.id), 1500);
-    return ()=> clearInterval(t);
+    if (!selected?.id || DONE.includes(selected.status)) return;
+    const id = selected.id;
+    const es = new EventSource(`${API}/api/jobs/events?ids=${id}`, { withCredentials: true });
+    es.addEventListener("end", () => es.close());  // otherwise EventSource reconnects
+    es.addEventListener("job", (e: MessageEvent) => {
+      const ev = JSON.parse(e.data);
+      if (DONE.includes(ev.status)) { es.close(); open(id); return; }  // reload once for the result
+      setSelected((s: any) => s && s.id === id ? { ...s, status: ev.status, meta: { ...(s.meta || {}), progress: ev.progress, note: ev.note } } : s);
+    });
+    return ()=> es.close();
   }, [selected?.id]);
   return (
     <main>
@@ -28,15 +38,19 @@ export default function JobsPage() {
       <div style={{ display:"grid", gridTemplateColumns:"1fr 1fr", gap:16 }}>
         <div style={{ background:"#0f1620", border:"1px solid #152131", borderRadius:16, padding:14 }}>
           <div style={{ display:"flex", gap:8, alignItems:"center"}}>
-            <button onClick={load} style={{ padding:"8px 12px", borderRadius:12, background:"#60a5fa", color:"#0b0f14", border:"none" }}>Refresh</button>
+            <select value={status} onChange={e=>setStatus(e.target.value)} style={{ padding:8, borderRadius:8, border:"1px solid #152131", background:"#0d141c", color:"#e6eef7" }}>
+              {["", "started", "queued", "deferred", "scheduled", "failed", "finished"].map(s => <option key={s} value={s}>{s || "all"}</option>)}
+            </select>
+            <button onClick={()=>load()} style={{ padding:"8px 12px", borderRadius:12, background:"#60a5fa", color:"#0b0f14", border:"none" }}>Refresh</button>
             <input value={jobId} onChange={e=>setJobId(e.target.value)} placeholder="Job ID..." style={{ padding:8, borderRadius:8, border:"1px solid #152131", background:"#0d141c", color:"#e6eef7", flex:1 }}/>
             <button onClick={()=>jobId && open(jobId)} style={{ padding:"8px 12px", borderRadius:12, background:"#34d399", color:"#0b0f14", border:"none" }}>Open</button>
           </div>
           <ul style={{ marginTop:12 }}>
             {items.map((x,i)=> (
-              <li key={i}><a onClick={()=>open(x.id)} style={{ cursor:"pointer", color:"#9fb0c0" }}>{x.id.slice(0,8)}…</a> — {x.status}</li>
+              <li key={i}><a onClick={()=>open(x.id)} style={{ cursor:"pointer", color:"#9fb0c0" }}>{x.id.slice(0,8)}…</a> — {x.func_name} · {x.status}{x.progress != null ? ` ${x.progress}%` : ""} <span style={{ color:"#5b6b7b" }}>{(x.enqueued_at || "").slice(0,19)}</span></li>
             ))}
           </ul>
+          {next != null && <button onClick={()=>load(next)} style={{ padding:"6px 10px", borderRadius:10, background:"#152131", color:"#e6eef7", border:"none" }}>More</button>}
         </div>
         <div style={{ background:"#0f1620", border:"1px solid #152131", borderRadius:16, padding:14 }}>
           <h3 style={{ marginTop:0 }}>Detail</h3>